@@ -0,0 +1,342 @@
+# Agregados para los tableros de ventas, pedidos y conversaciones
+#
+# Documentos de resumen que las rutas de escritura mantienen con $inc a medida que ocurren los eventos,
+# así que leer un rango cuesta lo mismo sin importar cuántos pedidos o mensajes haya en la historia:
+#
+#   analytics_sales_daily           {_id: "2026-10-18|UPS", dia, categoria, ventas, unidades, pedidos}
+#   analytics_orders_status         {_id: "pendiente", pedidos, total}
+#   analytics_conversations_daily   {_id: "2026-10-18|consulta_pedido|neutral", dia, intent, sentimiento, mensajes}
+#
+# - crear_pedido y crear_pedidos_lote suman el pedido a sus ventas por día y categoría y al estado pendiente
+# - actualizar_pedido y actualizar_pedidos_lote mueven el pedido de estado; al cancelarlo restan sus ventas
+# - guardar_conversacion (o el escritor diferido, cuando está activo) suma el mensaje por intent y sentimiento
+#
+# Una falla al actualizar un agregado no falla la solicitud: se registra en el log y el comando
+# "reconstruir" recalcula los agregados desde los datos con un pipeline de agregación. También hay
+# que correrlo una vez al activar los agregados, para incluir los pedidos y mensajes anteriores.
+#
+# Uso:
+#   python analitica.py reconstruir [ventas|pedidos|conversaciones|todo] [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD]
+#
+# Sin fechas se reconstruye toda la historia. Las conversaciones ya archivadas (ver conversaciones.py)
+# no están en MongoDB: para no perder sus conteos, el rango no debe incluir días archivados.
+import argparse
+import datetime
+import json
+import logging
+import os
+
+from pymongo import MongoClient, UpdateOne
+
+from conversaciones import BUCKETS, leer_fecha, usa_buckets
+
+ANALITICA_ACTIVA = os.getenv("ANALITICA_ACTIVA", "1") == "1"
+ANALITICA_DIAS = int(os.getenv("ANALITICA_DIAS", 30))
+ANALITICA_MAX_DIAS = int(os.getenv("ANALITICA_MAX_DIAS", 366))
+
+VENTAS = "analytics_sales_daily"
+PEDIDOS = "analytics_orders_status"
+CONVERSACIONES = "analytics_conversations_daily"
+# Productos borrados o pedidos anteriores a que los items guardaran la categoría
+SIN_CATEGORIA = "sin categoría"
+
+logger = logging.getLogger("dummuy_api")
+
+def dia(fecha):
+    return fecha.strftime("%Y-%m-%d")
+
+def llave(*partes):
+    return "|".join(partes)
+
+# Ventas por día de creación y categoría. signo=-1 resta las ventas de pedidos cancelados.
+def operaciones_ventas(pedidos, signo=1):
+    acumulados = {}
+    for pedido in pedidos:
+        categorias = set()
+        for item in pedido.get("items", []):
+            categoria = item.get("categoria") or SIN_CATEGORIA
+            acumulado = acumulados.setdefault((dia(pedido["fecha_pedido"]), categoria), {"ventas": 0, "unidades": 0, "pedidos": 0})
+            acumulado["ventas"] += signo * item.get("subtotal", 0)
+            acumulado["unidades"] += signo * item.get("cantidad", 0)
+            categorias.add(categoria)
+        for categoria in categorias:
+            acumulados[(dia(pedido["fecha_pedido"]), categoria)]["pedidos"] += signo
+    return [
+        UpdateOne(
+            {"_id": llave(fecha, categoria)},
+            {"$inc": valores, "$setOnInsert": {"dia": fecha, "categoria": categoria}},
+            upsert=True
+        )
+        for (fecha, categoria), valores in acumulados.items()
+    ]
+
+# cambios: (estado anterior o None si el pedido es nuevo, estado nuevo, total del pedido)
+def operaciones_estados(cambios):
+    acumulados = {}
+    for anterior, nuevo, total in cambios:
+        for estado, signo in ((anterior, -1), (nuevo, 1)):
+            if estado is not None:
+                acumulado = acumulados.setdefault(estado, {"pedidos": 0, "total": 0})
+                acumulado["pedidos"] += signo
+                acumulado["total"] += signo * (total or 0)
+    return [UpdateOne({"_id": estado}, {"$inc": valores}, upsert=True) for estado, valores in acumulados.items()]
+
+def operaciones_conversaciones(conversaciones):
+    acumulados = {}
+    for conversacion in conversaciones:
+        clave = (dia(conversacion["timestamp"]), conversacion.get("intent") or "", conversacion.get("sentimiento") or "neutral")
+        acumulados[clave] = acumulados.get(clave, 0) + 1
+    return [
+        UpdateOne(
+            {"_id": llave(*clave)},
+            {"$inc": {"mensajes": mensajes}, "$setOnInsert": {"dia": clave[0], "intent": clave[1], "sentimiento": clave[2]}},
+            upsert=True
+        )
+        for clave, mensajes in acumulados.items()
+    ]
+
+def operaciones_pedidos(pedidos):
+    return {
+        VENTAS: operaciones_ventas(pedidos),
+        PEDIDOS: operaciones_estados((None, pedido["estado"], pedido.get("total")) for pedido in pedidos),
+    }
+
+# transiciones: (pedido antes del cambio, estado nuevo)
+def operaciones_transiciones(transiciones):
+    return {
+        VENTAS: operaciones_ventas([pedido for pedido, estado in transiciones if estado == "cancelado"], signo=-1),
+        PEDIDOS: operaciones_estados((pedido["estado"], estado, pedido.get("total")) for pedido, estado in transiciones),
+    }
+
+# Códigos de los items cancelados que no guardaron su categoría (pedidos anteriores a los agregados)
+def codigos_sin_categoria(transiciones):
+    return list({
+        item["codigo_producto"]
+        for pedido, estado in transiciones if estado == "cancelado"
+        for item in pedido.get("items", []) if not item.get("categoria")
+    })
+
+def asignar_categorias(transiciones, categorias):
+    for pedido, _ in transiciones:
+        for item in pedido.get("items", []):
+            if not item.get("categoria") and item.get("codigo_producto") in categorias:
+                item["categoria"] = categorias[item["codigo_producto"]]
+
+def aplicar(db, operaciones):
+    for coleccion, lista in operaciones.items():
+        if not lista:
+            continue
+        try:
+            db[coleccion].bulk_write(lista, ordered=False)
+        except Exception as e:
+            logger.error("Error al actualizar %s: %s", coleccion, e)
+
+async def aplicar_async(db, operaciones):
+    for coleccion, lista in operaciones.items():
+        if not lista:
+            continue
+        try:
+            await db[coleccion].bulk_write(lista, ordered=False)
+        except Exception as e:
+            logger.error("Error al actualizar %s: %s", coleccion, e)
+
+def registrar_pedidos(db, pedidos):
+    if ANALITICA_ACTIVA and pedidos:
+        aplicar(db, operaciones_pedidos(pedidos))
+
+async def registrar_pedidos_async(db, pedidos):
+    if ANALITICA_ACTIVA and pedidos:
+        await aplicar_async(db, operaciones_pedidos(pedidos))
+
+def registrar_transiciones(db, transiciones):
+    if not ANALITICA_ACTIVA or not transiciones:
+        return
+    codigos = codigos_sin_categoria(transiciones)
+    if codigos:
+        try:
+            productos = db.products.find({"codigo": {"$in": codigos}}, {"_id": 0, "codigo": 1, "categoria": 1})
+            asignar_categorias(transiciones, {producto["codigo"]: producto.get("categoria") for producto in productos})
+        except Exception as e:
+            logger.error("Error al leer las categorías de los pedidos cancelados: %s", e)
+    aplicar(db, operaciones_transiciones(transiciones))
+
+async def registrar_transiciones_async(db, transiciones):
+    if not ANALITICA_ACTIVA or not transiciones:
+        return
+    codigos = codigos_sin_categoria(transiciones)
+    if codigos:
+        try:
+            productos = db.products.find({"codigo": {"$in": codigos}}, {"_id": 0, "codigo": 1, "categoria": 1})
+            asignar_categorias(transiciones, {producto["codigo"]: producto.get("categoria") async for producto in productos})
+        except Exception as e:
+            logger.error("Error al leer las categorías de los pedidos cancelados: %s", e)
+    await aplicar_async(db, operaciones_transiciones(transiciones))
+
+def registrar_conversaciones(db, conversaciones):
+    if ANALITICA_ACTIVA and conversaciones:
+        aplicar(db, {CONVERSACIONES: operaciones_conversaciones(conversaciones)})
+
+async def registrar_conversaciones_async(db, conversaciones):
+    if ANALITICA_ACTIVA and conversaciones:
+        await aplicar_async(db, {CONVERSACIONES: operaciones_conversaciones(conversaciones)})
+
+# Lectura: rango de días de la consulta; por defecto los últimos ANALITICA_DIAS
+def rango_dias(desde, hasta, maximo=ANALITICA_MAX_DIAS):
+    hasta = leer_fecha(hasta) if hasta else datetime.date.today()
+    desde = leer_fecha(desde) if desde else hasta - datetime.timedelta(days=ANALITICA_DIAS - 1)
+    if desde > hasta:
+        raise ValueError("La fecha inicial es posterior a la final")
+    if (hasta - desde).days >= maximo:
+        raise ValueError(f"Se pueden consultar máximo {maximo} días")
+    return desde, hasta
+
+def filtro_dias(desde, hasta):
+    filtro = {}
+    if desde:
+        filtro["$gte"] = dia(desde)
+    if hasta:
+        filtro["$lte"] = dia(hasta)
+    return {"dia": filtro} if filtro else {}
+
+def resumen_ventas(documentos):
+    por_dia = {}
+    por_categoria = {}
+    total = {"ventas": 0, "unidades": 0}
+    for documento in documentos:
+        fila = {"ventas": documento.get("ventas", 0), "unidades": documento.get("unidades", 0), "pedidos": documento.get("pedidos", 0)}
+        por_dia.setdefault(documento["dia"], {})[documento["categoria"]] = fila
+        categoria = por_categoria.setdefault(documento["categoria"], {"ventas": 0, "unidades": 0, "pedidos": 0})
+        for campo in categoria:
+            categoria[campo] += fila[campo]
+        total["ventas"] += fila["ventas"]
+        total["unidades"] += fila["unidades"]
+    return {
+        "por_dia": [{"dia": fecha, "categorias": categorias} for fecha, categorias in por_dia.items()],
+        "por_categoria": por_categoria,
+        "total": total,
+    }
+
+def resumen_pedidos(documentos):
+    por_estado = {documento["_id"]: {"pedidos": documento.get("pedidos", 0), "total": documento.get("total", 0)} for documento in documentos}
+    return {"por_estado": por_estado, "pedidos": sum(estado["pedidos"] for estado in por_estado.values())}
+
+def resumen_conversaciones(documentos):
+    por_dia = {}
+    por_intent = {}
+    por_sentimiento = {}
+    for documento in documentos:
+        mensajes = documento.get("mensajes", 0)
+        por_dia[documento["dia"]] = por_dia.get(documento["dia"], 0) + mensajes
+        por_intent[documento["intent"]] = por_intent.get(documento["intent"], 0) + mensajes
+        por_sentimiento[documento["sentimiento"]] = por_sentimiento.get(documento["sentimiento"], 0) + mensajes
+    return {
+        "por_dia": [{"dia": fecha, "mensajes": mensajes} for fecha, mensajes in por_dia.items()],
+        "por_intent": por_intent,
+        "por_sentimiento": por_sentimiento,
+        "mensajes": sum(por_dia.values()),
+    }
+
+# Reconstrucción: los mismos agregados calculados desde los pedidos y las conversaciones.
+# $merge reemplaza los documentos del rango; antes se borran para que no quede un día sin datos.
+def rango_fechas(campo, desde, hasta):
+    filtro = {}
+    if desde:
+        filtro["$gte"] = datetime.datetime.combine(desde, datetime.time())
+    if hasta:
+        filtro["$lt"] = datetime.datetime.combine(hasta + datetime.timedelta(days=1), datetime.time())
+    return {campo: filtro} if filtro else {}
+
+def dia_expresion(campo):
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": campo}}
+
+def pipeline_ventas(desde=None, hasta=None):
+    return [
+        {"$match": {"estado": {"$ne": "cancelado"}, **rango_fechas("fecha_pedido", desde, hasta)}},
+        {"$unwind": "$items"},
+        # Los pedidos anteriores a los agregados no guardan la categoría en el item
+        {"$lookup": {"from": "products", "localField": "items.codigo_producto", "foreignField": "codigo", "as": "producto"}},
+        {"$group": {
+            "_id": {
+                "pedido": "$_id",
+                "dia": dia_expresion("$fecha_pedido"),
+                "categoria": {"$ifNull": [
+                    "$items.categoria", {"$ifNull": [{"$arrayElemAt": ["$producto.categoria", 0]}, SIN_CATEGORIA]}
+                ]},
+            },
+            "ventas": {"$sum": "$items.subtotal"},
+            "unidades": {"$sum": "$items.cantidad"},
+        }},
+        {"$group": {
+            "_id": {"dia": "$_id.dia", "categoria": "$_id.categoria"},
+            "ventas": {"$sum": "$ventas"},
+            "unidades": {"$sum": "$unidades"},
+            "pedidos": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.dia", "|", "$_id.categoria"]},
+            "dia": "$_id.dia", "categoria": "$_id.categoria", "ventas": 1, "unidades": 1, "pedidos": 1,
+        }},
+        {"$merge": {"into": VENTAS, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+def pipeline_pedidos():
+    return [
+        {"$group": {"_id": "$estado", "pedidos": {"$sum": 1}, "total": {"$sum": "$total"}}},
+        {"$merge": {"into": PEDIDOS, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+def pipeline_conversaciones(desde=None, hasta=None, buckets=False):
+    etapas = [{"$unwind": "$turnos"}, {"$replaceRoot": {"newRoot": "$turnos"}}] if buckets else []
+    return etapas + [
+        {"$match": rango_fechas("timestamp", desde, hasta)},
+        {"$group": {
+            "_id": {
+                "dia": dia_expresion("$timestamp"),
+                "intent": {"$ifNull": ["$intent", ""]},
+                "sentimiento": {"$ifNull": ["$sentimiento", "neutral"]},
+            },
+            "mensajes": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.dia", "|", "$_id.intent", "|", "$_id.sentimiento"]},
+            "dia": "$_id.dia", "intent": "$_id.intent", "sentimiento": "$_id.sentimiento", "mensajes": 1,
+        }},
+        {"$merge": {"into": CONVERSACIONES, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+def reconstruir(db, agregado, desde=None, hasta=None):
+    resultado = {}
+    if agregado in ("ventas", "todo"):
+        db[VENTAS].delete_many(filtro_dias(desde, hasta))
+        list(db.orders.aggregate(pipeline_ventas(desde, hasta), allowDiskUse=True))
+        resultado["ventas"] = db[VENTAS].count_documents(filtro_dias(desde, hasta))
+    if agregado in ("pedidos", "todo"):
+        # El estado actual de los pedidos no depende de fechas: siempre se recalcula completo
+        db[PEDIDOS].delete_many({})
+        list(db.orders.aggregate(pipeline_pedidos(), allowDiskUse=True))
+        resultado["pedidos"] = db[PEDIDOS].count_documents({})
+    if agregado in ("conversaciones", "todo"):
+        buckets = usa_buckets()
+        origen = db[BUCKETS] if buckets else db.conversations
+        db[CONVERSACIONES].delete_many(filtro_dias(desde, hasta))
+        list(origen.aggregate(pipeline_conversaciones(desde, hasta, buckets), allowDiskUse=True))
+        resultado["conversaciones"] = db[CONVERSACIONES].count_documents(filtro_dias(desde, hasta))
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Agregados de ventas, pedidos y conversaciones de jv_chatbot_mvp")
+    parser.add_argument("accion", choices=["reconstruir"])
+    parser.add_argument("agregado", nargs="?", default="todo", choices=["ventas", "pedidos", "conversaciones", "todo"])
+    parser.add_argument("--desde", type=leer_fecha)
+    parser.add_argument("--hasta", type=leer_fecha)
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URI", 'mongodb://localhost:27017/'))
+    try:
+        resultado = reconstruir(client['jv_chatbot_mvp'], args.agregado, args.desde, args.hasta)
+        print(f"Documentos de resumen: {json.dumps(resultado, ensure_ascii=False)}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
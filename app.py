@@ -1,45 +1,294 @@
+import arranque
+
+# Fases del arranque del worker, medidas desde aquí (ver arranque.py)
+estado_arranque = arranque.Arranque()
+
 import logging
-import json
-import datetime
-import os
 
-# Configure logging
-logging_dir = "logs"
-if not os.path.exists(logging_dir):
-    os.makedirs(logging_dir)
-
-# Setup basic logging configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler(f"{logging_dir}/whatsapp_bot_{datetime.datetime.now().strftime('%Y%m%d')}.log"),
-        logging.StreamHandler()
-    ]
-)
+import registros
+
+# Logging JSON a stdout a través de una cola: las solicitudes no esperan la escritura (ver registros.py)
+canal_registros = registros.configurar()
 
 logger = logging.getLogger("dummuy_api")
 
 from flask import Flask, jsonify, request
-from pymongo import MongoClient
-from bson.json_util import dumps
-from bson.objectid import ObjectId
-import datetime
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+from contadores import AsignadorNumeros
+from conversaciones import escribir_buckets, leer_archivo, leer_buckets, rango_archivo, usa_buckets
+from indices import verificar_indices
+from proyecciones import CamposInvalidos, con_llaves, leer_proyeccion, proyectar
+from nucleo import (
+    BUSQUEDA_MAX_LIMIT,
+    CATALOGO_CHANGE_STREAM,
+    CONVERSACIONES_COLA_MAX,
+    CONVERSACIONES_ESPERA_COLA,
+    CONVERSACIONES_INTERVALO,
+    CONVERSACIONES_LOTE,
+    CONVERSACIONES_WRITE_BEHIND,
+    ESTADOS_PEDIDO,
+    FAQS_CHANGE_STREAM,
+    MAX_ACTUALIZACIONES_LOTE,
+    MAX_PEDIDOS_LOTE,
+    MONGODB_URI,
+    ORDEN_CONVERSACIONES,
+    ORDEN_POR_ID,
+    PEDIDOS_BLOQUE_NUMEROS,
+    PROYECCION_PRODUCTO,
+    PROYECCION_TRANSICION,
+    SESION_CONVERSACIONES,
+    SESION_PEDIDOS,
+    VERIFICAR_INDICES,
+    BSONJSONProvider,
+    ColaLlena,
+    CursorInvalido,
+    EscritorConversacionesBase,
+    __name__,
+    actualizacion_estado,
+    aplicar_cambio_producto,
+    armar_contexto_sesion,
+    avisar_diferencias_indices,
+    cache_catalogo,
+    cargar_catalogo,
+    cargar_snapshot,
+    codigos_reserva,
+    combinar_pendientes,
+    construir_conversacion,
+    construir_pedido,
+    construir_pedidos_lote,
+    cortar_pagina,
+    decodificar_cursor,
+    descartar_sin_stock,
+    devoluciones_pedidos,
+    errores_bulk,
+    estado_conexion,
+    filtrar_usuario,
+    filtro_despues_de,
+    indice_faqs,
+    indice_productos,
+    invalidar_stock,
+    lectura_reserva,
+    lectura_transiciones,
+    leer_limite_sesion,
+    leer_paginacion,
+    llave_proyeccion,
+    marcas_aplicadas,
+    mensaje_sin_stock,
+    mensaje_transicion_invalida,
+    opciones_mongo,
+    operacion_actualizacion,
+    operaciones_cierre_reserva,
+    operaciones_devolucion,
+    operaciones_liberacion,
+    operaciones_reserva,
+    operaciones_transicion,
+    parse_json,
+    pedidos_insertados,
+    pedidos_validos,
+    pipeline_contexto_sesion,
+    planear_reserva,
+    planear_transiciones,
+    recolector_cache_y_cola,
+    repartir_reserva,
+    respuesta_info_empresa,
+    respuesta_listo,
+    resultado_transiciones,
+    resultados_faqs,
+    resumen_lote,
+    resumen_transiciones,
+    transiciones_aplicadas,
+    transiciones_fallidas,
+    truncar_a_milisegundos,
+    validar_actualizaciones_lote,
+    validar_consultas_faqs,
+    validar_items,
+    validar_pedidos_lote,
+)
+import analitica
+import cache_http
+import coalescencia
+import limites
+import metricas
+import atexit
 import os
+import queue
+import threading
+import time
+
+estado_arranque.marcar("importaciones")
 
 app = Flask(__name__)
 
-MONGODB_URI = os.getenv("MONGODB_URI", 'mongodb://localhost:27017/')
+class ConexionMongo:
+    """Cliente de MongoDB del proceso actual.
+
+    pymongo no admite usar en un proceso hijo un cliente creado antes del fork (gunicorn con
+    preload, multiprocessing), así que el cliente se crea en el primer uso dentro de cada proceso
+    y se vuelve a crear si el PID cambió.
+    """
+
+    def __init__(self, uri, opciones):
+        self.uri = uri
+        self.opciones = opciones
+        self._cliente = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Un lock tomado por otro hilo en el momento del fork quedaría cerrado para siempre en el hijo
+        os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._cliente = None
+        self._pid = None
+
+    @property
+    def cliente(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._cliente = MongoClient(self.uri, event_listeners=metricas.listeners_mongo(), **self.opciones)
+                    self._pid = os.getpid()
+        return self._cliente
+
+    def cerrar(self):
+        with self._lock:
+            if self._cliente is not None and self._pid == os.getpid():
+                self._cliente.close()
+            self._cliente = None
+            self._pid = None
+
+class BaseDatos:
+    """Base de datos del cliente del proceso actual: db.products, db['faqs'], db.command(...)."""
+
+    def __init__(self, conexion, nombre):
+        self._conexion = conexion
+        self._nombre = nombre
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion.cliente[self._nombre], nombre)
+
+    def __getitem__(self, nombre):
+        return self._conexion.cliente[self._nombre][nombre]
 
 # Conexión a MongoDB
-client = MongoClient(MONGODB_URI, tlsAllowInvalidCertificates=True)
-print("MONGODB_URI:", MONGODB_URI)
+conexion_mongo = ConexionMongo(MONGODB_URI, opciones_mongo())
+
+db = BaseDatos(conexion_mongo, 'jv_chatbot_mvp')
 
-db = client['jv_chatbot_mvp']
+app.json = BSONJSONProvider(app)
+
+# Lecturas por llave que comparten la consulta en curso (ver coalescencia.py)
+lecturas = coalescencia.Coalescedor()
+
+# Obtener el stock vigente de varios productos con una sola consulta para los que no estén en caché
+def stock_actual(codigos):
+    stocks = {}
+    faltantes = []
+    for codigo in codigos:
+        stock = cache_catalogo.obtener(("stock", codigo))
+        if stock is None:
+            faltantes.append(codigo)
+        else:
+            stocks[codigo] = stock
+    
+    if faltantes:
+        for producto in db.products.find({"codigo": {"$in": faltantes}}, {"_id": 0, "codigo": 1, "stock": 1}):
+            stocks[producto["codigo"]] = producto.get("stock", 0)
+            cache_catalogo.guardar(("stock", producto["codigo"]), producto.get("stock", 0), cache_catalogo.ttl_stock)
+    
+    return stocks
 
-# Convertir ObjectId y datetime a string para serialización JSON
-def parse_json(data):
-    return json.loads(dumps(data))
+# Reemplazar el stock de los productos en caché por su valor vigente
+def con_stock_actual(productos):
+    stocks = stock_actual([producto["codigo"] for producto in productos])
+    return [dict(producto, stock=stocks.get(producto["codigo"], producto.get("stock", 0))) for producto in productos]
+
+# Stock vigente de un solo producto; si no está en caché, las solicitudes simultáneas comparten la consulta
+def stock_producto(codigo):
+    stock = cache_catalogo.obtener(("stock", codigo))
+    if stock is None:
+        stock = lecturas.ejecutar(("stock", codigo), lambda: stock_actual([codigo]).get(codigo))
+    return stock
+
+# Leer un producto completo de MongoDB y guardarlo en caché junto con su stock
+def leer_producto(codigo):
+    producto = db.products.find_one({"codigo": codigo}, PROYECCION_PRODUCTO)
+    if producto:
+        cache_catalogo.guardar(("producto", codigo), producto)
+        cache_catalogo.guardar(("stock", codigo), producto.get("stock", 0), cache_catalogo.ttl_stock)
+    return producto
+
+# Leer nombre y stock de un producto que no está en caché y guardar el stock
+def leer_stock_producto(codigo):
+    producto = db.products.find_one({"codigo": codigo}, {"_id": 0, "codigo": 1, "nombre": 1, "stock": 1})
+    if producto:
+        cache_catalogo.guardar(("stock", codigo), producto.get("stock", 0), cache_catalogo.ttl_stock)
+    return producto
+
+# Escuchar el change stream de productos para invalidar la caché (requiere replica set)
+def vigilar_catalogo():
+    while True:
+        try:
+            with db.products.watch(full_document='updateLookup') as stream:
+                for cambio in stream:
+                    aplicar_cambio_producto(cambio)
+        except Exception as e:
+            logger.error("Error en el change stream de productos: %s", e)
+            cache_catalogo.limpiar()
+            time.sleep(5)
+
+# Cargar el índice la primera vez o cuando venza su TTL
+def asegurar_indice_productos():
+    if indice_productos.vencido():
+        indice_productos.reconstruir(db.products.find({}, PROYECCION_PRODUCTO))
+    return indice_productos
+
+# Reconstruir la matriz de FAQs solo cuando cambió la colección o venció su TTL
+def asegurar_indice_faqs():
+    if indice_faqs.vencido():
+        indice_faqs.reconstruir(db.faqs.find())
+    return indice_faqs
+
+# Escuchar el change stream de FAQs para reconstruir la matriz en la siguiente consulta
+def vigilar_faqs():
+    while True:
+        try:
+            with db.faqs.watch() as stream:
+                for _ in stream:
+                    indice_faqs.marcar_sucio()
+        except Exception as e:
+            logger.error("Error en el change stream de FAQs: %s", e)
+            indice_faqs.marcar_sucio()
+            time.sleep(5)
+
+# Traer una página ordenada por la llave, usando el índice en lugar de saltar documentos.
+# Con proyección, la página incluye además las llaves de orden para poder armar el cursor.
+def paginar(coleccion, filtro, orden, limite, cursor=None, proyeccion=None):
+    if cursor:
+        filtro = {"$and": [filtro, filtro_despues_de(orden, decodificar_cursor(cursor, orden))]}
+    
+    documentos = list(coleccion.find(filtro, con_llaves(proyeccion, orden)).sort(orden).limit(limite + 1))
+    return cortar_pagina(documentos, limite, orden)
+
+# Verificar al iniciar que los índices coincidan con el manifiesto de indices.py
+def verificar_indices_al_iniciar():
+    try:
+        avisar_diferencias_indices(verificar_indices(db))
+    except Exception as e:
+        logger.error("No se pudieron verificar los índices: %s", e)
+
+# Métricas por ruta y endpoint /metrics
+metricas.registrar(app, request)
+cache_http.registrar(app, request)
+registros.registrar(app, request)
+metricas.recolectores.append(canal_registros.metricas)
+
+# Límite por teléfono, cédula e IP y tope de concurrencia (ver limites.py); va después de metricas
+limitador = limites.Limitador(limites.crear_almacen(db))
+limites.registrar(app, request, limitador)
+metricas.recolectores.append(limitador.metricas)
+metricas.recolectores.append(coalescencia.metricas_coalescencia)
 
 # Rutas para simular ERP/CRM
 
@@ -48,10 +297,10 @@ def parse_json(data):
 def validar_usuario():
     try:
         data = request.json
-        logger.info(f"Validating data: {data}")
+        logger.debug("Validando datos: %s", data)
 
         cedula = data.get('cedula')
-        logger.info(f"Validating cedula: {cedula}")
+        logger.info("Validando usuario", extra={"cedula": cedula})
         
         if not cedula:
             return jsonify({"error": "Se requiere cédula"}), 400
@@ -59,51 +308,62 @@ def validar_usuario():
         usuario = db.users.find_one({"cedula": cedula})
         
         if usuario:
-            # Filtrar datos sensibles
-            usuario_data = {
-                "cedula": usuario["cedula"],
-                "nombre": usuario["nombre"],
-                "correo": usuario["correo"],
-                "telefono": usuario["telefono"],
-                "estado": usuario["estado"],
-                "segmento": usuario["segmento"]
-            }
-            return jsonify({"success": True, "usuario": parse_json(usuario_data)})
+            return jsonify({"success": True, "usuario": parse_json(filtrar_usuario(usuario))})
         else:
             return jsonify({"success": False, "mensaje": "Usuario no encontrado"}), 404
     except Exception as e:
-        logger.error(f"Error en la validación de usuario: {str(e)}")
+        logger.error("Error en la validación de usuario: %s", e)
         return jsonify({"error": "Error al validar usuario"}), 500
 
 # Endpoint para obtener datos de un usuario
 @app.route('/api/usuarios/<cedula>', methods=['GET'])
 def obtener_usuario(cedula):
     try:
-        logger.info(f"Fetching user data for cedula: {cedula}")
-        usuario = db.users.find_one({"cedula": cedula})
+        proyeccion = leer_proyeccion("users", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        logger.info("Consultando usuario", extra={"cedula": cedula})
+        usuario = lecturas.ejecutar(
+            ("usuario", cedula, llave_proyeccion(proyeccion)), lambda: db.users.find_one({"cedula": cedula}, proyeccion)
+        )
     
         if usuario:
             return jsonify({"success": True, "usuario": parse_json(usuario)})
         else:
             return jsonify({"success": False, "mensaje": "Usuario no encontrado"}), 404
     except Exception as e:
-        logger.error(f"Error al obtener datos de usuario: {str(e)}")
+        logger.error("Error al obtener datos de usuario: %s", e)
         return jsonify({"error": "Error al obtener datos de usuario"}), 500
 
 # Endpoint para obtener todos los pedidos de un usuario
 @app.route('/api/pedidos/usuario/<cedula>', methods=['GET'])
 def obtener_pedidos_usuario(cedula):
-    pedidos = list(db.orders.find({"cedula_cliente": cedula}))
+    limite, cursor = leer_paginacion(request.args)
+    try:
+        proyeccion = leer_proyeccion("orders", request.args)
+        pedidos, siguiente = paginar(db.orders, {"cedula_cliente": cedula}, ORDEN_POR_ID, limite, cursor, proyeccion)
+    except (CursorInvalido, CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
     
-    if pedidos:
-        return jsonify({"success": True, "pedidos": parse_json(pedidos)})
+    if pedidos or cursor:
+        return jsonify({"success": True, "pedidos": parse_json(pedidos), "next_cursor": siguiente})
     else:
         return jsonify({"success": False, "mensaje": "No se encontraron pedidos para este usuario"}), 404
 
 # Endpoint para obtener un pedido específico
 @app.route('/api/pedidos/<numero_pedido>', methods=['GET'])
 def obtener_pedido(numero_pedido):
-    pedido = db.orders.find_one({"numero_pedido": numero_pedido})
+    try:
+        proyeccion = leer_proyeccion("orders", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    
+    pedido = lecturas.ejecutar(
+        ("pedido", numero_pedido, llave_proyeccion(proyeccion)),
+        lambda: db.orders.find_one({"numero_pedido": numero_pedido}, proyeccion)
+    )
     
     if pedido:
         return jsonify({"success": True, "pedido": parse_json(pedido)})
@@ -113,56 +373,127 @@ def obtener_pedido(numero_pedido):
 # Endpoint para buscar productos por categoría
 @app.route('/api/productos/categoria/<categoria>', methods=['GET'])
 def productos_por_categoria(categoria):
-    productos = list(db.products.find({"categoria": categoria}))
+    limite, cursor = leer_paginacion(request.args)
+    try:
+        proyeccion = con_llaves(leer_proyeccion("products", request.args), ORDEN_POR_ID)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
     
-    if productos:
-        return jsonify({"success": True, "productos": parse_json(productos)})
+    # Cada página se guarda en caché por separado, con los documentos completos
+    pagina = cache_catalogo.obtener(("categoria", categoria, cursor, limite))
+    if pagina is None:
+        try:
+            pagina = paginar(
+                db.products, {"categoria": categoria}, ORDEN_POR_ID, limite, cursor, PROYECCION_PRODUCTO
+            )
+        except CursorInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        cache_catalogo.guardar(("categoria", categoria, cursor, limite), pagina)
+    
+    productos, siguiente = pagina
+    productos = [proyectar(producto, proyeccion) for producto in con_stock_actual(productos)]
+    
+    if productos or cursor:
+        return jsonify({"success": True, "productos": parse_json(productos), "next_cursor": siguiente})
     else:
         return jsonify({"success": False, "mensaje": "No se encontraron productos en esta categoría"}), 404
 
 # Endpoint para buscar un producto por código
 @app.route('/api/productos/<codigo>', methods=['GET'])
 def obtener_producto(codigo):
-    producto = db.products.find_one({"codigo": codigo})
+    try:
+        proyeccion = leer_proyeccion("products", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    
+    producto = cache_catalogo.obtener(("producto", codigo))
+    if producto is None:
+        producto = lecturas.ejecutar(("producto", codigo), lambda: leer_producto(codigo))
+    else:
+        stock = stock_producto(codigo)
+        producto = dict(producto, stock=producto.get("stock", 0) if stock is None else stock)
     
     if producto:
-        return jsonify({"success": True, "producto": parse_json(producto)})
+        return jsonify({"success": True, "producto": parse_json(proyectar(producto, proyeccion))})
     else:
         return jsonify({"success": False, "mensaje": "Producto no encontrado"}), 404
 
-# Endpoint para buscar productos por nombre (búsqueda parcial)
+# Endpoint para buscar productos por nombre, categoría, descripción o especificaciones
 @app.route('/api/productos/buscar', methods=['GET'])
 def buscar_productos():
     query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), BUSQUEDA_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
     
     if not query:
         return jsonify({"error": "Se requiere un término de búsqueda"}), 400
     
-    # Búsqueda por coincidencia parcial en el nombre
-    productos = list(db.products.find({"nombre": {"$regex": query, "$options": "i"}}))
+    try:
+        proyeccion = leer_proyeccion("products", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Búsqueda en el índice en memoria, sin tildes ni mayúsculas y por prefijo
+    total, resultados = asegurar_indice_productos().buscar(query, limit, offset)
+    productos = [proyectar(producto, proyeccion) for producto in con_stock_actual([producto for producto, _ in resultados])]
+    for producto, (_, puntaje) in zip(productos, resultados):
+        producto["relevancia"] = round(puntaje, 4)
     
     if productos:
-        return jsonify({"success": True, "productos": parse_json(productos)})
+        return jsonify({"success": True, "total": total, "productos": parse_json(productos)})
     else:
         return jsonify({"success": False, "mensaje": "No se encontraron productos que coincidan con la búsqueda"}), 404
 
 # Endpoint para obtener productos disponibles
 @app.route('/api/productos/disponibles', methods=['GET'])
 def productos_disponibles():
-    productos = list(db.products.find({"estado": "disponible", "stock": {"$gt": 0}}))
+    limite, cursor = leer_paginacion(request.args)
+    try:
+        proyeccion = con_llaves(leer_proyeccion("products", request.args), ORDEN_POR_ID)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
     
-    if productos:
-        return jsonify({"success": True, "productos": parse_json(productos)})
+    # Las páginas se guardan con el TTL de stock porque dependen del inventario
+    pagina = cache_catalogo.obtener(("disponibles", cursor, limite))
+    if pagina is None:
+        try:
+            pagina = paginar(
+                db.products, {"estado": "disponible", "stock": {"$gt": 0}}, ORDEN_POR_ID, limite, cursor,
+                PROYECCION_PRODUCTO
+            )
+        except CursorInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        cache_catalogo.guardar(("disponibles", cursor, limite), pagina, cache_catalogo.ttl_stock)
+    
+    productos, siguiente = pagina
+    productos = [proyectar(producto, proyeccion) for producto in productos]
+    
+    if productos or cursor:
+        return jsonify({"success": True, "productos": parse_json(productos), "next_cursor": siguiente})
     else:
         return jsonify({"success": False, "mensaje": "No se encontraron productos disponibles"}), 404
 
 # Endpoint para verificar stock de un producto
 @app.route('/api/productos/stock/<codigo>', methods=['GET'])
 def verificar_stock(codigo):
-    producto = db.products.find_one({"codigo": codigo}, {"_id": 0, "codigo": 1, "nombre": 1, "stock": 1})
+    try:
+        proyeccion = leer_proyeccion("stock", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+    
+    producto = cache_catalogo.obtener(("producto", codigo))
+    if producto is not None:
+        stock = stock_producto(codigo)
+        producto = {
+            "codigo": producto["codigo"],
+            "nombre": producto.get("nombre"),
+            "stock": producto.get("stock", 0) if stock is None else stock
+        }
+    else:
+        producto = lecturas.ejecutar(("stock", codigo, "nombre"), lambda: leer_stock_producto(codigo))
     
     if producto:
-        return jsonify({"success": True, "stock": parse_json(producto)})
+        return jsonify({"success": True, "stock": parse_json(proyectar(producto, proyeccion))})
     else:
         return jsonify({"success": False, "mensaje": "Producto no encontrado"}), 404
 
@@ -170,17 +501,95 @@ def verificar_stock(codigo):
 @app.route('/api/faqs', methods=['GET'])
 def obtener_faqs():
     categoria = request.args.get('categoria')
+    limite, cursor = leer_paginacion(request.args)
     
-    if categoria:
-        faqs = list(db.faqs.find({"categoria": categoria}))
-    else:
-        faqs = list(db.faqs.find())
+    filtro = {"categoria": categoria} if categoria else {}
+    try:
+        proyeccion = leer_proyeccion("faqs", request.args)
+        faqs, siguiente = paginar(db.faqs, filtro, ORDEN_POR_ID, limite, cursor, proyeccion)
+    except (CursorInvalido, CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
     
-    if faqs:
-        return jsonify({"success": True, "faqs": parse_json(faqs)})
+    if faqs or cursor:
+        return jsonify({"success": True, "faqs": parse_json(faqs), "next_cursor": siguiente})
     else:
         return jsonify({"success": False, "mensaje": "No se encontraron preguntas frecuentes"}), 404
 
+# Endpoint para buscar las preguntas frecuentes más parecidas a uno o varios mensajes
+@app.route('/api/faqs/buscar', methods=['GET', 'POST'])
+def buscar_faqs():
+    if request.method == 'POST':
+        data = request.json or {}
+        consultas, k = data.get('consultas') or [], data.get('k', 3)
+    else:
+        consultas, k = [request.args.get('q', '')], request.args.get('k', 3, type=int)
+    
+    try:
+        consultas, k = validar_consultas_faqs(consultas, k)
+        proyeccion = leer_proyeccion("faqs", request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    resultados = resultados_faqs(asegurar_indice_faqs(), consultas, k, proyeccion)
+    
+    if request.method == 'POST':
+        return jsonify({"success": True, "resultados": parse_json(resultados)})
+    
+    if resultados[0]:
+        return jsonify({"success": True, "faqs": parse_json(resultados[0])})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron preguntas frecuentes relacionadas"}), 404
+
+# Resolver en una sola consulta los productos de una lista de códigos
+def resolver_productos(codigos):
+    codigos = list({codigo for codigo in codigos if codigo})
+    if not codigos:
+        return {}
+    
+    productos = db.products.find(
+        {"codigo": {"$in": codigos}},
+        {"_id": 0, "codigo": 1, "nombre": 1, "precio": 1, "categoria": 1}
+    )
+    return {producto["codigo"]: producto for producto in productos}
+
+# Números de pedido reservados por bloques en la colección counters (ver contadores.py)
+asignador_pedidos = AsignadorNumeros(db, "pedidos", PEDIDOS_BLOQUE_NUMEROS)
+
+# Reservar el stock de varios pedidos; los pedidos sin stock suficiente se revierten completos
+def reservar_stock(pedidos):
+    plan = planear_reserva(pedidos)
+    if not plan:
+        return {}
+    
+    try:
+        resultado = db.products.bulk_write(operaciones_reserva(plan), ordered=False)
+        if resultado.modified_count == len(plan):
+            aplicadas = {reserva["marca"] for reserva in plan}
+        else:
+            aplicadas = marcas_aplicadas(db.products.find(*lectura_reserva(plan)))
+        rechazados = repartir_reserva(plan, aplicadas)
+        db.products.bulk_write(operaciones_cierre_reserva(plan, rechazados))
+    except Exception:
+        cancelar_reserva(plan)
+        raise
+    finally:
+        invalidar_stock(codigos_reserva(plan))
+    return rechazados
+
+# Después de un error a mitad de la reserva, devolver lo que alcanzó a descontarse
+def cancelar_reserva(plan):
+    try:
+        db.products.bulk_write(operaciones_devolucion(plan), ordered=False)
+    except Exception as e:
+        logger.error("No se pudo devolver el stock de una reserva fallida: %s", e)
+
+# Devolver al inventario el stock reservado por pedidos creados o cancelados
+def liberar_stock(pedidos):
+    devoluciones = devoluciones_pedidos(pedidos)
+    if devoluciones:
+        db.products.bulk_write(operaciones_liberacion(devoluciones), ordered=False)
+        invalidar_stock({codigo for codigo, _ in devoluciones})
+
 # Endpoint para crear un nuevo pedido (simulación)
 @app.route('/api/pedidos/crear', methods=['POST'])
 def crear_pedido():
@@ -190,51 +599,35 @@ def crear_pedido():
     if not data.get('cedula_cliente') or not data.get('items'):
         return jsonify({"error": "Se requiere cédula del cliente e items del pedido"}), 400
     
-    # Generar número de pedido
-    import random
-    numero_pedido = f"PED-{str(random.randint(10000, 99999))}"
+    error = validar_items(data['items'])
+    if error:
+        return jsonify({"error": error}), 400
     
-    # Calcular total del pedido
-    total_pedido = 0
-    items_procesados = []
-    
-    for item in data.get('items', []):
-        codigo_producto = item.get('codigo_producto')
-        cantidad = item.get('cantidad', 1)
-        
-        # Buscar producto en la base de datos
-        producto = db.products.find_one({"codigo": codigo_producto})
-        
-        if producto:
-            precio_unitario = producto.get('precio', 0)
-            subtotal = precio_unitario * cantidad
-            
-            item_procesado = {
-                "codigo_producto": codigo_producto,
-                "nombre_producto": producto.get('nombre', ''),
-                "cantidad": cantidad,
-                "precio_unitario": precio_unitario,
-                "subtotal": subtotal
-            }
-            
-            items_procesados.append(item_procesado)
-            total_pedido += subtotal
+    # Buscar todos los productos del pedido en una sola consulta
+    productos_por_codigo = resolver_productos(
+        item.get('codigo_producto') for item in data.get('items', [])
+    )
     
     # Crear pedido
-    nuevo_pedido = {
-        "numero_pedido": numero_pedido,
-        "cedula_cliente": data.get('cedula_cliente'),
-        "fecha_pedido": datetime.datetime.now(),
-        "estado": "pendiente",
-        "items": items_procesados,
-        "total": total_pedido,
-        "metodo_pago": data.get('metodo_pago', 'pendiente'),
-        "direccion_entrega": data.get('direccion_entrega', ''),
-        "notas": data.get('notas', '')
-    }
+    nuevo_pedido = construir_pedido(data, productos_por_codigo, asignador_pedidos.siguiente())
+    
+    # Reservar el stock de todos los items antes de guardar el pedido
+    rechazados = reservar_stock([nuevo_pedido])
+    if rechazados:
+        return jsonify({
+            "success": False,
+            "error": mensaje_sin_stock(rechazados[0]),
+            "productos_sin_stock": rechazados[0]
+        }), 409
     
     # Insertar en la base de datos
-    db.orders.insert_one(nuevo_pedido)
+    try:
+        db.orders.insert_one(nuevo_pedido)
+    except Exception:
+        liberar_stock([nuevo_pedido])
+        raise
+    
+    analitica.registrar_pedidos(db, [nuevo_pedido])
     
     return jsonify({
         "success": True, 
@@ -242,6 +635,40 @@ def crear_pedido():
         "pedido": parse_json(nuevo_pedido)
     })
 
+# Endpoint para crear varios pedidos en una sola solicitud
+@app.route('/api/pedidos/crear/lote', methods=['POST'])
+def crear_pedidos_lote():
+    data = request.json or {}
+    pedidos = data.get('pedidos')
+    
+    if not isinstance(pedidos, list) or not pedidos:
+        return jsonify({"error": "Se requiere una lista de pedidos"}), 400
+    
+    if len(pedidos) > MAX_PEDIDOS_LOTE:
+        return jsonify({"error": f"Se permiten máximo {MAX_PEDIDOS_LOTE} pedidos por solicitud"}), 400
+    
+    resultados, codigos = validar_pedidos_lote(pedidos)
+    
+    # Una sola consulta de productos para todo el lote
+    numeros = asignador_pedidos.siguientes(pedidos_validos(resultados))
+    nuevos_pedidos, indices = construir_pedidos_lote(pedidos, resultados, resolver_productos(codigos), numeros)
+    
+    # Un solo bulk_write reserva el stock de todo el lote (ver reservar_stock)
+    nuevos_pedidos, indices = descartar_sin_stock(nuevos_pedidos, indices, resultados, reservar_stock(nuevos_pedidos))
+    
+    # Insertar todos los pedidos válidos sin detenerse en el primer error
+    errores = {}
+    if nuevos_pedidos:
+        try:
+            db.orders.insert_many(nuevos_pedidos, ordered=False)
+        except BulkWriteError as e:
+            errores = errores_bulk(e)
+            liberar_stock([nuevos_pedidos[posicion] for posicion in errores])
+    
+    analitica.registrar_pedidos(db, pedidos_insertados(nuevos_pedidos, errores))
+    
+    return jsonify(resumen_lote(pedidos, resultados, nuevos_pedidos, indices, errores))
+
 # Endpoint para actualizar estado de un pedido
 @app.route('/api/pedidos/actualizar/<numero_pedido>', methods=['PUT'])
 def actualizar_pedido(numero_pedido):
@@ -252,37 +679,158 @@ def actualizar_pedido(numero_pedido):
         return jsonify({"error": "Se requiere el nuevo estado"}), 400
     
     # Validar estado
-    estados_validos = ["pendiente", "confirmado", "en preparación", "en tránsito", "entregado", "cancelado"]
-    if nuevo_estado not in estados_validos:
-        return jsonify({"error": f"Estado no válido. Debe ser uno de: {', '.join(estados_validos)}"}), 400
+    if nuevo_estado not in ESTADOS_PEDIDO:
+        return jsonify({"error": f"Estado no válido. Debe ser uno de: {', '.join(ESTADOS_PEDIDO)}"}), 400
     
     # Actualizar estado y fecha correspondiente
-    actualizacion = {"estado": nuevo_estado}
-    
-    if nuevo_estado == "confirmado":
-        actualizacion["fecha_confirmacion"] = datetime.datetime.now()
-    elif nuevo_estado == "en preparación":
-        actualizacion["fecha_preparacion"] = datetime.datetime.now()
-    elif nuevo_estado == "en tránsito":
-        actualizacion["fecha_envio"] = datetime.datetime.now()
-        actualizacion["numero_guia"] = f"GUIA-{str(ObjectId())[-8:].upper()}"
-    elif nuevo_estado == "entregado":
-        actualizacion["fecha_entrega"] = datetime.datetime.now()
-    
-    resultado = db.orders.update_one(
-        {"numero_pedido": numero_pedido},
-        {"$set": actualizacion}
+    actualizacion = actualizacion_estado(nuevo_estado, data.get('numero_guia'))
+    
+    # La transición se valida en el filtro de la misma escritura (ver operacion_actualizacion)
+    anterior = db.orders.find_one_and_update(
+        *operacion_actualizacion(numero_pedido, nuevo_estado, actualizacion),
+        return_document=ReturnDocument.BEFORE
     )
     
-    if resultado.modified_count > 0:
-        pedido_actualizado = db.orders.find_one({"numero_pedido": numero_pedido})
-        return jsonify({
-            "success": True, 
-            "mensaje": "Pedido actualizado exitosamente", 
-            "pedido": parse_json(pedido_actualizado)
-        })
-    else:
-        return jsonify({"success": False, "mensaje": "No se pudo actualizar el pedido o no existe"}), 404
+    if anterior is None:
+        actual = db.orders.find_one({"numero_pedido": numero_pedido}, {"_id": 0, "estado": 1})
+        if actual is None:
+            return jsonify({"success": False, "mensaje": "No se pudo actualizar el pedido o no existe"}), 404
+        return jsonify({"success": False, "mensaje": mensaje_transicion_invalida(actual.get('estado'), nuevo_estado)}), 409
+    
+    # Las lecturas que lleguen desde ahora no se unen a una consulta del pedido anterior a la escritura
+    coalescencia.olvidar("pedido", numero_pedido)
+    
+    if nuevo_estado == "cancelado" and anterior.get("stock_reservado"):
+        liberar_stock([anterior])
+    
+    analitica.registrar_transiciones(db, [(anterior, nuevo_estado)])
+    
+    return jsonify({
+        "success": True, 
+        "mensaje": "Pedido actualizado exitosamente", 
+        "pedido": parse_json(dict(anterior, **actualizacion))
+    })
+
+# Endpoint para actualizar el estado de muchos pedidos a la vez (integración de logística)
+@app.route('/api/pedidos/actualizar/lote', methods=['POST'])
+def actualizar_pedidos_lote():
+    data = request.json or {}
+    actualizaciones = data.get('actualizaciones')
+    
+    if not isinstance(actualizaciones, list) or not actualizaciones:
+        return jsonify({"error": "Se requiere una lista de actualizaciones"}), 400
+    
+    if len(actualizaciones) > MAX_ACTUALIZACIONES_LOTE:
+        return jsonify({"error": f"Se permiten máximo {MAX_ACTUALIZACIONES_LOTE} actualizaciones por solicitud"}), 400
+    
+    resultados, numeros = validar_actualizaciones_lote(actualizaciones)
+    
+    # Una sola consulta trae el estado actual de todos los pedidos del lote
+    actuales = {}
+    if numeros:
+        actuales = {
+            pedido["numero_pedido"]: pedido
+            for pedido in db.orders.find({"numero_pedido": {"$in": numeros}}, PROYECCION_TRANSICION)
+        }
+    planes = planear_transiciones(actualizaciones, resultados, actuales)
+    
+    # Un solo bulk_write con las escrituras condicionadas de todos los pedidos. Si no coincidieron
+    # todas, una sola lectura dice qué pedidos no quedaron en el estado destino.
+    fallidas = set()
+    if planes:
+        resultado = db.orders.bulk_write(operaciones_transicion(planes), ordered=False)
+        if resultado.matched_count != len(planes):
+            fallidas = transiciones_fallidas(planes, db.orders.find(*lectura_transiciones(planes)))
+    for numero in numeros:
+        coalescencia.olvidar("pedido", numero)
+    
+    cancelados = resultado_transiciones(planes, resultados, fallidas)
+    liberar_stock(cancelados)
+    analitica.registrar_transiciones(db, transiciones_aplicadas(planes, fallidas))
+    
+    return jsonify(resumen_transiciones(resultados))
+
+# Escritura diferida (write-behind) de conversaciones
+class EscritorConversaciones(EscritorConversacionesBase):
+    """Encola conversaciones y las escribe con insert_many desde un hilo en segundo plano."""
+
+    def __init__(self, db, max_cola, lote, intervalo):
+        super().__init__(db, queue.Queue(maxsize=max_cola), lote, intervalo)
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._ejecutar, name="escritor-conversaciones", daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def encolar(self, conversacion, espera=CONVERSACIONES_ESPERA_COLA):
+        self._agregar_pendiente(conversacion)
+        try:
+            if espera > 0:
+                self._cola.put(conversacion, timeout=espera)
+            else:
+                self._cola.put_nowait(conversacion)
+        except queue.Full:
+            self._rechazar(conversacion)
+        self._contar_encolada()
+
+    def _tomar_lote(self):
+        try:
+            lote = [self._cola.get(timeout=self.intervalo)]
+        except queue.Empty:
+            return []
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.lote:
+            restante = limite - time.monotonic()
+            if restante <= 0 and self._cola.empty():
+                break
+            try:
+                lote.append(self._cola.get(timeout=max(restante, 0)) if restante > 0 else self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    # Turnos fallidos al escribir en buckets (0 con la colección conversations)
+    def _insertar(self, lote):
+        if usa_buckets():
+            return escribir_buckets(self.db, lote)
+        self.db.conversations.insert_many(lote, ordered=False)
+        return 0
+
+    def _escribir(self, lote):
+        try:
+            resultado = self._insertar(lote)
+        except Exception as e:
+            resultado = e
+        analitica.registrar_conversaciones(self.db, self._terminar_lote(lote, resultado))
+
+    def _ejecutar(self):
+        while not self._detener.is_set() or not self._cola.empty():
+            lote = self._tomar_lote()
+            if lote:
+                self._escribir(lote)
+
+    def detener(self, timeout=10):
+        # Vaciar la cola antes de terminar el proceso
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+escritor_conversaciones = None
+if CONVERSACIONES_WRITE_BEHIND:
+    escritor_conversaciones = EscritorConversaciones(
+        db, CONVERSACIONES_COLA_MAX, CONVERSACIONES_LOTE, CONVERSACIONES_INTERVALO
+    )
+
+metricas.recolectores.append(recolector_cache_y_cola(escritor_conversaciones))
+
+# Endpoint para consultar el estado de la escritura diferida de conversaciones
+@app.route('/api/conversaciones/cola', methods=['GET'])
+def estado_cola_conversaciones():
+    if escritor_conversaciones is None:
+        return jsonify({"success": True, "cola": {"habilitado": False}})
+    return jsonify({"success": True, "cola": escritor_conversaciones.estadisticas()})
 
 # Endpoint para guardar una conversación
 @app.route('/api/conversaciones/guardar', methods=['POST'])
@@ -294,18 +842,22 @@ def guardar_conversacion():
         return jsonify({"error": "Se requiere número de teléfono y mensaje"}), 400
     
     # Crear documento de conversación
-    conversacion = {
-        "phone_number": data.get('phone_number'),
-        "cedula": data.get('cedula', ''),
-        "mensaje": data.get('mensaje'),
-        "respuesta": data.get('respuesta', ''),
-        "timestamp": datetime.datetime.now(),
-        "intent": data.get('intent', ''),
-        "sentimiento": data.get('sentimiento', 'neutral')
-    }
+    conversacion = construir_conversacion(data)
     
-    # Insertar en la base de datos
-    db.conversations.insert_one(conversacion)
+    # Insertar en la base de datos, o encolar si la escritura diferida está activa
+    if escritor_conversaciones is not None:
+        conversacion["timestamp"] = truncar_a_milisegundos(conversacion["timestamp"])
+        try:
+            escritor_conversaciones.encolar(conversacion)
+        except ColaLlena as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    elif usa_buckets():
+        if escribir_buckets(db, [conversacion]):
+            return jsonify({"error": "Error al guardar la conversación"}), 500
+        analitica.registrar_conversaciones(db, [conversacion])
+    else:
+        db.conversations.insert_one(conversacion)
+        analitica.registrar_conversaciones(db, [conversacion])
     
     return jsonify({
         "success": True, 
@@ -313,56 +865,173 @@ def guardar_conversacion():
         "conversacion": parse_json(conversacion)
     })
 
+# Página de conversaciones de un teléfono, de "conversations" o de los buckets según el almacenamiento
+def paginar_conversaciones(phone_number, limite, cursor, proyeccion):
+    if not usa_buckets():
+        return paginar(
+            db.conversations, {"phone_number": phone_number}, ORDEN_CONVERSACIONES, limite, cursor, proyeccion
+        )
+    valores = decodificar_cursor(cursor, ORDEN_CONVERSACIONES) if cursor else None
+    return cortar_pagina(leer_buckets(db, phone_number, limite, valores, proyeccion), limite, ORDEN_CONVERSACIONES)
+
 # Endpoint para obtener conversaciones de un usuario
 @app.route('/api/conversaciones/<phone_number>', methods=['GET'])
 def obtener_conversaciones(phone_number):
     # Obtener el número de conversaciones a retornar (opcional)
-    limit = request.args.get('limit', 10, type=int)
+    limite, cursor = leer_paginacion(request.args, 10)
     
     # Buscar conversaciones ordenadas por fecha (más recientes primero)
-    conversaciones = list(db.conversations.find(
-        {"phone_number": phone_number}
-    ).sort("timestamp", -1).limit(limit))
+    try:
+        proyeccion = leer_proyeccion("conversations", request.args)
+        conversaciones, siguiente = paginar_conversaciones(phone_number, limite, cursor, proyeccion)
+        conversaciones, siguiente = combinar_pendientes(escritor_conversaciones, phone_number, conversaciones, siguiente, limite, cursor)
+    except (CursorInvalido, CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Las conversaciones que siguen en la cola de escritura llegan completas
+    proyeccion = con_llaves(proyeccion, ORDEN_CONVERSACIONES)
+    conversaciones = [proyectar(conversacion, proyeccion) for conversacion in conversaciones]
+    
+    if conversaciones or cursor:
+        return jsonify({"success": True, "conversaciones": parse_json(conversaciones), "next_cursor": siguiente})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron conversaciones para este usuario"}), 404
+
+# Endpoint para leer las conversaciones archivadas de un usuario entre dos fechas (AAAA-MM-DD)
+@app.route('/api/conversaciones/<phone_number>/archivo', methods=['GET'])
+def obtener_conversaciones_archivadas(phone_number):
+    try:
+        desde, hasta = rango_archivo(request.args.get('desde'), request.args.get('hasta'))
+        proyeccion = leer_proyeccion("conversations", request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conversaciones = [proyectar(conversacion, proyeccion) for conversacion in leer_archivo(phone_number, desde, hasta)]
     
     if conversaciones:
         return jsonify({"success": True, "conversaciones": parse_json(conversaciones)})
     else:
-        return jsonify({"success": False, "mensaje": "No se encontraron conversaciones para este usuario"}), 404
+        return jsonify({"success": False, "mensaje": "No se encontraron conversaciones archivadas en esas fechas"}), 404
+
+# Endpoint con todo lo que el bot necesita al iniciar una sesión, en una sola consulta
+@app.route('/api/sesion/contexto', methods=['POST'])
+def contexto_sesion():
+    data = request.json or {}
+    cedula = data.get('cedula')
+    phone_number = data.get('phone_number')
+    
+    if not cedula or not phone_number:
+        return jsonify({"error": "Se requiere cédula y número de teléfono"}), 400
+    
+    try:
+        pedidos = leer_limite_sesion(data.get('pedidos'), SESION_PEDIDOS)
+        conversaciones = leer_limite_sesion(data.get('conversaciones'), SESION_CONVERSACIONES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    documento = next(db.users.aggregate(pipeline_contexto_sesion(cedula, phone_number, pedidos, conversaciones)), None)
+    
+    if documento is None:
+        return jsonify({"success": False, "mensaje": "Usuario no encontrado"}), 404
+    
+    return jsonify(armar_contexto_sesion(escritor_conversaciones, documento, phone_number, conversaciones))
 
 # Endpoint para obtener información de la empresa (para preguntas frecuentes)
 @app.route('/api/empresa/info', methods=['GET'])
 def obtener_info_empresa():
-    info_empresa = {
-        "nombre": "JV Energy Solutions",
-        "horario_atencion": {
-            "lunes_viernes": "8:00 AM - 6:00 PM",
-            "sabados": "9:00 AM - 1:00 PM",
-            "domingos_festivos": "Cerrado"
-        },
-        "direccion_principal": "Carrera 62 No. 14-65, Zona Industrial Puente Aranda, Bogotá",
-        "telefonos": {
-            "ventas": "+57 1 5709000",
-            "soporte": "+57 1 5709001",
-            "whatsapp": "+57 3001234567"
-        },
-        "correo": "servicioalcliente@jv.co",
-        "web": "www.jv.co",
-        "redes_sociales": {
-            "facebook": "JVEnergy",
-            "instagram": "@jvenergy",
-            "linkedin": "jv-energy-solutions"
-        },
-        "metodos_pago": [
-            "Tarjetas de crédito (Visa, Mastercard, American Express)",
-            "PSE (Pago Seguro Electrónico)",
-            "Transferencia bancaria",
-            "Efectivo contra entrega (en compras seleccionadas)"
-        ],
-        "politica_garantia": "Los productos JV cuentan con garantía desde 1 año hasta 5 años dependiendo del modelo y tipo de producto.",
-        "plazo_entrega": "Ciudades principales: 1-3 días hábiles. Zonas remotas: 4-7 días hábiles."
-    }
-    
-    return jsonify({"success": True, "info": info_empresa})
+    return respuesta_info_empresa.responder(app, request, cache_http.RUTAS_CACHEABLES["obtener_info_empresa"])
+
+# Endpoints de analítica: leen los documentos de resumen de analitica.py (uno por día y categoría,
+# intent o estado), nunca los pedidos ni las conversaciones
+@app.route('/api/analitica/ventas', methods=['GET'])
+def analitica_ventas():
+    try:
+        desde, hasta = analitica.rango_dias(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    filtro = analitica.filtro_dias(desde, hasta)
+    if request.args.get('categoria'):
+        filtro["categoria"] = request.args['categoria']
+    documentos = db[analitica.VENTAS].find(filtro, {"_id": 0}).sort("dia", 1)
+    return jsonify({"success": True, "desde": desde.isoformat(), "hasta": hasta.isoformat(), **analitica.resumen_ventas(documentos)})
+
+@app.route('/api/analitica/pedidos', methods=['GET'])
+def analitica_pedidos():
+    return jsonify({"success": True, **analitica.resumen_pedidos(db[analitica.PEDIDOS].find())})
+
+@app.route('/api/analitica/conversaciones', methods=['GET'])
+def analitica_conversaciones():
+    try:
+        desde, hasta = analitica.rango_dias(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    documentos = db[analitica.CONVERSACIONES].find(analitica.filtro_dias(desde, hasta), {"_id": 0}).sort("dia", 1)
+    return jsonify({"success": True, "desde": desde.isoformat(), "hasta": hasta.isoformat(), **analitica.resumen_conversaciones(documentos)})
+
+# Liveness: el proceso responde; no toca MongoDB
+@app.route('/healthz', methods=['GET'])
+def salud_vivo():
+    return jsonify({"success": True, "estado": "vivo"})
+
+# Readiness: el worker terminó de calentar y puede atender solicitudes que usan MongoDB
+@app.route('/readyz', methods=['GET'])
+def salud_listo():
+    cuerpo, codigo = respuesta_listo(*estado_conexion(conexion_mongo.cliente), estado_arranque.resumen())
+    return jsonify(cuerpo), codigo
+
+# Abrir la conexión a MongoDB y reemplazar el snapshot por el catálogo vigente; al terminar,
+# /readyz pasa a 200. Se reintenta hasta que MongoDB responda.
+def calentar():
+    while True:
+        try:
+            with estado_arranque.medir("calentamiento_mongo"):
+                db.command("ping")
+            with estado_arranque.medir("calentamiento_catalogo"):
+                cargar_catalogo(db.products.find({}, PROYECCION_PRODUCTO), db.faqs.find())
+            break
+        except Exception as e:
+            logger.error("Error en el calentamiento: %s", e)
+            time.sleep(arranque.ARRANQUE_REINTENTO)
+    estado_arranque.terminar()
+
+metricas.recolectores.append(estado_arranque.metricas)
+
+_pid_segundo_plano = None
+
+# Arrancar los hilos en segundo plano del proceso actual: verificación de índices, change streams
+# y escritura diferida. Los hilos no sobreviven a un fork, por eso se llama en cada worker.
+def iniciar_segundo_plano():
+    global _pid_segundo_plano
+    if _pid_segundo_plano == os.getpid():
+        return
+    _pid_segundo_plano = os.getpid()
+    
+    cargar_snapshot(estado_arranque)
+    if VERIFICAR_INDICES:
+        threading.Thread(target=verificar_indices_al_iniciar, name="verificar-indices", daemon=True).start()
+    if CATALOGO_CHANGE_STREAM:
+        threading.Thread(target=vigilar_catalogo, name="vigilar-catalogo", daemon=True).start()
+    if FAQS_CHANGE_STREAM:
+        threading.Thread(target=vigilar_faqs, name="vigilar-faqs", daemon=True).start()
+    if escritor_conversaciones is not None:
+        escritor_conversaciones.iniciar()
+    estado_arranque.marcar("segundo_plano")
+
+# Fábrica de la aplicación para servidores con varios procesos:
+#   gunicorn -c gunicorn.conf.py "app:crear_app()"
+# Cada worker la llama después del fork, así que su cliente de MongoDB y sus hilos son propios.
+def crear_app():
+    iniciar_segundo_plano()
+    if arranque.ARRANQUE_CALENTAR:
+        threading.Thread(target=calentar, name="calentamiento", daemon=True).start()
+    else:
+        estado_arranque.terminar()
+    return app
+
+estado_arranque.marcar("modulo")
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Servidor de desarrollo; en producción se usa gunicorn (ver Dockerfile)
+    crear_app().run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,953 @@
+# Modo ASGI: las mismas rutas de app.py como corrutinas sobre Quart y el driver asíncrono de pymongo
+# Ejecutar con: hypercorn app_async:app --bind 0.0.0.0:5000
+#
+# No importa app.py: la lógica común está en nucleo.py. Así el proceso ASGI no crea la app Flask, el
+# MongoClient ni los hilos de app.py; su cliente, su limitador, la escritura diferida, los change
+# streams y el calentamiento corren en el loop de eventos.
+import arranque
+
+# Fases del arranque del worker, medidas desde aquí (ver arranque.py)
+estado_arranque = arranque.Arranque()
+
+import asyncio
+import logging
+import os
+
+import registros
+
+# Logging JSON a stdout a través de una cola (ver registros.py)
+canal_registros = registros.configurar()
+
+logger = logging.getLogger("dummuy_api")
+
+from quart import Quart, jsonify, request
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+import analitica
+import cache_http
+import coalescencia
+import limites
+import metricas
+from contadores import AsignadorNumerosAsync
+from conversaciones import escribir_buckets_async, leer_archivo, leer_buckets_async, rango_archivo, usa_buckets
+from indices import verificar_indices_async
+from proyecciones import CamposInvalidos, con_llaves, leer_proyeccion, proyectar
+from nucleo import (
+    BUSQUEDA_MAX_LIMIT,
+    CATALOGO_CHANGE_STREAM,
+    CONVERSACIONES_COLA_MAX,
+    CONVERSACIONES_INTERVALO,
+    CONVERSACIONES_LOTE,
+    CONVERSACIONES_WRITE_BEHIND,
+    ESTADOS_PEDIDO,
+    FAQS_CHANGE_STREAM,
+    MAX_ACTUALIZACIONES_LOTE,
+    MAX_PEDIDOS_LOTE,
+    MONGODB_URI,
+    ORDEN_CONVERSACIONES,
+    ORDEN_POR_ID,
+    PEDIDOS_BLOQUE_NUMEROS,
+    PROYECCION_PRODUCTO,
+    PROYECCION_TRANSICION,
+    SESION_CONVERSACIONES,
+    SESION_PEDIDOS,
+    VERIFICAR_INDICES,
+    BSONJSONProvider,
+    ColaLlena,
+    CursorInvalido,
+    EscritorConversacionesBase,
+    __name__,
+    actualizacion_estado,
+    aplicar_cambio_producto,
+    armar_contexto_sesion,
+    avisar_diferencias_indices,
+    cache_catalogo,
+    cargar_catalogo,
+    cargar_snapshot,
+    codigos_reserva,
+    combinar_pendientes,
+    construir_conversacion,
+    construir_pedido,
+    construir_pedidos_lote,
+    cortar_pagina,
+    decodificar_cursor,
+    descartar_sin_stock,
+    devoluciones_pedidos,
+    errores_bulk,
+    estado_conexion,
+    filtrar_usuario,
+    filtro_despues_de,
+    indice_faqs,
+    indice_productos,
+    invalidar_stock,
+    lectura_reserva,
+    lectura_transiciones,
+    leer_limite_sesion,
+    leer_paginacion,
+    llave_proyeccion,
+    marcas_aplicadas,
+    mensaje_sin_stock,
+    mensaje_transicion_invalida,
+    opciones_mongo,
+    operacion_actualizacion,
+    operaciones_cierre_reserva,
+    operaciones_devolucion,
+    operaciones_liberacion,
+    operaciones_reserva,
+    operaciones_transicion,
+    parse_json,
+    pedidos_insertados,
+    pedidos_validos,
+    pipeline_contexto_sesion,
+    planear_reserva,
+    planear_transiciones,
+    recolector_cache_y_cola,
+    repartir_reserva,
+    respuesta_info_empresa,
+    respuesta_listo,
+    resultado_transiciones,
+    resultados_faqs,
+    resumen_lote,
+    resumen_transiciones,
+    transiciones_aplicadas,
+    transiciones_fallidas,
+    truncar_a_milisegundos,
+    validar_actualizaciones_lote,
+    validar_consultas_faqs,
+    validar_items,
+    validar_pedidos_lote,
+)
+
+estado_arranque.marcar("importaciones")
+
+app = Quart(__name__)
+app.json = BSONJSONProvider(app)
+metricas.registrar(app, request, asincrono=True)
+cache_http.registrar(app, request, asincrono=True)
+registros.registrar(app, request, asincrono=True)
+metricas.recolectores.append(canal_registros.metricas)
+
+# Conexión asíncrona a MongoDB
+# Cada worker de Hypercorn importa el módulo en su propio proceso y crea su propio cliente
+client = AsyncMongoClient(MONGODB_URI, event_listeners=metricas.listeners_mongo(), **opciones_mongo())
+db = client['jv_chatbot_mvp']
+
+# Límite por teléfono, cédula e IP y tope de concurrencia (ver limites.py), con el driver asíncrono
+limitador = limites.Limitador(limites.crear_almacen(db, asincrono=True))
+limites.registrar(app, request, limitador, asincrono=True)
+metricas.recolectores.append(limitador.metricas)
+metricas.recolectores.append(coalescencia.metricas_coalescencia)
+
+asignador_pedidos = AsignadorNumerosAsync(db, "pedidos", PEDIDOS_BLOQUE_NUMEROS)
+
+# Lecturas por llave que comparten la consulta en curso (ver coalescencia.py)
+lecturas = coalescencia.CoalescedorAsync()
+
+# Evita que varias solicitudes reconstruyan el mismo índice a la vez
+lock_indice_productos = asyncio.Lock()
+lock_indice_faqs = asyncio.Lock()
+
+class EscritorConversacionesAsync(EscritorConversacionesBase):
+    """Encola conversaciones y las escribe con insert_many desde una tarea del loop de eventos."""
+
+    def __init__(self, db, max_cola, lote, intervalo):
+        super().__init__(db, asyncio.Queue(maxsize=max_cola), lote, intervalo)
+        self._detener = asyncio.Event()
+        self._tarea = None
+
+    def iniciar(self):
+        self._tarea = asyncio.ensure_future(self._ejecutar())
+
+    # Sin espera para no bloquear el loop de eventos
+    def encolar(self, conversacion):
+        self._agregar_pendiente(conversacion)
+        try:
+            self._cola.put_nowait(conversacion)
+        except asyncio.QueueFull:
+            self._rechazar(conversacion)
+        self._contar_encolada()
+
+    async def _tomar_lote(self):
+        try:
+            lote = [await asyncio.wait_for(self._cola.get(), self.intervalo)]
+        except asyncio.TimeoutError:
+            return []
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + self.intervalo
+        while len(lote) < self.lote:
+            restante = limite - loop.time()
+            if restante <= 0 and self._cola.empty():
+                break
+            try:
+                lote.append(await asyncio.wait_for(self._cola.get(), restante) if restante > 0 else self._cola.get_nowait())
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+        return lote
+
+    async def _insertar(self, lote):
+        if usa_buckets():
+            return await escribir_buckets_async(self.db, lote)
+        await self.db.conversations.insert_many(lote, ordered=False)
+        return 0
+
+    async def _escribir(self, lote):
+        try:
+            resultado = await self._insertar(lote)
+        except Exception as e:
+            resultado = e
+        await analitica.registrar_conversaciones_async(self.db, self._terminar_lote(lote, resultado))
+
+    async def _ejecutar(self):
+        while not self._detener.is_set() or not self._cola.empty():
+            lote = await self._tomar_lote()
+            if lote:
+                await self._escribir(lote)
+
+    async def detener(self, timeout=10):
+        # Vaciar la cola antes de cerrar el cliente
+        self._detener.set()
+        if self._tarea is not None:
+            try:
+                await asyncio.wait_for(self._tarea, timeout)
+            except asyncio.TimeoutError:
+                logger.error("La cola de conversaciones no se vació antes de cerrar")
+
+escritor_conversaciones = None
+if CONVERSACIONES_WRITE_BEHIND:
+    escritor_conversaciones = EscritorConversacionesAsync(
+        db, CONVERSACIONES_COLA_MAX, CONVERSACIONES_LOTE, CONVERSACIONES_INTERVALO
+    )
+
+metricas.recolectores.append(recolector_cache_y_cola(escritor_conversaciones))
+metricas.recolectores.append(estado_arranque.metricas)
+
+# Verificar al iniciar que los índices coincidan con el manifiesto de indices.py
+async def verificar_indices_al_iniciar():
+    try:
+        avisar_diferencias_indices(await verificar_indices_async(db))
+    except Exception as e:
+        logger.error("No se pudieron verificar los índices: %s", e)
+
+# Escuchar el change stream de productos para invalidar la caché (requiere replica set)
+async def vigilar_catalogo():
+    while True:
+        try:
+            async with await db.products.watch(full_document='updateLookup') as stream:
+                async for cambio in stream:
+                    aplicar_cambio_producto(cambio)
+        except Exception as e:
+            logger.error("Error en el change stream de productos: %s", e)
+            cache_catalogo.limpiar()
+            await asyncio.sleep(5)
+
+# Escuchar el change stream de FAQs para reconstruir la matriz en la siguiente consulta
+async def vigilar_faqs():
+    while True:
+        try:
+            async with await db.faqs.watch() as stream:
+                async for _ in stream:
+                    indice_faqs.marcar_sucio()
+        except Exception as e:
+            logger.error("Error en el change stream de FAQs: %s", e)
+            indice_faqs.marcar_sucio()
+            await asyncio.sleep(5)
+
+# Tareas del loop que no terminan solas; se cancelan al apagar el worker
+tareas_segundo_plano = []
+
+# Verificación de índices, change streams, escritura diferida y calentamiento del proceso actual
+@app.before_serving
+async def iniciar():
+    cargar_snapshot(estado_arranque)
+    if VERIFICAR_INDICES:
+        app.add_background_task(verificar_indices_al_iniciar)
+    if CATALOGO_CHANGE_STREAM:
+        tareas_segundo_plano.append(asyncio.ensure_future(vigilar_catalogo()))
+    if FAQS_CHANGE_STREAM:
+        tareas_segundo_plano.append(asyncio.ensure_future(vigilar_faqs()))
+    if escritor_conversaciones is not None:
+        escritor_conversaciones.iniciar()
+    estado_arranque.marcar("segundo_plano")
+
+    if arranque.ARRANQUE_CALENTAR:
+        app.add_background_task(calentar)
+    else:
+        estado_arranque.terminar()
+
+# Abrir la conexión a MongoDB y reemplazar el snapshot por el catálogo vigente; al terminar,
+# /readyz pasa a 200. Se reintenta hasta que MongoDB responda.
+async def calentar():
+    while True:
+        try:
+            with estado_arranque.medir("calentamiento_mongo"):
+                await db.command("ping")
+            with estado_arranque.medir("calentamiento_catalogo"):
+                productos = await db.products.find({}, PROYECCION_PRODUCTO).to_list()
+                faqs = await db.faqs.find().to_list()
+                cargar_catalogo(productos, faqs)
+            break
+        except Exception as e:
+            logger.error("Error en el calentamiento: %s", e)
+            await asyncio.sleep(arranque.ARRANQUE_REINTENTO)
+    estado_arranque.terminar()
+
+@app.after_serving
+async def cerrar_conexion():
+    for tarea in tareas_segundo_plano:
+        tarea.cancel()
+    if escritor_conversaciones is not None:
+        await escritor_conversaciones.detener()
+    await client.close()
+
+async def paginar(coleccion, filtro, orden, limite, cursor=None, proyeccion=None):
+    if cursor:
+        filtro = {"$and": [filtro, filtro_despues_de(orden, decodificar_cursor(cursor, orden))]}
+
+    documentos = await coleccion.find(filtro, con_llaves(proyeccion, orden)).sort(orden).limit(limite + 1).to_list()
+    return cortar_pagina(documentos, limite, orden)
+
+async def stock_actual(codigos):
+    stocks = {}
+    faltantes = []
+    for codigo in codigos:
+        stock = cache_catalogo.obtener(("stock", codigo))
+        if stock is None:
+            faltantes.append(codigo)
+        else:
+            stocks[codigo] = stock
+
+    if faltantes:
+        async for producto in db.products.find({"codigo": {"$in": faltantes}}, {"_id": 0, "codigo": 1, "stock": 1}):
+            stocks[producto["codigo"]] = producto.get("stock", 0)
+            cache_catalogo.guardar(("stock", producto["codigo"]), producto.get("stock", 0), cache_catalogo.ttl_stock)
+
+    return stocks
+
+async def con_stock_actual(productos):
+    stocks = await stock_actual([producto["codigo"] for producto in productos])
+    return [dict(producto, stock=stocks.get(producto["codigo"], producto.get("stock", 0))) for producto in productos]
+
+async def stock_producto(codigo):
+    stock = cache_catalogo.obtener(("stock", codigo))
+    if stock is None:
+        stock = await lecturas.ejecutar(("stock", codigo), lambda: leer_stock_actual(codigo))
+    return stock
+
+async def leer_stock_actual(codigo):
+    return (await stock_actual([codigo])).get(codigo)
+
+async def leer_producto(codigo):
+    producto = await db.products.find_one({"codigo": codigo}, PROYECCION_PRODUCTO)
+    if producto:
+        cache_catalogo.guardar(("producto", codigo), producto)
+        cache_catalogo.guardar(("stock", codigo), producto.get("stock", 0), cache_catalogo.ttl_stock)
+    return producto
+
+async def leer_stock_producto(codigo):
+    producto = await db.products.find_one({"codigo": codigo}, {"_id": 0, "codigo": 1, "nombre": 1, "stock": 1})
+    if producto:
+        cache_catalogo.guardar(("stock", codigo), producto.get("stock", 0), cache_catalogo.ttl_stock)
+    return producto
+
+async def resolver_productos(codigos):
+    codigos = list({codigo for codigo in codigos if codigo})
+    if not codigos:
+        return {}
+
+    productos = db.products.find(
+        {"codigo": {"$in": codigos}},
+        {"_id": 0, "codigo": 1, "nombre": 1, "precio": 1, "categoria": 1}
+    )
+    return {producto["codigo"]: producto async for producto in productos}
+
+async def reservar_stock(pedidos):
+    plan = planear_reserva(pedidos)
+    if not plan:
+        return {}
+
+    try:
+        resultado = await db.products.bulk_write(operaciones_reserva(plan), ordered=False)
+        if resultado.modified_count == len(plan):
+            aplicadas = {reserva["marca"] for reserva in plan}
+        else:
+            aplicadas = marcas_aplicadas(await db.products.find(*lectura_reserva(plan)).to_list())
+        rechazados = repartir_reserva(plan, aplicadas)
+        await db.products.bulk_write(operaciones_cierre_reserva(plan, rechazados))
+    except Exception:
+        await cancelar_reserva(plan)
+        raise
+    finally:
+        invalidar_stock(codigos_reserva(plan))
+    return rechazados
+
+async def cancelar_reserva(plan):
+    try:
+        await db.products.bulk_write(operaciones_devolucion(plan), ordered=False)
+    except Exception as e:
+        logger.error("No se pudo devolver el stock de una reserva fallida: %s", e)
+
+async def liberar_stock(pedidos):
+    devoluciones = devoluciones_pedidos(pedidos)
+    if devoluciones:
+        await db.products.bulk_write(operaciones_liberacion(devoluciones), ordered=False)
+        invalidar_stock({codigo for codigo, _ in devoluciones})
+
+async def asegurar_indice_productos():
+    if indice_productos.vencido():
+        async with lock_indice_productos:
+            if indice_productos.vencido():
+                indice_productos.reconstruir(await db.products.find({}, PROYECCION_PRODUCTO).to_list())
+    return indice_productos
+
+async def asegurar_indice_faqs():
+    if indice_faqs.vencido():
+        async with lock_indice_faqs:
+            if indice_faqs.vencido():
+                indice_faqs.reconstruir(await db.faqs.find().to_list())
+    return indice_faqs
+
+# Endpoint para validar usuario por cédula
+@app.route('/api/usuarios/validar', methods=['POST'])
+async def validar_usuario():
+    try:
+        data = await request.get_json()
+        logger.debug("Validando datos: %s", data)
+
+        cedula = data.get('cedula')
+        logger.info("Validando usuario", extra={"cedula": cedula})
+
+        if not cedula:
+            return jsonify({"error": "Se requiere cédula"}), 400
+
+        usuario = await db.users.find_one({"cedula": cedula})
+
+        if usuario:
+            return jsonify({"success": True, "usuario": parse_json(filtrar_usuario(usuario))})
+        else:
+            return jsonify({"success": False, "mensaje": "Usuario no encontrado"}), 404
+    except Exception as e:
+        logger.error("Error en la validación de usuario: %s", e)
+        return jsonify({"error": "Error al validar usuario"}), 500
+
+# Endpoint para obtener datos de un usuario
+@app.route('/api/usuarios/<cedula>', methods=['GET'])
+async def obtener_usuario(cedula):
+    try:
+        proyeccion = leer_proyeccion("users", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        logger.info("Consultando usuario", extra={"cedula": cedula})
+        usuario = await lecturas.ejecutar(
+            ("usuario", cedula, llave_proyeccion(proyeccion)), lambda: db.users.find_one({"cedula": cedula}, proyeccion)
+        )
+
+        if usuario:
+            return jsonify({"success": True, "usuario": parse_json(usuario)})
+        else:
+            return jsonify({"success": False, "mensaje": "Usuario no encontrado"}), 404
+    except Exception as e:
+        logger.error("Error al obtener datos de usuario: %s", e)
+        return jsonify({"error": "Error al obtener datos de usuario"}), 500
+
+# Endpoint para obtener todos los pedidos de un usuario
+@app.route('/api/pedidos/usuario/<cedula>', methods=['GET'])
+async def obtener_pedidos_usuario(cedula):
+    limite, cursor = leer_paginacion(request.args)
+    try:
+        proyeccion = leer_proyeccion("orders", request.args)
+        pedidos, siguiente = await paginar(db.orders, {"cedula_cliente": cedula}, ORDEN_POR_ID, limite, cursor, proyeccion)
+    except (CursorInvalido, CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if pedidos or cursor:
+        return jsonify({"success": True, "pedidos": parse_json(pedidos), "next_cursor": siguiente})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron pedidos para este usuario"}), 404
+
+# Endpoint para obtener un pedido específico
+@app.route('/api/pedidos/<numero_pedido>', methods=['GET'])
+async def obtener_pedido(numero_pedido):
+    try:
+        proyeccion = leer_proyeccion("orders", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    pedido = await lecturas.ejecutar(
+        ("pedido", numero_pedido, llave_proyeccion(proyeccion)),
+        lambda: db.orders.find_one({"numero_pedido": numero_pedido}, proyeccion)
+    )
+
+    if pedido:
+        return jsonify({"success": True, "pedido": parse_json(pedido)})
+    else:
+        return jsonify({"success": False, "mensaje": "Pedido no encontrado"}), 404
+
+# Endpoint para buscar productos por categoría
+@app.route('/api/productos/categoria/<categoria>', methods=['GET'])
+async def productos_por_categoria(categoria):
+    limite, cursor = leer_paginacion(request.args)
+    try:
+        proyeccion = con_llaves(leer_proyeccion("products", request.args), ORDEN_POR_ID)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    pagina = cache_catalogo.obtener(("categoria", categoria, cursor, limite))
+    if pagina is None:
+        try:
+            pagina = await paginar(
+                db.products, {"categoria": categoria}, ORDEN_POR_ID, limite, cursor, PROYECCION_PRODUCTO
+            )
+        except CursorInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        cache_catalogo.guardar(("categoria", categoria, cursor, limite), pagina)
+
+    productos, siguiente = pagina
+    productos = [proyectar(producto, proyeccion) for producto in await con_stock_actual(productos)]
+
+    if productos or cursor:
+        return jsonify({"success": True, "productos": parse_json(productos), "next_cursor": siguiente})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron productos en esta categoría"}), 404
+
+# Endpoint para buscar productos por nombre, categoría, descripción o especificaciones
+@app.route('/api/productos/buscar', methods=['GET'])
+async def buscar_productos():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), BUSQUEDA_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    if not query:
+        return jsonify({"error": "Se requiere un término de búsqueda"}), 400
+
+    try:
+        proyeccion = leer_proyeccion("products", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    total, resultados = (await asegurar_indice_productos()).buscar(query, limit, offset)
+    productos = [proyectar(producto, proyeccion) for producto in await con_stock_actual([producto for producto, _ in resultados])]
+    for producto, (_, puntaje) in zip(productos, resultados):
+        producto["relevancia"] = round(puntaje, 4)
+
+    if productos:
+        return jsonify({"success": True, "total": total, "productos": parse_json(productos)})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron productos que coincidan con la búsqueda"}), 404
+
+# Endpoint para obtener productos disponibles
+@app.route('/api/productos/disponibles', methods=['GET'])
+async def productos_disponibles():
+    limite, cursor = leer_paginacion(request.args)
+    try:
+        proyeccion = con_llaves(leer_proyeccion("products", request.args), ORDEN_POR_ID)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    pagina = cache_catalogo.obtener(("disponibles", cursor, limite))
+    if pagina is None:
+        try:
+            pagina = await paginar(
+                db.products, {"estado": "disponible", "stock": {"$gt": 0}}, ORDEN_POR_ID, limite, cursor,
+                PROYECCION_PRODUCTO
+            )
+        except CursorInvalido as e:
+            return jsonify({"error": str(e)}), 400
+        cache_catalogo.guardar(("disponibles", cursor, limite), pagina, cache_catalogo.ttl_stock)
+
+    productos, siguiente = pagina
+    productos = [proyectar(producto, proyeccion) for producto in productos]
+
+    if productos or cursor:
+        return jsonify({"success": True, "productos": parse_json(productos), "next_cursor": siguiente})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron productos disponibles"}), 404
+
+# Endpoint para verificar stock de un producto
+@app.route('/api/productos/stock/<codigo>', methods=['GET'])
+async def verificar_stock(codigo):
+    try:
+        proyeccion = leer_proyeccion("stock", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    producto = cache_catalogo.obtener(("producto", codigo))
+    if producto is not None:
+        stock = await stock_producto(codigo)
+        producto = {
+            "codigo": producto["codigo"],
+            "nombre": producto.get("nombre"),
+            "stock": producto.get("stock", 0) if stock is None else stock
+        }
+    else:
+        producto = await lecturas.ejecutar(("stock", codigo, "nombre"), lambda: leer_stock_producto(codigo))
+
+    if producto:
+        return jsonify({"success": True, "stock": parse_json(proyectar(producto, proyeccion))})
+    else:
+        return jsonify({"success": False, "mensaje": "Producto no encontrado"}), 404
+
+# Endpoint para buscar un producto por código
+@app.route('/api/productos/<codigo>', methods=['GET'])
+async def obtener_producto(codigo):
+    try:
+        proyeccion = leer_proyeccion("products", request.args)
+    except CamposInvalidos as e:
+        return jsonify({"error": str(e)}), 400
+
+    producto = cache_catalogo.obtener(("producto", codigo))
+    if producto is None:
+        producto = await lecturas.ejecutar(("producto", codigo), lambda: leer_producto(codigo))
+    else:
+        stock = await stock_producto(codigo)
+        producto = dict(producto, stock=producto.get("stock", 0) if stock is None else stock)
+
+    if producto:
+        return jsonify({"success": True, "producto": parse_json(proyectar(producto, proyeccion))})
+    else:
+        return jsonify({"success": False, "mensaje": "Producto no encontrado"}), 404
+
+# Endpoint para obtener preguntas frecuentes
+@app.route('/api/faqs', methods=['GET'])
+async def obtener_faqs():
+    categoria = request.args.get('categoria')
+    limite, cursor = leer_paginacion(request.args)
+
+    filtro = {"categoria": categoria} if categoria else {}
+    try:
+        proyeccion = leer_proyeccion("faqs", request.args)
+        faqs, siguiente = await paginar(db.faqs, filtro, ORDEN_POR_ID, limite, cursor, proyeccion)
+    except (CursorInvalido, CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if faqs or cursor:
+        return jsonify({"success": True, "faqs": parse_json(faqs), "next_cursor": siguiente})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron preguntas frecuentes"}), 404
+
+# Endpoint para buscar las preguntas frecuentes más parecidas a uno o varios mensajes
+@app.route('/api/faqs/buscar', methods=['GET', 'POST'])
+async def buscar_faqs():
+    if request.method == 'POST':
+        data = await request.get_json() or {}
+        consultas, k = data.get('consultas') or [], data.get('k', 3)
+    else:
+        consultas, k = [request.args.get('q', '')], request.args.get('k', 3, type=int)
+
+    try:
+        consultas, k = validar_consultas_faqs(consultas, k)
+        proyeccion = leer_proyeccion("faqs", request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resultados = resultados_faqs(await asegurar_indice_faqs(), consultas, k, proyeccion)
+
+    if request.method == 'POST':
+        return jsonify({"success": True, "resultados": parse_json(resultados)})
+
+    if resultados[0]:
+        return jsonify({"success": True, "faqs": parse_json(resultados[0])})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron preguntas frecuentes relacionadas"}), 404
+
+# Endpoint para crear un nuevo pedido (simulación)
+@app.route('/api/pedidos/crear', methods=['POST'])
+async def crear_pedido():
+    data = await request.get_json()
+
+    if not data.get('cedula_cliente') or not data.get('items'):
+        return jsonify({"error": "Se requiere cédula del cliente e items del pedido"}), 400
+
+    error = validar_items(data['items'])
+    if error:
+        return jsonify({"error": error}), 400
+
+    productos_por_codigo = await resolver_productos(
+        item.get('codigo_producto') for item in data.get('items', [])
+    )
+    nuevo_pedido = construir_pedido(data, productos_por_codigo, await asignador_pedidos.siguiente())
+
+    rechazados = await reservar_stock([nuevo_pedido])
+    if rechazados:
+        return jsonify({
+            "success": False,
+            "error": mensaje_sin_stock(rechazados[0]),
+            "productos_sin_stock": rechazados[0]
+        }), 409
+
+    try:
+        await db.orders.insert_one(nuevo_pedido)
+    except Exception:
+        await liberar_stock([nuevo_pedido])
+        raise
+    await analitica.registrar_pedidos_async(db, [nuevo_pedido])
+
+    return jsonify({
+        "success": True,
+        "mensaje": "Pedido creado exitosamente",
+        "pedido": parse_json(nuevo_pedido)
+    })
+
+# Endpoint para crear varios pedidos en una sola solicitud
+@app.route('/api/pedidos/crear/lote', methods=['POST'])
+async def crear_pedidos_lote():
+    data = await request.get_json() or {}
+    pedidos = data.get('pedidos')
+
+    if not isinstance(pedidos, list) or not pedidos:
+        return jsonify({"error": "Se requiere una lista de pedidos"}), 400
+
+    if len(pedidos) > MAX_PEDIDOS_LOTE:
+        return jsonify({"error": f"Se permiten máximo {MAX_PEDIDOS_LOTE} pedidos por solicitud"}), 400
+
+    resultados, codigos = validar_pedidos_lote(pedidos)
+    numeros = await asignador_pedidos.siguientes(pedidos_validos(resultados))
+    nuevos_pedidos, indices = construir_pedidos_lote(pedidos, resultados, await resolver_productos(codigos), numeros)
+    nuevos_pedidos, indices = descartar_sin_stock(nuevos_pedidos, indices, resultados, await reservar_stock(nuevos_pedidos))
+
+    errores = {}
+    if nuevos_pedidos:
+        try:
+            await db.orders.insert_many(nuevos_pedidos, ordered=False)
+        except BulkWriteError as e:
+            errores = errores_bulk(e)
+            await liberar_stock([nuevos_pedidos[posicion] for posicion in errores])
+    await analitica.registrar_pedidos_async(db, pedidos_insertados(nuevos_pedidos, errores))
+
+    return jsonify(resumen_lote(pedidos, resultados, nuevos_pedidos, indices, errores))
+
+# Endpoint para actualizar estado de un pedido
+@app.route('/api/pedidos/actualizar/<numero_pedido>', methods=['PUT'])
+async def actualizar_pedido(numero_pedido):
+    data = await request.get_json()
+    nuevo_estado = data.get('estado')
+
+    if not nuevo_estado:
+        return jsonify({"error": "Se requiere el nuevo estado"}), 400
+
+    if nuevo_estado not in ESTADOS_PEDIDO:
+        return jsonify({"error": f"Estado no válido. Debe ser uno de: {', '.join(ESTADOS_PEDIDO)}"}), 400
+
+    actualizacion = actualizacion_estado(nuevo_estado, data.get('numero_guia'))
+
+    anterior = await db.orders.find_one_and_update(
+        *operacion_actualizacion(numero_pedido, nuevo_estado, actualizacion),
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if anterior is None:
+        actual = await db.orders.find_one({"numero_pedido": numero_pedido}, {"_id": 0, "estado": 1})
+        if actual is None:
+            return jsonify({"success": False, "mensaje": "No se pudo actualizar el pedido o no existe"}), 404
+        return jsonify({"success": False, "mensaje": mensaje_transicion_invalida(actual.get('estado'), nuevo_estado)}), 409
+
+    coalescencia.olvidar("pedido", numero_pedido)
+
+    if nuevo_estado == "cancelado" and anterior.get("stock_reservado"):
+        await liberar_stock([anterior])
+    await analitica.registrar_transiciones_async(db, [(anterior, nuevo_estado)])
+
+    return jsonify({
+        "success": True,
+        "mensaje": "Pedido actualizado exitosamente",
+        "pedido": parse_json(dict(anterior, **actualizacion))
+    })
+
+# Endpoint para actualizar el estado de muchos pedidos a la vez (integración de logística)
+@app.route('/api/pedidos/actualizar/lote', methods=['POST'])
+async def actualizar_pedidos_lote():
+    data = await request.get_json() or {}
+    actualizaciones = data.get('actualizaciones')
+
+    if not isinstance(actualizaciones, list) or not actualizaciones:
+        return jsonify({"error": "Se requiere una lista de actualizaciones"}), 400
+
+    if len(actualizaciones) > MAX_ACTUALIZACIONES_LOTE:
+        return jsonify({"error": f"Se permiten máximo {MAX_ACTUALIZACIONES_LOTE} actualizaciones por solicitud"}), 400
+
+    resultados, numeros = validar_actualizaciones_lote(actualizaciones)
+
+    actuales = {}
+    if numeros:
+        async for pedido in db.orders.find({"numero_pedido": {"$in": numeros}}, PROYECCION_TRANSICION):
+            actuales[pedido["numero_pedido"]] = pedido
+    planes = planear_transiciones(actualizaciones, resultados, actuales)
+
+    # Un solo bulk_write con las escrituras condicionadas de todos los pedidos. Si no coincidieron
+    # todas, una sola lectura dice qué pedidos no quedaron en el estado destino.
+    fallidas = set()
+    if planes:
+        resultado = await db.orders.bulk_write(operaciones_transicion(planes), ordered=False)
+        if resultado.matched_count != len(planes):
+            documentos = await db.orders.find(*lectura_transiciones(planes)).to_list()
+            fallidas = transiciones_fallidas(planes, documentos)
+    for numero in numeros:
+        coalescencia.olvidar("pedido", numero)
+
+    cancelados = resultado_transiciones(planes, resultados, fallidas)
+    await liberar_stock(cancelados)
+    await analitica.registrar_transiciones_async(db, transiciones_aplicadas(planes, fallidas))
+
+    return jsonify(resumen_transiciones(resultados))
+
+# Endpoint para guardar una conversación
+@app.route('/api/conversaciones/guardar', methods=['POST'])
+async def guardar_conversacion():
+    data = await request.get_json()
+
+    if not data.get('phone_number') or not data.get('mensaje'):
+        return jsonify({"error": "Se requiere número de teléfono y mensaje"}), 400
+
+    conversacion = construir_conversacion(data)
+    if escritor_conversaciones is not None:
+        conversacion["timestamp"] = truncar_a_milisegundos(conversacion["timestamp"])
+        try:
+            escritor_conversaciones.encolar(conversacion)
+        except ColaLlena as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    elif usa_buckets():
+        if await escribir_buckets_async(db, [conversacion]):
+            return jsonify({"error": "Error al guardar la conversación"}), 500
+        await analitica.registrar_conversaciones_async(db, [conversacion])
+    else:
+        await db.conversations.insert_one(conversacion)
+        await analitica.registrar_conversaciones_async(db, [conversacion])
+
+    return jsonify({
+        "success": True,
+        "mensaje": "Conversación guardada exitosamente",
+        "conversacion": parse_json(conversacion)
+    })
+
+# Endpoint para consultar el estado de la escritura diferida de conversaciones
+@app.route('/api/conversaciones/cola', methods=['GET'])
+async def estado_cola_conversaciones():
+    if escritor_conversaciones is None:
+        return jsonify({"success": True, "cola": {"habilitado": False}})
+    return jsonify({"success": True, "cola": escritor_conversaciones.estadisticas()})
+
+async def paginar_conversaciones(phone_number, limite, cursor, proyeccion):
+    if not usa_buckets():
+        return await paginar(
+            db.conversations, {"phone_number": phone_number}, ORDEN_CONVERSACIONES, limite, cursor, proyeccion
+        )
+    valores = decodificar_cursor(cursor, ORDEN_CONVERSACIONES) if cursor else None
+    turnos = await leer_buckets_async(db, phone_number, limite, valores, proyeccion)
+    return cortar_pagina(turnos, limite, ORDEN_CONVERSACIONES)
+
+# Endpoint para obtener conversaciones de un usuario
+@app.route('/api/conversaciones/<phone_number>', methods=['GET'])
+async def obtener_conversaciones(phone_number):
+    limite, cursor = leer_paginacion(request.args, 10)
+
+    try:
+        proyeccion = leer_proyeccion("conversations", request.args)
+        conversaciones, siguiente = await paginar_conversaciones(phone_number, limite, cursor, proyeccion)
+        conversaciones, siguiente = combinar_pendientes(escritor_conversaciones, phone_number, conversaciones, siguiente, limite, cursor)
+    except (CursorInvalido, CamposInvalidos) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Las conversaciones que siguen en la cola de escritura llegan completas
+    proyeccion = con_llaves(proyeccion, ORDEN_CONVERSACIONES)
+    conversaciones = [proyectar(conversacion, proyeccion) for conversacion in conversaciones]
+
+    if conversaciones or cursor:
+        return jsonify({"success": True, "conversaciones": parse_json(conversaciones), "next_cursor": siguiente})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron conversaciones para este usuario"}), 404
+
+# Endpoint para leer las conversaciones archivadas de un usuario entre dos fechas (AAAA-MM-DD)
+@app.route('/api/conversaciones/<phone_number>/archivo', methods=['GET'])
+async def obtener_conversaciones_archivadas(phone_number):
+    try:
+        desde, hasta = rango_archivo(request.args.get('desde'), request.args.get('hasta'))
+        proyeccion = leer_proyeccion("conversations", request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Leer y descomprimir los archivos fuera del loop de eventos
+    archivadas = await asyncio.to_thread(leer_archivo, phone_number, desde, hasta)
+    conversaciones = [proyectar(conversacion, proyeccion) for conversacion in archivadas]
+
+    if conversaciones:
+        return jsonify({"success": True, "conversaciones": parse_json(conversaciones)})
+    else:
+        return jsonify({"success": False, "mensaje": "No se encontraron conversaciones archivadas en esas fechas"}), 404
+
+# Endpoint con todo lo que el bot necesita al iniciar una sesión, en una sola consulta
+@app.route('/api/sesion/contexto', methods=['POST'])
+async def contexto_sesion():
+    data = await request.get_json() or {}
+    cedula = data.get('cedula')
+    phone_number = data.get('phone_number')
+
+    if not cedula or not phone_number:
+        return jsonify({"error": "Se requiere cédula y número de teléfono"}), 400
+
+    try:
+        pedidos = leer_limite_sesion(data.get('pedidos'), SESION_PEDIDOS)
+        conversaciones = leer_limite_sesion(data.get('conversaciones'), SESION_CONVERSACIONES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = await db.users.aggregate(pipeline_contexto_sesion(cedula, phone_number, pedidos, conversaciones))
+    documentos = await cursor.to_list(1)
+
+    if not documentos:
+        return jsonify({"success": False, "mensaje": "Usuario no encontrado"}), 404
+
+    return jsonify(armar_contexto_sesion(escritor_conversaciones, documentos[0], phone_number, conversaciones))
+
+# Endpoint para obtener información de la empresa (para preguntas frecuentes)
+@app.route('/api/empresa/info', methods=['GET'])
+async def obtener_info_empresa():
+    return respuesta_info_empresa.responder(app, request, cache_http.RUTAS_CACHEABLES["obtener_info_empresa"])
+
+# Endpoints de analítica sobre los documentos de resumen de analitica.py
+@app.route('/api/analitica/ventas', methods=['GET'])
+async def analitica_ventas():
+    try:
+        desde, hasta = analitica.rango_dias(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filtro = analitica.filtro_dias(desde, hasta)
+    if request.args.get('categoria'):
+        filtro["categoria"] = request.args['categoria']
+    documentos = await db[analitica.VENTAS].find(filtro, {"_id": 0}).sort("dia", 1).to_list()
+    return jsonify({"success": True, "desde": desde.isoformat(), "hasta": hasta.isoformat(), **analitica.resumen_ventas(documentos)})
+
+@app.route('/api/analitica/pedidos', methods=['GET'])
+async def analitica_pedidos():
+    return jsonify({"success": True, **analitica.resumen_pedidos(await db[analitica.PEDIDOS].find().to_list())})
+
+@app.route('/api/analitica/conversaciones', methods=['GET'])
+async def analitica_conversaciones():
+    try:
+        desde, hasta = analitica.rango_dias(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    documentos = await db[analitica.CONVERSACIONES].find(analitica.filtro_dias(desde, hasta), {"_id": 0}).sort("dia", 1).to_list()
+    return jsonify({"success": True, "desde": desde.isoformat(), "hasta": hasta.isoformat(), **analitica.resumen_conversaciones(documentos)})
+
+# Liveness: el proceso responde; no toca MongoDB
+@app.route('/healthz', methods=['GET'])
+async def salud_vivo():
+    return jsonify({"success": True, "estado": "vivo"})
+
+# Readiness: el worker terminó de calentar y hay un servidor de MongoDB disponible según el monitoreo del cliente
+@app.route('/readyz', methods=['GET'])
+async def salud_listo():
+    cuerpo, codigo = respuesta_listo(*estado_conexion(client), estado_arranque.resumen())
+    return jsonify(cuerpo), codigo
+
+if __name__ == '__main__':
+    import hypercorn.asyncio
+    import hypercorn.config
+
+    config = hypercorn.config.Config()
+    config.bind = [f"0.0.0.0:{os.getenv('PORT', '5000')}"]
+    asyncio.run(hypercorn.asyncio.serve(app, config))
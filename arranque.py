@@ -0,0 +1,146 @@
+# Arranque rápido de cada worker en Cloud Run
+#
+# - Fases del arranque medidas con perf_counter: importaciones, módulo, snapshot, segundo plano y
+#   calentamiento. Se publican en /readyz, en /metrics y en el log al terminar el calentamiento.
+# - Snapshot del catálogo y las FAQs generado al construir la imagen. Al arrancar se carga en memoria
+#   para que las primeras búsquedas no esperen a MongoDB; el calentamiento lo reemplaza por los datos
+#   vigentes apenas conecta. Sus entradas vencen a los ARRANQUE_SNAPSHOT_TTL segundos y el stock
+#   nunca sale del snapshot.
+# - /readyz responde 503 hasta que termina el calentamiento.
+#
+# Uso (en cloudbuild.yaml, antes del docker build):
+#   python arranque.py snapshot [--salida snapshot_catalogo.json.gz]
+import argparse
+import contextlib
+import gzip
+import logging
+import os
+import threading
+import time
+
+ARRANQUE_SNAPSHOT = os.getenv("ARRANQUE_SNAPSHOT", "snapshot_catalogo.json.gz")
+ARRANQUE_CALENTAR = os.getenv("ARRANQUE_CALENTAR", "1") == "1"
+ARRANQUE_REINTENTO = float(os.getenv("ARRANQUE_REINTENTO", 2))
+# Segundos que se sirven las entradas del snapshot antes de volver a leerlas de MongoDB
+ARRANQUE_SNAPSHOT_TTL = float(os.getenv("ARRANQUE_SNAPSHOT_TTL", 30))
+
+logger = logging.getLogger("dummuy_api")
+
+# Segundos entre el inicio del proceso (o el fork del worker) y ahora, según /proc; None fuera de Linux
+def segundos_desde_inicio_proceso():
+    try:
+        with open("/proc/self/stat") as archivo:
+            # El campo 22 (starttime) cuenta desde el final del nombre del proceso, que puede tener espacios
+            inicio = int(archivo.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as archivo:
+            uptime = float(archivo.read().split()[0])
+        return max(uptime - inicio / os.sysconf("SC_CLK_TCK"), 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Arranque:
+    """Duración de cada fase del arranque del proceso y estado del calentamiento."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self._ultimo = self.inicio
+        self._lock = threading.Lock()
+        self.fases = {}
+        self.listo = threading.Event()
+        # Intérprete y fork: lo que pasó antes de importar este módulo
+        previo = segundos_desde_inicio_proceso()
+        if previo is not None:
+            self.fases["proceso"] = previo
+
+    # Fase secuencial: desde la marca anterior hasta ahora
+    def marcar(self, fase):
+        with self._lock:
+            ahora = time.perf_counter()
+            self.fases[fase] = ahora - self._ultimo
+            self._ultimo = ahora
+
+    # Fase que corre en segundo plano, medida por separado
+    @contextlib.contextmanager
+    def medir(self, fase):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.fases[fase] = time.perf_counter() - inicio
+
+    def terminar(self):
+        if not self.listo.is_set():
+            self.listo.set()
+            logger.info("Arranque completo", extra={"arranque": self.resumen()})
+
+    def resumen(self):
+        with self._lock:
+            fases = dict(self.fases)
+        return {
+            "listo": self.listo.is_set(),
+            "segundos_desde_inicio": round(time.perf_counter() - self.inicio, 3),
+            "fases_ms": {fase: round(segundos * 1000, 1) for fase, segundos in fases.items()}
+        }
+
+    def metricas(self):
+        with self._lock:
+            fases = sorted(self.fases.items())
+        lineas = ["# HELP arranque_fase_segundos Duración de cada fase del arranque del worker",
+                  "# TYPE arranque_fase_segundos gauge"]
+        lineas.extend(f'arranque_fase_segundos{{fase="{fase}"}} {segundos}' for fase, segundos in fases)
+        lineas.append("# TYPE arranque_listo gauge")
+        lineas.append(f"arranque_listo {int(self.listo.is_set())}")
+        return lineas
+
+# Snapshot: productos y FAQs en un JSON comprimido, con los tipos BSON de json_util.
+# bson y pymongo se importan dentro de las funciones para que importar este módulo, lo primero que
+# hace app.py, no cueste nada y la fase de importaciones quede completa.
+def generar_snapshot(db, salida=ARRANQUE_SNAPSHOT):
+    from bson import json_util
+    snapshot = {
+        "generado": time.time(),
+        # Sin las marcas de las reservas de stock en curso (ver nucleo.py)
+        "productos": list(db.products.find({}, {"reservas": 0})),
+        "faqs": list(db.faqs.find())
+    }
+    temporal = salida + ".tmp"
+    with gzip.open(temporal, "wt", encoding="utf-8") as archivo:
+        archivo.write(json_util.dumps(snapshot, json_options=json_util.RELAXED_JSON_OPTIONS))
+    os.replace(temporal, salida)
+    return len(snapshot["productos"]), len(snapshot["faqs"])
+
+# Devuelve None si no hay snapshot en la imagen o no se puede leer
+def cargar_snapshot(ruta=ARRANQUE_SNAPSHOT):
+    if not ruta or not os.path.exists(ruta):
+        return None
+    from bson import json_util
+    try:
+        with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+            return json_util.loads(archivo.read())
+    except (OSError, ValueError) as e:
+        logger.warning("No se pudo leer el snapshot %s: %s", ruta, e)
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot del catálogo y las FAQs para el arranque")
+    parser.add_argument("accion", choices=["snapshot"])
+    parser.add_argument("--salida", default=ARRANQUE_SNAPSHOT)
+    args = parser.parse_args()
+
+    # Sin MONGODB_URI la imagen se construye sin snapshot y arranca como siempre
+    uri = os.getenv("MONGODB_URI")
+    if not uri:
+        print("MONGODB_URI no está definida; se omite el snapshot")
+        return
+
+    from pymongo import MongoClient
+    client = MongoClient(uri, serverSelectionTimeoutMS=10000, tlsAllowInvalidCertificates=True)
+    try:
+        productos, faqs = generar_snapshot(client['jv_chatbot_mvp'], args.salida)
+        print(f"Snapshot {args.salida}: {productos} productos, {faqs} FAQs")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
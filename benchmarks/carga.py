@@ -0,0 +1,317 @@
+# Prueba de carga reproducible de la API del chatbot
+#
+# Uso:
+#   python benchmarks/carga.py sembrar --usuarios 100000 --pedidos 1000000 --conversaciones 10000000
+#   python benchmarks/carga.py ejecutar --url http://localhost:5000 --duracion 60 --hilos 32
+#   python benchmarks/carga.py comparar benchmarks/resultados/a.json benchmarks/resultados/b.json
+#
+# "sembrar" borra y vuelve a llenar la base de datos con la carga en paralelo de init-db.py, por eso solo
+# acepta una MongoDB local salvo que se pase --forzar. "ejecutar" simula sesiones del chatbot
+# (validar usuario -> pedidos -> búsqueda de productos -> FAQ -> guardar conversación, más consultas
+# ocasionales al resto de rutas) y guarda throughput y latencias p50/p95/p99 por endpoint en JSON.
+#
+# Todas las solicitudes salen de la misma IP, como las del bot. Para medir capacidad, arranque la API
+# con LIMITES_ACTIVOS=0; si no, los 429 del control de admisión (limites.py) se cuentan en "limitadas"
+# y esas solicitudes quedan fuera de las latencias, porque no llegan a MongoDB.
+import argparse
+import datetime
+import http.client
+import importlib.util
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from pymongo import MongoClient
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+MONGODB_URI = os.getenv("MONGODB_URI", 'mongodb://localhost:27017/')
+
+TERMINOS_BUSQUEDA = ["ups", "bateria", "bater", "inversor onda", "gel 12v", "panel", "regulador", "cargador",
+                     "litio", "online 1500"]
+MENSAJES_FAQ = ["que ups necesito para mi computador", "mi ups pita", "cuanto dura la bateria",
+                "metodos de pago", "hacen envios", "horario de atencion", "garantia de los productos",
+                "como instalo la ups"]
+
+# init-db.py tiene un guion en el nombre, así que se carga por ruta. Se registra en sys.modules
+# para que los procesos de la carga en paralelo puedan referenciar sus funciones.
+def cargar_init_db():
+    especificacion = importlib.util.spec_from_file_location("init_db", os.path.join(RAIZ, "init-db.py"))
+    modulo = importlib.util.module_from_spec(especificacion)
+    sys.modules["init_db"] = modulo
+    especificacion.loader.exec_module(modulo)
+    return modulo
+
+def sembrar(args):
+    if "localhost" not in MONGODB_URI and "127.0.0.1" not in MONGODB_URI and not args.forzar:
+        raise SystemExit(f"La siembra borra la base de datos; use --forzar para sembrar {MONGODB_URI}")
+
+    init_db = cargar_init_db()
+    client = MongoClient(MONGODB_URI)
+    try:
+        init_db.sembrar(
+            client, MONGODB_URI,
+            usuarios=args.usuarios, productos=args.productos, pedidos=args.pedidos,
+            conversaciones=args.conversaciones, lote=args.lote, procesos=args.procesos, semilla=args.semilla
+        )
+    finally:
+        client.close()
+
+# Muestras de llaves reales para construir las solicitudes
+def cargar_muestras(db, tamano):
+    def muestra(coleccion, campo):
+        return [d[campo] for d in db[coleccion].aggregate([{"$sample": {"size": tamano}}, {"$project": {campo: 1}}])
+                if d.get(campo)]
+
+    muestras = {
+        "cedulas": muestra("users", "cedula"),
+        "telefonos": muestra("users", "telefono"),
+        "codigos": muestra("products", "codigo"),
+        "categorias": db.products.distinct("categoria"),
+        "pedidos": muestra("orders", "numero_pedido"),
+    }
+    vacias = [nombre for nombre, valores in muestras.items() if not valores]
+    if vacias:
+        raise SystemExit(f"No hay datos para: {', '.join(vacias)}; ejecute primero 'sembrar'")
+    return muestras
+
+class Cliente:
+    """Conexión HTTP persistente de un hilo que registra la latencia de cada solicitud."""
+
+    def __init__(self, url, resultados):
+        partes = urllib.parse.urlsplit(url)
+        self.host = partes.hostname
+        self.puerto = partes.port or 80
+        self.resultados = resultados
+        self.conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=30)
+
+    def solicitar(self, endpoint, metodo, ruta, cuerpo=None):
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+        encabezados = {"Content-Type": "application/json"} if datos else {}
+        inicio = time.perf_counter()
+        try:
+            self.conexion.request(metodo, urllib.parse.quote(ruta, safe="/?=&"), body=datos, headers=encabezados)
+            respuesta = self.conexion.getresponse()
+            contenido = respuesta.read()
+            codigo = respuesta.status
+        except (OSError, http.client.HTTPException):
+            self.conexion.close()
+            self.conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=30)
+            contenido, codigo = b"", 0
+        self.resultados.append((endpoint, time.perf_counter() - inicio, codigo))
+        try:
+            return json.loads(contenido) if contenido else {}
+        except ValueError:
+            return {}
+
+# Consultas ocasionales para cubrir el resto de rutas, con su peso relativo
+def consultas_ocasionales(cliente, muestras, rng):
+    cedula = rng.choice(muestras["cedulas"])
+    codigo = rng.choice(muestras["codigos"])
+    return [
+        (10, lambda: cliente.solicitar("obtener_producto", "GET", f"/api/productos/{codigo}")),
+        (10, lambda: cliente.solicitar("verificar_stock", "GET", f"/api/productos/stock/{codigo}")),
+        (6, lambda: cliente.solicitar("productos_por_categoria", "GET",
+                                      f"/api/productos/categoria/{rng.choice(muestras['categorias'])}")),
+        (6, lambda: cliente.solicitar("productos_disponibles", "GET", "/api/productos/disponibles")),
+        (6, lambda: cliente.solicitar("obtener_pedido", "GET", f"/api/pedidos/{rng.choice(muestras['pedidos'])}")),
+        (5, lambda: cliente.solicitar("obtener_usuario", "GET", f"/api/usuarios/{cedula}")),
+        (5, lambda: cliente.solicitar("obtener_conversaciones", "GET",
+                                      f"/api/conversaciones/{rng.choice(muestras['telefonos'])}")),
+        (4, lambda: cliente.solicitar("obtener_faqs", "GET", "/api/faqs")),
+        (4, lambda: cliente.solicitar("obtener_info_empresa", "GET", "/api/empresa/info")),
+        (3, lambda: cliente.solicitar("crear_pedido", "POST", "/api/pedidos/crear", {
+            "cedula_cliente": cedula,
+            "items": [{"codigo_producto": c, "cantidad": rng.randint(1, 3)}
+                      for c in rng.sample(muestras["codigos"], min(3, len(muestras["codigos"])))]
+        })),
+        (2, lambda: cliente.solicitar("actualizar_pedido", "PUT",
+                                      f"/api/pedidos/actualizar/{rng.choice(muestras['pedidos'])}",
+                                      {"estado": rng.choice(["confirmado", "en preparación", "en tránsito"])})),
+        (1, lambda: cliente.solicitar("buscar_faqs_lote", "POST", "/api/faqs/buscar",
+                                      {"consultas": rng.sample(MENSAJES_FAQ, 3)})),
+        (1, lambda: cliente.solicitar("crear_pedidos_lote", "POST", "/api/pedidos/crear/lote", {
+            "pedidos": [{"cedula_cliente": rng.choice(muestras["cedulas"]),
+                         "items": [{"codigo_producto": rng.choice(muestras["codigos"])}]} for _ in range(10)]
+        })),
+    ]
+
+# Una sesión típica del chatbot de WhatsApp
+def sesion(cliente, muestras, rng):
+    cedula = rng.choice(muestras["cedulas"])
+    telefono = rng.choice(muestras["telefonos"])
+
+    cliente.solicitar("validar_usuario", "POST", "/api/usuarios/validar", {"cedula": cedula})
+    cliente.solicitar("obtener_pedidos_usuario", "GET", f"/api/pedidos/usuario/{cedula}")
+    cliente.solicitar("buscar_productos", "GET", f"/api/productos/buscar?q={rng.choice(TERMINOS_BUSQUEDA)}")
+    mensaje = rng.choice(MENSAJES_FAQ)
+    cliente.solicitar("buscar_faqs", "GET", f"/api/faqs/buscar?q={mensaje}")
+    cliente.solicitar("guardar_conversacion", "POST", "/api/conversaciones/guardar", {
+        "phone_number": telefono, "cedula": cedula, "mensaje": mensaje,
+        "respuesta": "respuesta de prueba", "intent": "preguntas_frecuentes"
+    })
+
+    ocasionales = consultas_ocasionales(cliente, muestras, rng)
+    for _, consulta in rng.choices(ocasionales, weights=[peso for peso, _ in ocasionales], k=2):
+        consulta()
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    # Rango más cercano: el menor valor que deja al menos p% de las muestras por debajo o igual
+    posicion = max(math.ceil(p / 100 * len(valores_ordenados)) - 1, 0)
+    return valores_ordenados[min(posicion, len(valores_ordenados) - 1)]
+
+def resumir(resultados, duracion):
+    por_endpoint = {}
+    for endpoint, segundos, codigo in resultados:
+        por_endpoint.setdefault(endpoint, []).append((segundos, codigo))
+
+    resumen = {}
+    for endpoint, mediciones in sorted(por_endpoint.items()):
+        atendidas = [segundos for segundos, codigo in mediciones if codigo != 429] or [0.0]
+        latencias = sorted(atendidas)
+        resumen[endpoint] = {
+            "solicitudes": len(mediciones),
+            "errores": sum(1 for _, codigo in mediciones if codigo == 0 or codigo >= 500),
+            "limitadas": sum(1 for _, codigo in mediciones if codigo == 429),
+            "throughput_rps": round(len(mediciones) / duracion, 2),
+            "media_ms": round(sum(latencias) / len(latencias) * 1000, 3),
+            "p50_ms": round(percentil(latencias, 50) * 1000, 3),
+            "p95_ms": round(percentil(latencias, 95) * 1000, 3),
+            "p99_ms": round(percentil(latencias, 99) * 1000, 3),
+        }
+    return resumen
+
+def commit_actual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+def ejecutar(args):
+    client = MongoClient(MONGODB_URI)
+    try:
+        muestras = cargar_muestras(client['jv_chatbot_mvp'], args.muestras)
+    finally:
+        client.close()
+
+    resultados = []
+    fin = time.monotonic() + args.calentamiento + args.duracion
+    inicio_medicion = time.monotonic() + args.calentamiento
+
+    def trabajador(numero):
+        rng = random.Random(args.semilla + numero)
+        propios = []
+        cliente = Cliente(args.url, propios)
+        while time.monotonic() < fin:
+            sesion(cliente, muestras, rng)
+            # Descartar lo medido durante el calentamiento
+            if time.monotonic() < inicio_medicion:
+                propios.clear()
+        resultados.extend(propios)
+
+    hilos = [threading.Thread(target=trabajador, args=(n,)) for n in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    resumen = resumir(resultados, args.duracion)
+    reporte = {
+        "commit": commit_actual(),
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "configuracion": {
+            "url": args.url, "duracion": args.duracion, "hilos": args.hilos,
+            "calentamiento": args.calentamiento, "semilla": args.semilla
+        },
+        "total": {
+            "solicitudes": len(resultados),
+            "limitadas": sum(datos["limitadas"] for datos in resumen.values()),
+            "throughput_rps": round(len(resultados) / args.duracion, 2)
+        },
+        "endpoints": resumen,
+    }
+
+    imprimir(reporte)
+    os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+    salida = args.salida or os.path.join(
+        DIRECTORIO_RESULTADOS, f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{reporte['commit']}.json"
+    )
+    with open(salida, "w") as archivo:
+        json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+def imprimir(reporte):
+    print(f"Commit {reporte['commit']} - {reporte['total']['solicitudes']} solicitudes, "
+          f"{reporte['total']['throughput_rps']} req/s")
+    print(f"{'endpoint':<26}{'req':>8}{'err':>6}{'429':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, datos in reporte["endpoints"].items():
+        print(f"{endpoint:<26}{datos['solicitudes']:>8}{datos['errores']:>6}{datos.get('limitadas', 0):>6}"
+              f"{datos['throughput_rps']:>9}{datos['p50_ms']:>9}{datos['p95_ms']:>9}{datos['p99_ms']:>9}")
+    if reporte["total"].get("limitadas"):
+        print(f"\nAdvertencia: {reporte['total']['limitadas']} solicitudes recibieron 429; "
+              "arranque la API con LIMITES_ACTIVOS=0 para medir capacidad")
+
+def comparar(args):
+    with open(args.base) as archivo:
+        base = json.load(archivo)
+    with open(args.nuevo) as archivo:
+        nuevo = json.load(archivo)
+
+    print(f"{base['commit']} -> {nuevo['commit']}")
+    for reporte in (base, nuevo):
+        if reporte["total"].get("limitadas"):
+            print(f"Advertencia: {reporte['commit']} tiene {reporte['total']['limitadas']} solicitudes con 429")
+    print(f"{'endpoint':<26}{'req/s':>16}{'p50 ms':>18}{'p99 ms':>18}")
+    for endpoint in sorted(set(base["endpoints"]) | set(nuevo["endpoints"])):
+        a = base["endpoints"].get(endpoint)
+        b = nuevo["endpoints"].get(endpoint)
+        if not a or not b:
+            print(f"{endpoint:<26}{'(solo en uno de los reportes)':>52}")
+            continue
+        print(f"{endpoint:<26}"
+              f"{a['throughput_rps']:>7} -> {b['throughput_rps']:<6}"
+              f"{a['p50_ms']:>8} -> {b['p50_ms']:<8}"
+              f"{a['p99_ms']:>8} -> {b['p99_ms']:<8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API del chatbot")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+
+    parser_sembrar = subparsers.add_parser("sembrar", help="Borrar y llenar la base de datos local")
+    parser_sembrar.add_argument("--usuarios", type=int, default=100000)
+    parser_sembrar.add_argument("--productos", type=int, default=1000)
+    parser_sembrar.add_argument("--pedidos", type=int, default=1000000)
+    parser_sembrar.add_argument("--conversaciones", type=int, default=10000000)
+    parser_sembrar.add_argument("--lote", type=int, default=5000)
+    parser_sembrar.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser_sembrar.add_argument("--semilla", type=int, default=42)
+    parser_sembrar.add_argument("--forzar", action="store_true", help="Permitir una MongoDB que no es local")
+
+    parser_ejecutar = subparsers.add_parser("ejecutar", help="Simular tráfico del chatbot contra la API")
+    parser_ejecutar.add_argument("--url", default="http://localhost:5000")
+    parser_ejecutar.add_argument("--duracion", type=float, default=60)
+    parser_ejecutar.add_argument("--calentamiento", type=float, default=5)
+    parser_ejecutar.add_argument("--hilos", type=int, default=16)
+    parser_ejecutar.add_argument("--muestras", type=int, default=1000)
+    parser_ejecutar.add_argument("--semilla", type=int, default=42)
+    parser_ejecutar.add_argument("--salida", help="Archivo JSON de resultados")
+
+    parser_comparar = subparsers.add_parser("comparar", help="Comparar dos reportes JSON")
+    parser_comparar.add_argument("base")
+    parser_comparar.add_argument("nuevo")
+
+    args = parser.parse_args()
+    {"sembrar": sembrar, "ejecutar": ejecutar, "comparar": comparar}[args.accion](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Micro-benchmark del costo de logging por solicitud: handlers síncronos con f-strings (configuración
+# anterior) contra la cola de registros.py con formato perezoso, con y sin muestreo.
+#
+# Cada "solicitud" registra lo mismo que validar_usuario: el cuerpo recibido y la cédula.
+# Se mide solo el tiempo del hilo de la solicitud; el listener escribe en paralelo.
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import registros  # noqa: E402
+
+DATOS = {"cedula": "1234567890", "telefono": "3001234567", "mensaje": "hola, quiero saber de mi pedido"}
+
+def crear_logger(nombre, handlers):
+    logger = logging.getLogger(nombre)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger
+
+def solicitud_anterior(logger, data):
+    logger.info(f"Validating data: {data}")
+    cedula = data.get('cedula')
+    logger.info(f"Validating cedula: {cedula}")
+
+def solicitud_actual(logger, data):
+    logger.debug("Validando datos: %s", data)
+    cedula = data.get('cedula')
+    logger.info("Validando usuario", extra={"cedula": cedula})
+
+def medir(funcion, logger, solicitudes):
+    inicio = time.perf_counter()
+    for _ in range(solicitudes):
+        funcion(logger, DATOS)
+    return (time.perf_counter() - inicio) / solicitudes
+
+def main():
+    solicitudes = int(os.getenv("BENCH_SOLICITUDES", 20000))
+    directorio = tempfile.mkdtemp()
+    nulo = open(os.devnull, "w")
+
+    # Configuración anterior: archivo y stream en el hilo de la solicitud
+    formato = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+    sincronos = [logging.FileHandler(os.path.join(directorio, "anterior.log")), logging.StreamHandler(nulo)]
+    for handler in sincronos:
+        handler.setFormatter(formato)
+    anterior = crear_logger("bench_anterior", sincronos)
+    tiempo_anterior = medir(solicitud_anterior, anterior, solicitudes)
+
+    resultados = [("handlers síncronos + f-string", tiempo_anterior)]
+    registros.ruta_solicitud.set("validar_usuario")
+    for nombre, tasa in (("cola + JSON + perezoso", 1.0), ("cola + JSON + muestreo 10%", 0.1)):
+        salidas = [logging.FileHandler(os.path.join(directorio, f"actual_{tasa}.log")), logging.StreamHandler(nulo)]
+        for salida in salidas:
+            salida.setFormatter(registros.FormateadorJSON())
+        canal = registros.CanalRegistros(salidas, solicitudes * 2, registros.FiltroMuestreo({"validar_usuario": tasa}))
+        canal.iniciar()
+        actual = crear_logger(f"bench_actual_{tasa}", [canal.handler])
+        resultados.append((nombre, medir(solicitud_actual, actual, solicitudes)))
+        canal.detener()
+
+    print(f"Solicitudes: {solicitudes}")
+    for nombre, segundos in resultados:
+        print(f"{nombre:32} {segundos * 1_000_000:8.2f} µs/solicitud  ({tiempo_anterior / segundos:.1f}x)")
+
+if __name__ == "__main__":
+    main()
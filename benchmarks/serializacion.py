@@ -0,0 +1,71 @@
+# Micro-benchmark de serialización: parse_json anterior (dumps + loads + jsonify) contra el proveedor JSON de la app
+import datetime
+import json
+import os
+import sys
+import timeit
+
+from bson import json_util
+from bson.objectid import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from app import app  # noqa: E402
+
+# Generar documentos con la forma de los pedidos de init-db.py
+def generar_pedidos(cantidad):
+    ahora = datetime.datetime.now()
+    return [
+        {
+            "_id": ObjectId(),
+            "numero_pedido": f"PED-{str(i + 1).zfill(5)}",
+            "cedula_cliente": "1234567890",
+            "fecha_pedido": ahora,
+            "estado": "en tránsito",
+            "items": [
+                {
+                    "codigo_producto": f"PROD-{str(j + 1).zfill(3)}",
+                    "nombre_producto": "Batería Gel 12V 100Ah",
+                    "cantidad": 2,
+                    "precio_unitario": 850000.0,
+                    "subtotal": 1700000.0
+                }
+                for j in range(3)
+            ],
+            "total": 5100000.0,
+            "metodo_pago": "PSE",
+            "direccion_entrega": "Carrera 62 No. 14-65, Bogotá",
+            "numero_guia": "A1B2C3D4",
+            "fecha_confirmacion": ahora,
+            "fecha_preparacion": ahora,
+            "fecha_envio": ahora,
+            "fecha_entrega": None,
+            "notas": None
+        }
+        for i in range(cantidad)
+    ]
+
+def main():
+    cantidad = int(os.getenv("BENCH_DOCUMENTOS", 1000))
+    repeticiones = int(os.getenv("BENCH_REPETICIONES", 20))
+    pedidos = generar_pedidos(cantidad)
+    
+    with app.app_context():
+        def anterior():
+            return app.json.response({"success": True, "pedidos": json.loads(json_util.dumps(pedidos))}).get_data()
+        
+        def actual():
+            return app.json.response({"success": True, "pedidos": pedidos}).get_data()
+        
+        # Ambos caminos deben producir exactamente el mismo cuerpo
+        assert json.loads(anterior()) == json.loads(actual())
+        
+        tiempo_anterior = min(timeit.repeat(anterior, number=1, repeat=repeticiones))
+        tiempo_actual = min(timeit.repeat(actual, number=1, repeat=repeticiones))
+    
+    print(f"Documentos: {cantidad}")
+    print(f"dumps + loads + jsonify: {tiempo_anterior * 1000:.2f} ms")
+    print(f"proveedor JSON BSON:     {tiempo_actual * 1000:.2f} ms")
+    print(f"Mejora: {tiempo_anterior / tiempo_actual:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Respuestas condicionales y comprimidas para las rutas de solo lectura
+#
+# - ETag fuerte (hash del cuerpo) en las rutas de RUTAS_CACHEABLES; con If-None-Match vigente se
+#   responde 304 sin cuerpo. Las respuestas dinámicas no llevan Last-Modified: los datos no tienen
+#   una fecha de modificación real y una marca por proceso y por segundo puede dar un 304 viejo.
+#   Solo las respuestas estáticas, que no cambian mientras el proceso vive, usan If-Modified-Since.
+# - Cache-Control por ruta, para que un CDN delante de Cloud Run absorba las lecturas repetidas
+# - Compresión brotli o gzip según Accept-Encoding para las respuestas grandes
+# - Respuestas estáticas serializadas y comprimidas una sola vez al iniciar (RespuestaEstatica)
+import gzip
+import hashlib
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+import brotli
+
+COMPRESION_MINIMA = int(os.getenv("COMPRESION_MINIMA", 1024))
+GZIP_NIVEL = int(os.getenv("GZIP_NIVEL", 6))
+# Calidad media: la máxima (11) es demasiado lenta para comprimir en cada solicitud
+BROTLI_CALIDAD = int(os.getenv("BROTLI_CALIDAD", 5))
+TIPOS_COMPRIMIBLES = ("application/json", "text/")
+
+HTTP_CACHE_CATALOGO_TTL = int(os.getenv("HTTP_CACHE_CATALOGO_TTL", 30))
+HTTP_CACHE_STOCK_TTL = int(os.getenv("HTTP_CACHE_STOCK_TTL", 5))
+HTTP_CACHE_FAQS_TTL = int(os.getenv("HTTP_CACHE_FAQS_TTL", 300))
+HTTP_CACHE_EMPRESA_TTL = int(os.getenv("HTTP_CACHE_EMPRESA_TTL", 3600))
+
+def cache_control(ttl):
+    return f"public, max-age={ttl}, stale-while-revalidate={ttl}"
+
+# Rutas (por nombre de endpoint) que llevan ETag y Cache-Control
+RUTAS_CACHEABLES = {
+    "obtener_producto": cache_control(HTTP_CACHE_CATALOGO_TTL),
+    "productos_por_categoria": cache_control(HTTP_CACHE_CATALOGO_TTL),
+    "productos_disponibles": cache_control(HTTP_CACHE_CATALOGO_TTL),
+    "buscar_productos": cache_control(HTTP_CACHE_CATALOGO_TTL),
+    "verificar_stock": f"public, max-age={HTTP_CACHE_STOCK_TTL}",
+    "obtener_faqs": cache_control(HTTP_CACHE_FAQS_TTL),
+    "obtener_info_empresa": cache_control(HTTP_CACHE_EMPRESA_TTL),
+}
+
+# Elegir la codificación con mayor q que acepte el cliente; brotli gana los empates
+def codificacion_aceptada(accept_encoding):
+    preferencias = {}
+    for parte in (accept_encoding or "").split(","):
+        nombre, _, parametros = parte.partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        preferencias[nombre.strip().lower()] = calidad
+
+    elegida = None
+    mejor = 0.0
+    for codificacion in ("br", "gzip"):
+        calidad = preferencias.get(codificacion, preferencias.get("*", 0.0))
+        if calidad > mejor:
+            elegida, mejor = codificacion, calidad
+    return elegida
+
+def comprimir(cuerpo, codificacion, nivel=None):
+    if codificacion == "br":
+        return brotli.compress(cuerpo, quality=BROTLI_CALIDAD if nivel is None else nivel)
+    # mtime=0 para que el mismo cuerpo produzca siempre los mismos bytes
+    return gzip.compress(cuerpo, compresslevel=GZIP_NIVEL if nivel is None else nivel, mtime=0)
+
+def calcular_etag(cuerpo):
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+# Cada codificación es otra representación y lleva su propio ETag ("abc-gzip")
+def etag_codificado(etag, codificacion):
+    return etag if codificacion is None else f'{etag[:-1]}-{codificacion}"'
+
+# If-None-Match usa comparación débil: vale cualquier codificación del mismo contenido
+def coincide_etag(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    base = etag[:-1]
+    for etiqueta in if_none_match.split(","):
+        etiqueta = etiqueta.strip()
+        if etiqueta.startswith("W/"):
+            etiqueta = etiqueta[2:]
+        if etiqueta == etag or (etiqueta.startswith(base + "-") and etiqueta.endswith('"')):
+            return True
+    return False
+
+def no_modificado_desde(if_modified_since, marca):
+    try:
+        fecha = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return marca <= fecha.timestamp()
+
+# Si se envía If-None-Match se ignora If-Modified-Since (RFC 9110). Sin marca (respuestas
+# dinámicas) If-Modified-Since no se usa y se responde completo.
+def solicitud_vigente(request, etag, marca=None):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return coincide_etag(if_none_match, etag)
+    if_modified_since = request.headers.get("If-Modified-Since")
+    return marca is not None and if_modified_since is not None and no_modificado_desde(if_modified_since, marca)
+
+def agregar_vary(response):
+    vary = response.headers.get("Vary")
+    if not vary:
+        response.headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        response.headers["Vary"] = f"{vary}, Accept-Encoding"
+
+# Agregar validadores y comprimir; devuelve el cuerpo nuevo o None si no cambia
+def procesar(request, response, cuerpo):
+    codificacion = None
+    if response.mimetype and response.mimetype.startswith(TIPOS_COMPRIMIBLES):
+        agregar_vary(response)
+        if len(cuerpo) >= COMPRESION_MINIMA:
+            codificacion = codificacion_aceptada(request.headers.get("Accept-Encoding"))
+
+    valor_cache_control = RUTAS_CACHEABLES.get(request.endpoint)
+    if valor_cache_control and request.method in ("GET", "HEAD") and response.status_code == 200:
+        etag = calcular_etag(cuerpo)
+        response.headers["ETag"] = etag_codificado(etag, codificacion)
+        response.headers["Cache-Control"] = valor_cache_control
+        if solicitud_vigente(request, etag):
+            response.status_code = 304
+            return b""
+
+    if codificacion:
+        response.headers["Content-Encoding"] = codificacion
+        return comprimir(cuerpo, codificacion)
+    return None
+
+# Las respuestas que ya traen ETag o Content-Encoding (p. ej. las estáticas) no se procesan otra vez
+def omitir(response):
+    return "ETag" in response.headers or "Content-Encoding" in response.headers
+
+class RespuestaEstatica:
+    """Cuerpo serializado una sola vez, con su ETag y sus versiones comprimidas al máximo nivel.
+
+    El cuerpo sale del código y no cambia mientras el proceso vive, así que el Last-Modified es el
+    momento en que se creó: otro proceso con el mismo código responde lo mismo.
+    """
+
+    def __init__(self, cuerpo, mimetype="application/json"):
+        self.cuerpo = cuerpo
+        self.mimetype = mimetype
+        self.etag = calcular_etag(cuerpo)
+        self.marca = int(time.time())
+        self.variantes = {}
+        for codificacion, nivel in (("br", 11), ("gzip", 9)):
+            comprimido = comprimir(cuerpo, codificacion, nivel)
+            if len(comprimido) < len(cuerpo):
+                self.variantes[codificacion] = comprimido
+
+    def responder(self, app, request, valor_cache_control):
+        codificacion = codificacion_aceptada(request.headers.get("Accept-Encoding"))
+        if codificacion not in self.variantes:
+            codificacion = None
+
+        if solicitud_vigente(request, self.etag, self.marca):
+            response = app.response_class(b"", status=304, mimetype=self.mimetype)
+        else:
+            response = app.response_class(self.variantes.get(codificacion, self.cuerpo), mimetype=self.mimetype)
+            if codificacion:
+                response.headers["Content-Encoding"] = codificacion
+
+        response.headers["ETag"] = etag_codificado(self.etag, codificacion)
+        response.headers["Last-Modified"] = formatdate(self.marca, usegmt=True)
+        response.headers["Cache-Control"] = valor_cache_control
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+# Conectar el procesamiento a una app Flask o Quart. Debe registrarse después de
+# metricas.registrar: Flask y Quart ejecutan los after_request en orden inverso, así las
+# métricas ven el tamaño ya comprimido.
+def registrar(app, request, asincrono=False):
+    if asincrono:
+        async def despues_async(response):
+            if omitir(response):
+                return response
+            cuerpo = procesar(request, response, await response.get_data())
+            if cuerpo is not None:
+                response.set_data(cuerpo)
+            return response
+
+        app.after_request(despues_async)
+    else:
+        def despues_de_solicitud(response):
+            if omitir(response) or response.is_streamed or response.direct_passthrough:
+                return response
+            cuerpo = procesar(request, response, response.get_data())
+            if cuerpo is not None:
+                response.set_data(cuerpo)
+            return response
+
+        app.after_request(despues_de_solicitud)
@@ -0,0 +1,139 @@
+# Coalescencia de lecturas por llave (single-flight)
+#
+# Cuando sale una promoción, cientos de sesiones del bot piden el mismo producto, el mismo stock o el
+# mismo pedido en el mismo segundo. Dentro de un worker, las consultas idénticas que llegan mientras
+# otra ya está en curso esperan esa consulta y reciben su resultado (o su excepción) en lugar de
+# enviar su propio find_one a MongoDB.
+#
+# - Nada se guarda después de que la consulta termina: la llamada siguiente consulta de nuevo, así
+#   que el resultado no es más viejo que la consulta misma. Las escrituras del worker llaman
+#   olvidar() para que las lecturas que lleguen después no se unan a una consulta que empezó antes.
+# - Flask: hilos que esperan un Event. Quart: tareas que esperan la misma tarea con asyncio.shield,
+#   así una solicitud cancelada no cancela la consulta de las demás.
+# - Los resultados se comparten: quien los reciba no debe modificarlos.
+import asyncio
+import os
+import threading
+import weakref
+
+import metricas
+
+COALESCENCIA_ACTIVA = os.getenv("COALESCENCIA_ACTIVA", "1") == "1"
+
+llamadas = metricas.Contador("coalescencia_llamadas_total", "Lecturas por llave que pasaron por la coalescencia")
+coalescidas = metricas.Contador(
+    "coalescencia_coalescidas_total", "Lecturas por llave que recibieron el resultado de una consulta ya en curso"
+)
+
+# Coalescedores del proceso, para que olvidar() llegue a los de Flask y de Quart
+coalescedores = weakref.WeakSet()
+
+def coincide(clave, tipo, identificador):
+    return clave[0] == tipo and (identificador is None or clave[1] == identificador)
+
+class _EnCurso:
+    __slots__ = ("listo", "resultado", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+class Coalescedor:
+    """Single-flight para hilos: una sola ejecución de `funcion` por llave a la vez."""
+
+    def __init__(self, activa=COALESCENCIA_ACTIVA):
+        self.activa = activa
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        coalescedores.add(self)
+
+    # La llave es (tipo, identificador, ...); el tipo ("producto", "stock", ...) se usa como etiqueta
+    def ejecutar(self, clave, funcion):
+        llamadas.incrementar((("tipo", clave[0]),))
+        if not self.activa:
+            return funcion()
+
+        with self._lock:
+            entrada = self._en_curso.get(clave)
+            lider = entrada is None
+            if lider:
+                entrada = self._en_curso[clave] = _EnCurso()
+
+        if not lider:
+            coalescidas.incrementar((("tipo", clave[0]),))
+            entrada.listo.wait()
+            if entrada.error is not None:
+                raise entrada.error
+            return entrada.resultado
+
+        try:
+            entrada.resultado = funcion()
+            return entrada.resultado
+        except BaseException as e:
+            entrada.error = e
+            raise
+        finally:
+            with self._lock:
+                # olvidar() pudo haber reemplazado la entrada por la de una consulta más nueva
+                if self._en_curso.get(clave) is entrada:
+                    del self._en_curso[clave]
+            entrada.listo.set()
+
+    def olvidar(self, tipo, identificador=None):
+        with self._lock:
+            for clave in [clave for clave in self._en_curso if coincide(clave, tipo, identificador)]:
+                del self._en_curso[clave]
+
+    def en_curso(self):
+        with self._lock:
+            return len(self._en_curso)
+
+class CoalescedorAsync:
+    """Single-flight para asyncio: las solicitudes con la misma llave esperan la misma tarea."""
+
+    def __init__(self, activa=COALESCENCIA_ACTIVA):
+        self.activa = activa
+        self._en_curso = {}
+        coalescedores.add(self)
+
+    # `funcion` no recibe argumentos y devuelve una corrutina
+    async def ejecutar(self, clave, funcion):
+        llamadas.incrementar((("tipo", clave[0]),))
+        if not self.activa:
+            return await funcion()
+
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            tarea = self._en_curso[clave] = asyncio.ensure_future(funcion())
+            tarea.add_done_callback(lambda terminada: self._terminar(clave, terminada))
+        else:
+            coalescidas.incrementar((("tipo", clave[0]),))
+        return await asyncio.shield(tarea)
+
+    def _terminar(self, clave, tarea):
+        if self._en_curso.get(clave) is tarea:
+            del self._en_curso[clave]
+        # Si todas las solicitudes se cancelaron nadie lee la excepción; se marca como leída
+        if not tarea.cancelled():
+            tarea.exception()
+
+    def olvidar(self, tipo, identificador=None):
+        for clave in [clave for clave in self._en_curso if coincide(clave, tipo, identificador)]:
+            del self._en_curso[clave]
+
+    def en_curso(self):
+        return len(self._en_curso)
+
+# Después de una escritura: las lecturas que lleguen ya no se unen a las consultas en curso sobre
+# ese documento, que pudieron leerlo antes de la escritura. Sin identificador, todo el tipo.
+def olvidar(tipo, identificador=None):
+    for coalescedor in list(coalescedores):
+        coalescedor.olvidar(tipo, identificador)
+
+def metricas_coalescencia():
+    return llamadas.exponer() + coalescidas.exponer() + [
+        "# HELP coalescencia_en_curso Consultas por llave en curso en el proceso",
+        "# TYPE coalescencia_en_curso gauge",
+        f"coalescencia_en_curso {sum(coalescedor.en_curso() for coalescedor in list(coalescedores))}",
+    ]
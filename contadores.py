@@ -0,0 +1,102 @@
+# Números de pedido únicos y crecientes, compartidos por app.py, app_async.py e init-db.py
+#
+# El contador vive en la colección "counters" ({"_id": "pedidos", "valor": N}). Cada proceso
+# reserva bloques de números con un solo find_one_and_update y los reparte en memoria, así que
+# solo hay una escritura al contador cada BLOQUE pedidos aunque haya varios workers e instancias.
+# Los números que queden sin usar en un bloque al reiniciar el proceso se pierden: puede haber
+# huecos, pero nunca duplicados.
+import asyncio
+import threading
+
+from pymongo import ReturnDocument
+
+PREFIJO_PEDIDO = "PED-"
+
+def formatear_numero_pedido(numero):
+    # Mismo formato que los pedidos sembrados por init-db.py (PED-00001)
+    return f"{PREFIJO_PEDIDO}{str(numero).zfill(5)}"
+
+# Mayor número de pedido existente, para que el contador arranque después de los pedidos sembrados
+def pipeline_maximo_pedido():
+    return [
+        {"$match": {"numero_pedido": {"$regex": f"^{PREFIJO_PEDIDO}[0-9]+$"}}},
+        {"$group": {
+            "_id": None,
+            "maximo": {"$max": {"$toLong": {"$arrayElemAt": [{"$split": ["$numero_pedido", PREFIJO_PEDIDO]}, 1]}}}
+        }}
+    ]
+
+def actualizacion_bloque(cantidad):
+    return {"$inc": {"valor": cantidad}}
+
+# Rango [desde, hasta] a partir del valor del contador después del $inc
+def rango_bloque(contador, cantidad):
+    return contador["valor"] - cantidad + 1, contador["valor"]
+
+# Reservar de una vez `cantidad` números consecutivos; devuelve (desde, hasta)
+def reservar_bloque(db, nombre, cantidad):
+    contador = db.counters.find_one_and_update(
+        {"_id": nombre}, actualizacion_bloque(cantidad), return_document=ReturnDocument.AFTER
+    )
+    if contador is None:
+        # Primera vez: $max con upsert es idempotente si varias instancias inicializan a la vez
+        maximo = next(db.orders.aggregate(pipeline_maximo_pedido()), {}).get("maximo") or 0
+        db.counters.update_one({"_id": nombre}, {"$max": {"valor": maximo}}, upsert=True)
+        contador = db.counters.find_one_and_update(
+            {"_id": nombre}, actualizacion_bloque(cantidad), return_document=ReturnDocument.AFTER
+        )
+    return rango_bloque(contador, cantidad)
+
+class AsignadorNumeros:
+    """Reparte números de un bloque reservado en el contador y pide otro al agotarlo."""
+
+    def __init__(self, db, nombre="pedidos", bloque=100):
+        self.db = db
+        self.nombre = nombre
+        self.bloque = bloque
+        self._siguiente = 1
+        self._hasta = 0
+        self._lock = threading.Lock()
+
+    def siguiente(self):
+        with self._lock:
+            if self._siguiente > self._hasta:
+                self._siguiente, self._hasta = reservar_bloque(self.db, self.nombre, self.bloque)
+            numero = self._siguiente
+            self._siguiente += 1
+        return formatear_numero_pedido(numero)
+
+    def siguientes(self, cantidad):
+        return [self.siguiente() for _ in range(cantidad)]
+
+async def reservar_bloque_async(db, nombre, cantidad):
+    contador = await db.counters.find_one_and_update(
+        {"_id": nombre}, actualizacion_bloque(cantidad), return_document=ReturnDocument.AFTER
+    )
+    if contador is None:
+        maximo = 0
+        async for resultado in await db.orders.aggregate(pipeline_maximo_pedido()):
+            maximo = resultado.get("maximo") or 0
+        await db.counters.update_one({"_id": nombre}, {"$max": {"valor": maximo}}, upsert=True)
+        contador = await db.counters.find_one_and_update(
+            {"_id": nombre}, actualizacion_bloque(cantidad), return_document=ReturnDocument.AFTER
+        )
+    return rango_bloque(contador, cantidad)
+
+class AsignadorNumerosAsync(AsignadorNumeros):
+    """Versión para el driver asíncrono: el bloque se reserva sin bloquear el event loop."""
+
+    def __init__(self, db, nombre="pedidos", bloque=100):
+        super().__init__(db, nombre, bloque)
+        self._lock = asyncio.Lock()
+
+    async def siguiente(self):
+        async with self._lock:
+            if self._siguiente > self._hasta:
+                self._siguiente, self._hasta = await reservar_bloque_async(self.db, self.nombre, self.bloque)
+            numero = self._siguiente
+            self._siguiente += 1
+        return formatear_numero_pedido(numero)
+
+    async def siguientes(self, cantidad):
+        return [await self.siguiente() for _ in range(cantidad)]
@@ -0,0 +1,317 @@
+# Almacenamiento de conversaciones por buckets y archivo de conversaciones antiguas
+#
+# Con CONVERSACIONES_ALMACENAMIENTO=buckets cada documento de "conversation_buckets" guarda los turnos
+# de un teléfono en un día (o una hora, CONVERSACIONES_BUCKET=hora), hasta CONVERSACIONES_BUCKET_MAX
+# turnos; al llenarse se abre otro bucket del mismo periodo. Una conversación nueva es un $push con
+# upsert y no un documento más, así que la colección y su índice crecen con los periodos y no con
+# los mensajes. Las rutas de guardar y leer conversaciones responden igual con ambos formatos.
+#
+# "archivar" mueve las conversaciones con más de CONVERSACIONES_ARCHIVO_DIAS días a archivos JSONL
+# comprimidos con gzip, uno por fecha (conversaciones-AAAA-MM-DD.jsonl.gz), y "leer" las recupera.
+#
+# Uso:
+#   python conversaciones.py archivar [--dias 90] [--directorio archivo]
+#   python conversaciones.py leer --telefono 3001234567 --desde 2026-01-01 --hasta 2026-01-31
+#   python conversaciones.py migrar   Pasa los documentos de "conversations" a buckets
+import argparse
+import datetime
+import gzip
+import json
+import os
+
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+CONVERSACIONES_ALMACENAMIENTO = os.getenv("CONVERSACIONES_ALMACENAMIENTO", "documentos")
+CONVERSACIONES_BUCKET = os.getenv("CONVERSACIONES_BUCKET", "dia")
+CONVERSACIONES_BUCKET_MAX = int(os.getenv("CONVERSACIONES_BUCKET_MAX", 200))
+CONVERSACIONES_ARCHIVO_DIR = os.getenv("CONVERSACIONES_ARCHIVO_DIR", "archivo")
+CONVERSACIONES_ARCHIVO_DIAS = int(os.getenv("CONVERSACIONES_ARCHIVO_DIAS", 90))
+# Días que puede abarcar una lectura del archivo desde la API
+ARCHIVO_MAX_DIAS = int(os.getenv("CONVERSACIONES_ARCHIVO_MAX_DIAS", 92))
+
+BUCKETS = "conversation_buckets"
+
+def usa_buckets():
+    return CONVERSACIONES_ALMACENAMIENTO == "buckets"
+
+def inicio_bucket(fecha, granularidad=CONVERSACIONES_BUCKET):
+    if granularidad == "hora":
+        return fecha.replace(minute=0, second=0, microsecond=0)
+    return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def turno(conversacion):
+    return {campo: valor for campo, valor in conversacion.items() if campo != "phone_number"}
+
+# Agrupar las conversaciones por teléfono y periodo: un $push con upsert por grupo. El filtro exige
+# espacio para todo el grupo; si el bucket abierto no lo tiene, el upsert abre uno nuevo.
+# Devuelve las operaciones y cuántos turnos lleva cada una.
+def operaciones_buckets(conversaciones, granularidad=CONVERSACIONES_BUCKET, maximo=CONVERSACIONES_BUCKET_MAX):
+    grupos = {}
+    for conversacion in conversaciones:
+        conversacion.setdefault("_id", ObjectId())
+        llave = (conversacion["phone_number"], inicio_bucket(conversacion["timestamp"], granularidad))
+        grupos.setdefault(llave, []).append(conversacion)
+
+    operaciones = []
+    cantidades = []
+    for (phone_number, inicio), grupo in grupos.items():
+        for desde in range(0, len(grupo), maximo):
+            parte = grupo[desde:desde + maximo]
+            fechas = [conversacion["timestamp"] for conversacion in parte]
+            operaciones.append(UpdateOne(
+                {"phone_number": phone_number, "inicio": inicio, "cantidad": {"$lte": maximo - len(parte)}},
+                {
+                    "$push": {"turnos": {"$each": [turno(conversacion) for conversacion in parte]}},
+                    "$inc": {"cantidad": len(parte)},
+                    "$min": {"desde": min(fechas)},
+                    "$max": {"hasta": max(fechas)}
+                },
+                upsert=True
+            ))
+            cantidades.append(len(parte))
+    return operaciones, cantidades
+
+def turnos_fallidos(error, cantidades):
+    return sum(cantidades[detalle['index']] for detalle in error.details.get('writeErrors', []))
+
+# Guardar conversaciones en sus buckets; devuelve cuántas no se pudieron escribir
+def escribir_buckets(db, conversaciones):
+    operaciones, cantidades = operaciones_buckets(conversaciones)
+    try:
+        db[BUCKETS].bulk_write(operaciones, ordered=False)
+    except BulkWriteError as e:
+        return turnos_fallidos(e, cantidades)
+    return 0
+
+async def escribir_buckets_async(db, conversaciones):
+    operaciones, cantidades = operaciones_buckets(conversaciones)
+    try:
+        await db[BUCKETS].bulk_write(operaciones, ordered=False)
+    except BulkWriteError as e:
+        return turnos_fallidos(e, cantidades)
+    return 0
+
+# Lectura paginada: los mismos documentos y el mismo orden (timestamp, _id) descendente que
+# obtener_conversaciones lee de "conversations"
+def filtro_buckets(phone_number, valores_cursor=None):
+    filtro = {"phone_number": phone_number}
+    if valores_cursor:
+        # Un turno anterior al cursor solo puede estar en un bucket que empezó antes del cursor
+        filtro["inicio"] = {"$lte": valores_cursor[0]}
+    return filtro
+
+def proyeccion_buckets(proyeccion):
+    if proyeccion is None:
+        return None
+    campos = {"_id": 0, "phone_number": 1, "inicio": 1, "turnos._id": 1, "turnos.timestamp": 1}
+    for campo, incluir in proyeccion.items():
+        if incluir and campo not in ("_id", "phone_number"):
+            campos["turnos." + campo] = 1
+    return campos
+
+class SeleccionTurnos:
+    """Junta los turnos más recientes de los buckets, leídos del más nuevo al más viejo.
+
+    Los periodos están alineados, así que todos los turnos de un bucket con un inicio anterior son
+    más viejos que los ya leídos: con limite + 1 turnos no hace falta leer más buckets.
+    """
+
+    def __init__(self, limite, valores_cursor=None):
+        self.limite = limite
+        self.cursor = tuple(valores_cursor) if valores_cursor else None
+        self.turnos = []
+        self._inicio = None
+
+    def completa(self, bucket):
+        return len(self.turnos) > self.limite and bucket["inicio"] < self._inicio
+
+    def agregar(self, bucket):
+        self._inicio = bucket["inicio"]
+        for documento in bucket.get("turnos", []):
+            conversacion = dict(documento, phone_number=bucket["phone_number"])
+            if self.cursor is None or (conversacion["timestamp"], conversacion["_id"]) < self.cursor:
+                self.turnos.append(conversacion)
+        self.turnos.sort(key=lambda conversacion: (conversacion["timestamp"], conversacion["_id"]), reverse=True)
+        del self.turnos[self.limite + 1:]
+
+# Hasta limite + 1 conversaciones; la de más indica que hay otra página
+def leer_buckets(db, phone_number, limite, valores_cursor=None, proyeccion=None):
+    seleccion = SeleccionTurnos(limite, valores_cursor)
+    buckets = db[BUCKETS].find(filtro_buckets(phone_number, valores_cursor), proyeccion_buckets(proyeccion))
+    # Lotes chicos: un bucket puede traer cientos de turnos y casi siempre basta con el primero
+    for bucket in buckets.sort("inicio", -1).batch_size(2):
+        if seleccion.completa(bucket):
+            break
+        seleccion.agregar(bucket)
+    buckets.close()
+    return seleccion.turnos
+
+async def leer_buckets_async(db, phone_number, limite, valores_cursor=None, proyeccion=None):
+    seleccion = SeleccionTurnos(limite, valores_cursor)
+    buckets = db[BUCKETS].find(filtro_buckets(phone_number, valores_cursor), proyeccion_buckets(proyeccion))
+    async for bucket in buckets.sort("inicio", -1).batch_size(2):
+        if seleccion.completa(bucket):
+            break
+        seleccion.agregar(bucket)
+    await buckets.close()
+    return seleccion.turnos
+
+# Etapas para un $lookup con las últimas conversaciones de un teléfono, como documentos sueltos
+# (sin phone_number, que ya se conoce)
+def etapas_ultimos_turnos(phone_number, limite):
+    return [
+        {"$match": {"phone_number": phone_number}},
+        # Un periodo puede tener varios buckets con el mismo inicio y el más nuevo no siempre es el
+        # último abierto, así que se desempata por el último turno de cada uno ("hasta")
+        {"$sort": {"inicio": -1, "hasta": -1}},
+        # Cada bucket tiene al menos un turno y en este orden su último turno no es más viejo que los
+        # de los buckets siguientes: los `limite` primeros tienen las `limite` conversaciones más nuevas
+        {"$limit": limite},
+        {"$unwind": "$turnos"},
+        {"$replaceRoot": {"newRoot": "$turnos"}},
+        {"$sort": {"timestamp": -1, "_id": -1}},
+        {"$limit": limite}
+    ]
+
+# Archivo en JSONL comprimido, un archivo por fecha de la conversación
+def ruta_particion(directorio, fecha):
+    return os.path.join(directorio, f"conversaciones-{fecha.isoformat()}.jsonl.gz")
+
+# Agregar las conversaciones a sus archivos. Cada escritura es un miembro gzip nuevo al final del
+# archivo, que gzip lee como un solo flujo; se hace fsync antes de borrarlas de MongoDB.
+def escribir_particiones(directorio, conversaciones):
+    os.makedirs(directorio, exist_ok=True)
+    particiones = {}
+    for conversacion in conversaciones:
+        particiones.setdefault(conversacion["timestamp"].date(), []).append(conversacion)
+
+    for fecha, grupo in particiones.items():
+        lineas = "".join(
+            json_util.dumps(conversacion, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n" for conversacion in grupo
+        )
+        with open(ruta_particion(directorio, fecha), "ab") as archivo:
+            archivo.write(gzip.compress(lineas.encode("utf-8")))
+            archivo.flush()
+            os.fsync(archivo.fileno())
+    return {fecha.isoformat(): len(grupo) for fecha, grupo in particiones.items()}
+
+def sumar_conteos(total, conteos):
+    for fecha, cantidad in conteos.items():
+        total[fecha] = total.get(fecha, 0) + cantidad
+
+# Mover al archivo las conversaciones de hace más de `dias` días, de ambos formatos de almacenamiento.
+# En "conversations" la antigüedad se toma del _id (momento de inserción), que ya tiene índice; así
+# el archivo no agrega un índice por fecha a la colección que más se escribe. Los buckets se eligen
+# por el inicio de su periodo, que es la fecha de sus turnos aunque se hayan escrito después (p. ej.
+# con "migrar"). Si el proceso se corta entre la escritura y el borrado, la siguiente corrida vuelve
+# a archivar esos documentos y la lectura descarta los repetidos por _id.
+def archivar(db, dias=CONVERSACIONES_ARCHIVO_DIAS, directorio=CONVERSACIONES_ARCHIVO_DIR, lote=1000):
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    archivadas = {}
+
+    corte = ObjectId.from_datetime(ahora - datetime.timedelta(days=dias))
+    while True:
+        documentos = list(db.conversations.find({"_id": {"$lt": corte}}).sort("_id", 1).limit(lote))
+        if not documentos:
+            break
+        sumar_conteos(archivadas, escribir_particiones(directorio, documentos))
+        db.conversations.delete_many({"_id": {"$in": [documento["_id"] for documento in documentos]}})
+
+    # Un bucket se archiva completo cuando su periodo ya terminó antes del corte. Los timestamps se
+    # guardan con la hora local sin zona (construir_conversacion), así que el corte también.
+    corte_buckets = inicio_bucket(datetime.datetime.now() - datetime.timedelta(days=dias))
+    lote_buckets = max(lote // CONVERSACIONES_BUCKET_MAX, 1)
+    while True:
+        buckets = list(db[BUCKETS].find({"inicio": {"$lt": corte_buckets}}).sort("inicio", 1).limit(lote_buckets))
+        if not buckets:
+            break
+        sumar_conteos(archivadas, escribir_particiones(directorio, [
+            dict(documento, phone_number=bucket["phone_number"]) for bucket in buckets for documento in bucket.get("turnos", [])
+        ]))
+        db[BUCKETS].delete_many({"_id": {"$in": [bucket["_id"] for bucket in buckets]}})
+
+    return archivadas
+
+def leer_fecha(valor):
+    try:
+        return datetime.date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ValueError("Las fechas deben tener el formato AAAA-MM-DD")
+
+# Rango de fechas del archivo a leer; por defecto los últimos 30 días
+def rango_archivo(desde, hasta, maximo=ARCHIVO_MAX_DIAS):
+    hasta = leer_fecha(hasta) if hasta else datetime.date.today()
+    desde = leer_fecha(desde) if desde else hasta - datetime.timedelta(days=30)
+    if desde > hasta:
+        raise ValueError("La fecha inicial es posterior a la final")
+    if (hasta - desde).days >= maximo:
+        raise ValueError(f"Se pueden leer máximo {maximo} días del archivo por consulta")
+    return desde, hasta
+
+# Conversaciones archivadas de un teléfono entre dos fechas, de la más reciente a la más antigua
+def leer_archivo(phone_number, desde, hasta, directorio=CONVERSACIONES_ARCHIVO_DIR):
+    conversaciones = {}
+    fecha = desde
+    while fecha <= hasta:
+        ruta = ruta_particion(directorio, fecha)
+        if os.path.exists(ruta):
+            with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+                for linea in archivo:
+                    # Descartar sin decodificar las líneas que no pueden ser del teléfono
+                    if phone_number not in linea:
+                        continue
+                    conversacion = json_util.loads(linea)
+                    if conversacion.get("phone_number") == phone_number:
+                        conversaciones[conversacion["_id"]] = conversacion
+        fecha += datetime.timedelta(days=1)
+    return sorted(conversaciones.values(), key=lambda conversacion: (conversacion["timestamp"], conversacion["_id"]), reverse=True)
+
+# Pasar los documentos de "conversations" a buckets, por lotes. Cada lote se borra después de
+# escribirlo: si el proceso se corta entre ambos pasos, ese lote queda repetido en los buckets.
+def migrar(db, lote=1000):
+    migradas = 0
+    while True:
+        documentos = list(db.conversations.find().sort("_id", 1).limit(lote))
+        if not documentos:
+            break
+        fallidas = escribir_buckets(db, documentos)
+        if fallidas:
+            raise RuntimeError(f"No se pudieron migrar {fallidas} conversaciones")
+        db.conversations.delete_many({"_id": {"$in": [documento["_id"] for documento in documentos]}})
+        migradas += len(documentos)
+    return migradas
+
+def main():
+    parser = argparse.ArgumentParser(description="Buckets y archivo de conversaciones de jv_chatbot_mvp")
+    parser.add_argument("accion", choices=["archivar", "leer", "migrar"])
+    parser.add_argument("--dias", type=int, default=CONVERSACIONES_ARCHIVO_DIAS)
+    parser.add_argument("--directorio", default=CONVERSACIONES_ARCHIVO_DIR)
+    parser.add_argument("--telefono")
+    parser.add_argument("--desde")
+    parser.add_argument("--hasta")
+    args = parser.parse_args()
+
+    if args.accion == "leer":
+        if not args.telefono:
+            parser.error("leer requiere --telefono")
+        desde, hasta = rango_archivo(args.desde, args.hasta, maximo=36500)
+        for conversacion in leer_archivo(args.telefono, desde, hasta, args.directorio):
+            print(json_util.dumps(conversacion, json_options=json_util.RELAXED_JSON_OPTIONS, ensure_ascii=False))
+        return
+
+    client = MongoClient(os.getenv("MONGODB_URI", 'mongodb://localhost:27017/'))
+    db = client['jv_chatbot_mvp']
+    try:
+        if args.accion == "archivar":
+            archivadas = archivar(db, args.dias, args.directorio)
+            print(f"Conversaciones archivadas por fecha: {json.dumps(archivadas, ensure_ascii=False)}")
+        else:
+            print(f"Conversaciones migradas a buckets: {migrar(db)}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Configuración de gunicorn para servir app.py en producción
+# Uso: gunicorn -c gunicorn.conf.py "app:crear_app()"
+#
+# Un proceso por CPU disponible y varios hilos por proceso: casi todo el tiempo de una solicitud
+# es espera de MongoDB, así que los hilos aprovechan esa espera y los procesos usan todos los
+# núcleos. Cada worker importa app.py después del fork y crea su propio cliente de MongoDB.
+import math
+import os
+
+# CPUs asignadas al contenedor. En Cloud Run el límite viene del cgroup y os.cpu_count()
+# devuelve los núcleos de la máquina, no los de la instancia.
+def cpus_disponibles():
+    try:
+        # cgroup v2: "cuota periodo" o "max periodo"
+        with open("/sys/fs/cgroup/cpu.max") as archivo:
+            cuota, periodo = archivo.read().split()
+        if cuota != "max":
+            return max(1, math.ceil(int(cuota) / int(periodo)))
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as archivo:
+            cuota = int(archivo.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as archivo:
+            periodo = int(archivo.read())
+        if cuota > 0:
+            return max(1, math.ceil(cuota / periodo))
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", cpus_disponibles()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Con gthread, gunicorn reinicia el worker que deja de reportarse durante este tiempo (p. ej. un
+# bloqueo del proceso entero). Va por encima del timeout de las solicitudes de MongoDB
+# (MONGO_SERVER_SELECTION_TIMEOUT_MS, 10 s), así que una consulta lenta no reinicia el worker.
+# Con 0 nunca se reinicia un worker colgado.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 20))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Sin preload: app.py (y su cliente de MongoDB) se importa en cada worker, no en el master
+preload_app = False
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG")
+errorlog = "-"
@@ -0,0 +1,223 @@
+# Manifiesto de índices de la base de datos del chatbot, compartido por app.py e init-db.py
+#
+# Uso:
+#   python indices.py crear      Crea los índices que falten, sin borrar datos
+#   python indices.py verificar  Muestra diferencias entre el manifiesto y la base de datos
+#   python indices.py explain    Ejecuta explain() sobre las consultas de cada ruta
+import argparse
+import json
+import os
+
+import pymongo
+from pymongo import IndexModel, MongoClient
+
+# Índices por colección: llaves y opciones. Los nombres los genera pymongo a partir de las llaves
+# (p. ej. "cedula_1"), igual que los que ya creaba init-db.py.
+INDICES = {
+    "users": [
+        {"keys": [("cedula", pymongo.ASCENDING)], "unique": True},
+    ],
+    "products": [
+        {"keys": [("codigo", pymongo.ASCENDING)], "unique": True},
+        # productos_por_categoria: igualdad en categoria, orden por _id
+        {"keys": [("categoria", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]},
+        # productos_disponibles: igualdad en estado, orden por _id y rango en stock
+        {"keys": [
+            ("estado", pymongo.ASCENDING), ("_id", pymongo.ASCENDING), ("stock", pymongo.ASCENDING)
+        ]},
+    ],
+    "orders": [
+        {"keys": [("numero_pedido", pymongo.ASCENDING)], "unique": True},
+        # obtener_pedidos_usuario: igualdad en cedula_cliente, orden por _id
+        {"keys": [("cedula_cliente", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]},
+    ],
+    "faqs": [
+        {"keys": [("categoria", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]},
+    ],
+    "conversations": [
+        # obtener_conversaciones: filtra por teléfono y ordena por fecha, con _id como desempate
+        {"keys": [
+            ("phone_number", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)
+        ]},
+    ],
+    # Con CONVERSACIONES_ALMACENAMIENTO=buckets (ver conversaciones.py): el $push de guardar filtra por
+    # teléfono e inicio del periodo y la lectura recorre los buckets del teléfono del más nuevo al más
+    # viejo, con el último turno como desempate entre buckets del mismo periodo. "archivar" elige los
+    # buckets por inicio; el $push no cambia inicio, así que ese índice no cuesta en cada conversación.
+    "conversation_buckets": [
+        {"keys": [
+            ("phone_number", pymongo.ASCENDING), ("inicio", pymongo.DESCENDING), ("hasta", pymongo.DESCENDING)
+        ]},
+        {"keys": [("inicio", pymongo.ASCENDING)]},
+    ],
+    # Agregados de analitica.py: las rutas de analítica leen un rango de días
+    "analytics_sales_daily": [
+        {"keys": [("dia", pymongo.ASCENDING)]},
+    ],
+    "analytics_conversations_daily": [
+        {"keys": [("dia", pymongo.ASCENDING)]},
+    ],
+    # Con LIMITES_ALMACEN=mongo (ver limites.py): MongoDB borra los buckets de tokens ya llenos
+    "rate_limits": [
+        {"keys": [("expira", pymongo.ASCENDING)], "expireAfterSeconds": 0},
+    ],
+}
+
+# Forma de la consulta de cada ruta de app.py: colección, filtro, orden y proyección
+CONSULTAS_RUTAS = [
+    {"ruta": "validar_usuario / obtener_usuario", "coleccion": "users", "filtro": {"cedula": "0"}},
+    {"ruta": "obtener_pedidos_usuario", "coleccion": "orders", "filtro": {"cedula_cliente": "0"},
+     "orden": [("_id", 1)], "limite": 51},
+    {"ruta": "obtener_pedido / actualizar_pedido", "coleccion": "orders", "filtro": {"numero_pedido": "PED-00000"}},
+    {"ruta": "actualizar_pedidos_lote", "coleccion": "orders",
+     "filtro": {"numero_pedido": {"$in": ["PED-00000", "PED-00001"]}}, "proyeccion": {"_id": 0, "numero_pedido": 1, "estado": 1}},
+    {"ruta": "productos_por_categoria", "coleccion": "products", "filtro": {"categoria": "UPS"},
+     "orden": [("_id", 1)], "limite": 51},
+    {"ruta": "obtener_producto / verificar_stock", "coleccion": "products", "filtro": {"codigo": "PROD-000"}},
+    {"ruta": "crear_pedido / stock_actual", "coleccion": "products",
+     "filtro": {"codigo": {"$in": ["PROD-000", "PROD-001"]}}, "proyeccion": {"_id": 0, "codigo": 1, "precio": 1}},
+    {"ruta": "productos_disponibles", "coleccion": "products",
+     "filtro": {"estado": "disponible", "stock": {"$gt": 0}}, "orden": [("_id", 1)], "limite": 51},
+    {"ruta": "obtener_faqs", "coleccion": "faqs", "filtro": {}, "orden": [("_id", 1)], "limite": 51},
+    {"ruta": "obtener_faqs (categoria)", "coleccion": "faqs", "filtro": {"categoria": "soporte"},
+     "orden": [("_id", 1)], "limite": 51},
+    {"ruta": "obtener_conversaciones", "coleccion": "conversations", "filtro": {"phone_number": "0"},
+     "orden": [("timestamp", -1), ("_id", -1)], "limite": 11},
+    # Los $lookup de contexto_sesion: últimos pedidos y últimas conversaciones
+    {"ruta": "contexto_sesion (pedidos)", "coleccion": "orders", "filtro": {"cedula_cliente": "0"},
+     "orden": [("_id", -1)], "limite": 5},
+    {"ruta": "contexto_sesion (conversaciones)", "coleccion": "conversations", "filtro": {"phone_number": "0"},
+     "orden": [("timestamp", -1), ("_id", -1)], "limite": 10},
+    {"ruta": "analitica_ventas", "coleccion": "analytics_sales_daily",
+     "filtro": {"dia": {"$gte": "2026-01-01", "$lte": "2026-01-31"}}, "orden": [("dia", 1)]},
+    {"ruta": "analitica_conversaciones", "coleccion": "analytics_conversations_daily",
+     "filtro": {"dia": {"$gte": "2026-01-01", "$lte": "2026-01-31"}}, "orden": [("dia", 1)]},
+    {"ruta": "obtener_conversaciones / contexto_sesion (buckets)", "coleccion": "conversation_buckets",
+     "filtro": {"phone_number": "0"}, "orden": [("inicio", -1), ("hasta", -1)], "limite": 10},
+    {"ruta": "conversaciones.py archivar (buckets)", "coleccion": "conversation_buckets",
+     "filtro": {"inicio": {"$lt": "2026-01-01"}}, "orden": [("inicio", 1)], "limite": 5},
+]
+
+def modelo_indice(indice):
+    opciones = {"expireAfterSeconds": indice["expireAfterSeconds"]} if "expireAfterSeconds" in indice else {}
+    return IndexModel(indice["keys"], unique=indice.get("unique", False), **opciones)
+
+# Crear los índices de una colección; create_indexes no hace nada si ya existen iguales
+def crear_indices_coleccion(db, coleccion):
+    modelos = [modelo_indice(indice) for indice in INDICES.get(coleccion, [])]
+    return db[coleccion].create_indexes(modelos) if modelos else []
+
+# Crear solo los índices que falten, sin tocar los datos ni los índices existentes
+def asegurar_indices(db):
+    creados = {}
+    for faltante in verificar_indices(db)["faltantes"]:
+        coleccion = faltante["coleccion"]
+        creados.setdefault(coleccion, []).extend(db[coleccion].create_indexes([modelo_indice(faltante)]))
+    return creados
+
+# Comparar el manifiesto con los índices existentes (por llaves y unicidad, no por nombre).
+# informacion trae el index_information() de cada colección del manifiesto.
+def comparar_indices(informacion):
+    faltantes = []
+    sobrantes = []
+    for coleccion, indices in INDICES.items():
+        existentes = {}
+        for nombre, info in informacion[coleccion].items():
+            if nombre == "_id_":
+                continue
+            existentes[(tuple((campo, int(direccion)) for campo, direccion in info["key"]), bool(info.get("unique")))] = nombre
+
+        esperados = set()
+        for indice in indices:
+            firma = (tuple(indice["keys"]), indice.get("unique", False))
+            esperados.add(firma)
+            if firma not in existentes:
+                faltante = {
+                    "coleccion": coleccion,
+                    "nombre": modelo_indice(indice).document["name"],
+                    "keys": indice["keys"],
+                    "unique": indice.get("unique", False)
+                }
+                if "expireAfterSeconds" in indice:
+                    faltante["expireAfterSeconds"] = indice["expireAfterSeconds"]
+                faltantes.append(faltante)
+
+        for firma, nombre in existentes.items():
+            if firma not in esperados:
+                sobrantes.append({"coleccion": coleccion, "nombre": nombre, "keys": list(firma[0])})
+
+    return {"faltantes": faltantes, "sobrantes": sobrantes}
+
+def verificar_indices(db):
+    return comparar_indices({coleccion: db[coleccion].index_information() for coleccion in INDICES})
+
+async def verificar_indices_async(db):
+    return comparar_indices({coleccion: await db[coleccion].index_information() for coleccion in INDICES})
+
+def etapas_plan(plan):
+    etapas = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            etapas.append(plan["stage"])
+        for valor in plan.values():
+            etapas.extend(etapas_plan(valor))
+    elif isinstance(plan, list):
+        for valor in plan:
+            etapas.extend(etapas_plan(valor))
+    return etapas
+
+# Ejecutar explain() sobre la consulta de cada ruta y marcar COLLSCAN y ordenamientos en memoria
+def reporte_explain(db):
+    reporte = []
+    for consulta in CONSULTAS_RUTAS:
+        cursor = db[consulta["coleccion"]].find(consulta["filtro"], consulta.get("proyeccion"))
+        if consulta.get("orden"):
+            cursor = cursor.sort(consulta["orden"])
+        if consulta.get("limite"):
+            cursor = cursor.limit(consulta["limite"])
+
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        etapas = etapas_plan(plan)
+        alertas = []
+        if "COLLSCAN" in etapas:
+            alertas.append("COLLSCAN")
+        if "SORT" in etapas:
+            alertas.append("SORT en memoria")
+
+        reporte.append({
+            "ruta": consulta["ruta"],
+            "coleccion": consulta["coleccion"],
+            "etapas": etapas,
+            "alertas": alertas
+        })
+    return reporte
+
+def main():
+    parser = argparse.ArgumentParser(description="Manifiesto de índices de jv_chatbot_mvp")
+    parser.add_argument("accion", choices=["crear", "verificar", "explain"])
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URI", 'mongodb://localhost:27017/'))
+    db = client['jv_chatbot_mvp']
+
+    try:
+        if args.accion == "crear":
+            creados = asegurar_indices(db)
+            print(f"Índices creados: {json.dumps(creados, ensure_ascii=False)}")
+        elif args.accion == "verificar":
+            diferencias = verificar_indices(db)
+            print(json.dumps(diferencias, ensure_ascii=False, indent=2))
+            if diferencias["faltantes"]:
+                raise SystemExit(1)
+        else:
+            reporte = reporte_explain(db)
+            for entrada in reporte:
+                estado = ", ".join(entrada["alertas"]) if entrada["alertas"] else "OK"
+                print(f"[{estado}] {entrada['ruta']} ({entrada['coleccion']}): {' -> '.join(entrada['etapas'])}")
+            if any(entrada["alertas"] for entrada in reporte):
+                raise SystemExit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
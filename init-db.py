@@ -1,11 +1,19 @@
 import pymongo
+import pymongo.errors
 from pymongo import MongoClient
+import argparse
 import datetime
+import multiprocessing
 import random
+import time
 import uuid
+import zlib
 from faker import Faker
 import os
 
+from contadores import formatear_numero_pedido, reservar_bloque
+from indices import asegurar_indices
+
 # Inicializar Faker para generar datos de prueba
 fake = Faker('es_CO')  # Usar localización colombiana
 
@@ -31,180 +39,141 @@ def create_database(client):
     print("Base de datos 'jv_chatbot_mvp' creada correctamente")
     return db
 
-# Crear colección de usuarios
-def create_users_collection(db):
-    users = db['users']
-    
-    # Crear índice único en la cédula
-    users.create_index([("cedula", pymongo.ASCENDING)], unique=True)
-    
-    # Datos de prueba: 50 usuarios
-    user_data = []
-    for _ in range(50):
-        cedula = fake.unique.random_number(digits=10)
-        user = {
-            "cedula": str(cedula),
-            "nombre": fake.name(),
-            "correo": fake.email(),
-            "telefono": fake.phone_number(),
-            "direccion": fake.address(),
-            "fecha_registro": fake.date_time_between(start_date="-2y", end_date="now"),
-            "ultima_compra": fake.date_time_between(start_date="-6M", end_date="now"),
-            "estado": random.choice(["activo", "inactivo"]),
-            "segmento": random.choice(["nuevo", "recurrente", "premium"]),
-        }
-        user_data.append(user)
-    
-    users.insert_many(user_data)
-    print(f"Colección 'users' creada con {users.count_documents({})} documentos")
-    return user_data
+# Generar el usuario número i. La cédula se deriva de i con una permutación de los números de
+# 10 dígitos, así es única sin coordinar procesos y no sigue un orden evidente.
+def generar_usuario(i):
+    cedula = 1000000000 + (i * 7919 + 104729) % 9000000000
+    return {
+        "cedula": str(cedula),
+        "nombre": fake.name(),
+        "correo": fake.email(),
+        "telefono": fake.phone_number(),
+        "direccion": fake.address(),
+        "fecha_registro": fake.date_time_between(start_date="-2y", end_date="now"),
+        "ultima_compra": fake.date_time_between(start_date="-6M", end_date="now"),
+        "estado": random.choice(["activo", "inactivo"]),
+        "segmento": random.choice(["nuevo", "recurrente", "premium"]),
+    }
 
-# Crear colección de productos
-def create_products_collection(db):
-    products = db['products']
-    
-    # Crear índice único en el código de producto
-    products.create_index([("codigo", pymongo.ASCENDING)], unique=True)
-    
-    # Categorías de productos para JV
-    categories = ["UPS", "Baterías", "Inversores", "Reguladores", "Paneles solares", 
-                  "Cargadores", "Accesorios", "Convertidores", "Sistemas de energía"]
+# Categorías de productos para JV
+CATEGORIAS_PRODUCTOS = ["UPS", "Baterías", "Inversores", "Reguladores", "Paneles solares", 
+                        "Cargadores", "Accesorios", "Convertidores", "Sistemas de energía"]
+
+# Generar el producto número i (el código se deriva de la posición)
+def generar_producto(i):
+    codigo = f"PROD-{str(i+1).zfill(3)}"
+    categoria = random.choice(CATEGORIAS_PRODUCTOS)
     
-    # Datos de prueba: 100 productos
-    product_data = []
-    for i in range(100):
-        codigo = f"PROD-{str(i+1).zfill(3)}"
-        categoria = random.choice(categories)
-        
-        # Generar nombre apropiado según la categoría
-        if categoria == "UPS":
-            nombre = f"UPS {random.choice(['Online', 'Interactiva', 'Standby'])} {random.randint(500, 3000)}VA"
-        elif categoria == "Baterías":
-            nombre = f"Batería {random.choice(['Sellada', 'Gel', 'AGM', 'Litio'])} {random.randint(6, 48)}V {random.randint(5, 200)}Ah"
-        elif categoria == "Inversores":
-            nombre = f"Inversor {random.choice(['Onda pura', 'Onda modificada'])} {random.randint(300, 5000)}W"
-        else:
-            nombre = f"{categoria} {random.choice(['Serie A', 'Serie X', 'Premium', 'Estándar', 'Industrial'])}"
-        
-        product = {
-            "codigo": codigo,
-            "nombre": nombre,
-            "categoria": categoria,
-            "descripcion": fake.paragraph(nb_sentences=3),
-            "precio": round(random.uniform(100000, 5000000), -3),  # Precios redondeados a miles
-            "stock": random.randint(0, 100),
-            "fecha_creacion": fake.date_time_between(start_date="-1y", end_date="now"),
-            "especificaciones": {
-                "potencia": f"{random.randint(300, 5000)}W" if categoria in ["UPS", "Inversores"] else None,
-                "voltaje": f"{random.choice([12, 24, 36, 48])}V" if categoria in ["Baterías", "Inversores"] else None,
-                "capacidad": f"{random.randint(5, 200)}Ah" if categoria == "Baterías" else None,
-                "dimensiones": f"{random.randint(10, 100)}x{random.randint(10, 100)}x{random.randint(5, 50)}cm",
-                "peso": f"{random.randint(1, 100)}kg",
-            },
-            "garantia": f"{random.randint(1, 5)} años",
-            "estado": random.choice(["disponible", "agotado", "descontinuado"]),
-        }
-        product_data.append(product)
+    # Generar nombre apropiado según la categoría
+    if categoria == "UPS":
+        nombre = f"UPS {random.choice(['Online', 'Interactiva', 'Standby'])} {random.randint(500, 3000)}VA"
+    elif categoria == "Baterías":
+        nombre = f"Batería {random.choice(['Sellada', 'Gel', 'AGM', 'Litio'])} {random.randint(6, 48)}V {random.randint(5, 200)}Ah"
+    elif categoria == "Inversores":
+        nombre = f"Inversor {random.choice(['Onda pura', 'Onda modificada'])} {random.randint(300, 5000)}W"
+    else:
+        nombre = f"{categoria} {random.choice(['Serie A', 'Serie X', 'Premium', 'Estándar', 'Industrial'])}"
     
-    products.insert_many(product_data)
-    print(f"Colección 'products' creada con {products.count_documents({})} documentos")
-    return product_data
+    return {
+        "codigo": codigo,
+        "nombre": nombre,
+        "categoria": categoria,
+        "descripcion": fake.paragraph(nb_sentences=3),
+        "precio": round(random.uniform(100000, 5000000), -3),  # Precios redondeados a miles
+        "stock": random.randint(0, 100),
+        "fecha_creacion": fake.date_time_between(start_date="-1y", end_date="now"),
+        "especificaciones": {
+            "potencia": f"{random.randint(300, 5000)}W" if categoria in ["UPS", "Inversores"] else None,
+            "voltaje": f"{random.choice([12, 24, 36, 48])}V" if categoria in ["Baterías", "Inversores"] else None,
+            "capacidad": f"{random.randint(5, 200)}Ah" if categoria == "Baterías" else None,
+            "dimensiones": f"{random.randint(10, 100)}x{random.randint(10, 100)}x{random.randint(5, 50)}cm",
+            "peso": f"{random.randint(1, 100)}kg",
+        },
+        "garantia": f"{random.randint(1, 5)} años",
+        "estado": random.choice(["disponible", "agotado", "descontinuado"]),
+    }
+
+# Estados posibles de un pedido
+ESTADOS_PEDIDO = ["pendiente", "confirmado", "en preparación", "en tránsito", "entregado", "cancelado"]
+
+# Métodos de pago
+METODOS_PAGO = ["tarjeta de crédito", "PSE", "transferencia bancaria", "efectivo contra entrega"]
 
-# Crear colección de pedidos
-def create_orders_collection(db, users, products):
-    orders = db['orders']
+# Generar el pedido número i para un usuario y productos al azar
+def generar_pedido(i, users, products):
+    # Seleccionar un usuario aleatorio
+    user = random.choice(users)
+    cedula_cliente = user["cedula"]
     
-    # Crear índice en el número de pedido y cédula para búsquedas rápidas
-    orders.create_index([("numero_pedido", pymongo.ASCENDING)], unique=True)
-    orders.create_index([("cedula_cliente", pymongo.ASCENDING)])
+    # Fecha del pedido (entre 6 meses atrás y ahora)
+    fecha_pedido = fake.date_time_between(start_date="-6M", end_date="now")
     
-    # Estados posibles de un pedido
-    estados_pedido = ["pendiente", "confirmado", "en preparación", "en tránsito", "entregado", "cancelado"]
+    # Estado del pedido
+    estado = random.choice(ESTADOS_PEDIDO)
     
-    # Métodos de pago
-    metodos_pago = ["tarjeta de crédito", "PSE", "transferencia bancaria", "efectivo contra entrega"]
+    # Determinar fechas según el estado
+    fecha_confirmacion = None
+    fecha_preparacion = None
+    fecha_envio = None
+    fecha_entrega = None
     
-    # Datos de prueba: 100 pedidos
-    order_data = []
-    for i in range(100):
-        # Seleccionar un usuario aleatorio
-        user = random.choice(users)
-        cedula_cliente = user["cedula"]
+    if estado != "pendiente":
+        fecha_confirmacion = fecha_pedido + datetime.timedelta(hours=random.randint(1, 24))
         
-        # Fecha del pedido (entre 6 meses atrás y ahora)
-        fecha_pedido = fake.date_time_between(start_date="-6M", end_date="now")
-        
-        # Estado del pedido
-        estado = random.choice(estados_pedido)
-        
-        # Determinar fechas según el estado
-        fecha_confirmacion = None
-        fecha_preparacion = None
-        fecha_envio = None
-        fecha_entrega = None
-        
-        if estado != "pendiente":
-            fecha_confirmacion = fecha_pedido + datetime.timedelta(hours=random.randint(1, 24))
+        if estado not in ["pendiente", "confirmado"]:
+            fecha_preparacion = fecha_confirmacion + datetime.timedelta(hours=random.randint(12, 48))
             
-            if estado not in ["pendiente", "confirmado"]:
-                fecha_preparacion = fecha_confirmacion + datetime.timedelta(hours=random.randint(12, 48))
+            if estado not in ["pendiente", "confirmado", "en preparación"]:
+                fecha_envio = fecha_preparacion + datetime.timedelta(hours=random.randint(12, 24))
                 
-                if estado not in ["pendiente", "confirmado", "en preparación"]:
-                    fecha_envio = fecha_preparacion + datetime.timedelta(hours=random.randint(12, 24))
-                    
-                    if estado == "entregado":
-                        fecha_entrega = fecha_envio + datetime.timedelta(days=random.randint(1, 5))
-        
-        # Crear ítems del pedido (entre 1 y 5 productos)
-        items = []
-        total_pedido = 0
-        
-        num_items = random.randint(1, 5)
-        selected_products = random.sample(products, num_items)
-        
-        for product in selected_products:
-            cantidad = random.randint(1, 3)
-            precio_unitario = product["precio"]
-            subtotal = cantidad * precio_unitario
-            
-            item = {
-                "codigo_producto": product["codigo"],
-                "nombre_producto": product["nombre"],
-                "cantidad": cantidad,
-                "precio_unitario": precio_unitario,
-                "subtotal": subtotal
-            }
-            
-            items.append(item)
-            total_pedido += subtotal
-        
-        # Determinar si tiene un número de guía (solo para pedidos en tránsito o entregados)
-        numero_guia = None
-        if estado in ["en tránsito", "entregado"]:
-            numero_guia = str(uuid.uuid4())[:8].upper()
+                if estado == "entregado":
+                    fecha_entrega = fecha_envio + datetime.timedelta(days=random.randint(1, 5))
+    
+    # Crear ítems del pedido (entre 1 y 5 productos)
+    items = []
+    total_pedido = 0
+    
+    num_items = random.randint(1, 5)
+    selected_products = random.sample(products, num_items)
+    
+    for product in selected_products:
+        cantidad = random.randint(1, 3)
+        precio_unitario = product["precio"]
+        subtotal = cantidad * precio_unitario
         
-        # Crear pedido
-        order = {
-            "numero_pedido": f"PED-{str(i+1).zfill(5)}",
-            "cedula_cliente": cedula_cliente,
-            "fecha_pedido": fecha_pedido,
-            "estado": estado,
-            "items": items,
-            "total": total_pedido,
-            "metodo_pago": random.choice(metodos_pago),
-            "direccion_entrega": user["direccion"],
-            "numero_guia": numero_guia,
-            "fecha_confirmacion": fecha_confirmacion,
-            "fecha_preparacion": fecha_preparacion,
-            "fecha_envio": fecha_envio,
-            "fecha_entrega": fecha_entrega,
-            "notas": fake.text(max_nb_chars=100) if random.random() < 0.3 else None
+        item = {
+            "codigo_producto": product["codigo"],
+            "nombre_producto": product["nombre"],
+            "cantidad": cantidad,
+            "precio_unitario": precio_unitario,
+            "subtotal": subtotal
         }
         
-        order_data.append(order)
+        items.append(item)
+        total_pedido += subtotal
+    
+    # Determinar si tiene un número de guía (solo para pedidos en tránsito o entregados)
+    numero_guia = None
+    if estado in ["en tránsito", "entregado"]:
+        numero_guia = str(uuid.uuid4())[:8].upper()
     
-    orders.insert_many(order_data)
-    print(f"Colección 'orders' creada con {orders.count_documents({})} documentos")
+    # Crear pedido
+    return {
+        "numero_pedido": formatear_numero_pedido(i + 1),
+        "cedula_cliente": cedula_cliente,
+        "fecha_pedido": fecha_pedido,
+        "estado": estado,
+        "items": items,
+        "total": total_pedido,
+        "metodo_pago": random.choice(METODOS_PAGO),
+        "direccion_entrega": user["direccion"],
+        "numero_guia": numero_guia,
+        "fecha_confirmacion": fecha_confirmacion,
+        "fecha_preparacion": fecha_preparacion,
+        "fecha_envio": fecha_envio,
+        "fecha_entrega": fecha_entrega,
+        "notas": fake.text(max_nb_chars=100) if random.random() < 0.3 else None
+    }
 
 # Crear colección de consultas frecuentes
 def create_faqs_collection(db):
@@ -278,33 +247,173 @@ def create_faqs_collection(db):
     faqs.insert_many(faq_data)
     print(f"Colección 'faqs' creada con {faqs.count_documents({})} documentos")
 
-# Crear colección para historial de conversaciones
-def create_conversations_collection(db):
-    conversations = db['conversations']
+# Intenciones y sentimientos que registra el chatbot
+INTENTS_CONVERSACION = ["consulta_pedido", "consulta_producto", "consulta_stock", "crear_pedido",
+                        "preguntas_frecuentes", "soporte", "saludo", "despedida"]
+SENTIMIENTOS_CONVERSACION = ["positivo", "neutral", "negativo"]
+
+# Generar un mensaje de conversación de un usuario al azar
+def generar_conversacion(users):
+    user = random.choice(users)
+    return {
+        "phone_number": user["telefono"],
+        "cedula": user["cedula"],
+        "mensaje": fake.sentence(nb_words=8),
+        "respuesta": fake.sentence(nb_words=15),
+        "timestamp": fake.date_time_between(start_date="-6M", end_date="now"),
+        "intent": random.choice(INTENTS_CONVERSACION),
+        "sentimiento": random.choice(SENTIMIENTOS_CONVERSACION)
+    }
+
+# Carga masiva: cada proceso genera e inserta bloques de documentos con su propia conexión
+GENERADORES = {
+    "users": lambda i, contexto: generar_usuario(i),
+    "products": lambda i, contexto: generar_producto(i),
+    "orders": lambda i, contexto: generar_pedido(i, contexto["users"], contexto["products"]),
+    "conversations": lambda i, contexto: generar_conversacion(contexto["users"]),
+}
+
+_db_trabajador = None
+_contexto_trabajador = None
+
+# Se ejecuta en cada proceso después del fork: pymongo no admite compartir un cliente entre procesos
+def iniciar_trabajador(uri, contexto):
+    global _db_trabajador, _contexto_trabajador
+    _db_trabajador = MongoClient(uri)['jv_chatbot_mvp']
+    _contexto_trabajador = contexto
+
+# Generar e insertar un bloque [inicio, inicio + cantidad) con una semilla fija por bloque
+def sembrar_bloque(tarea):
+    coleccion, inicio, cantidad, semilla, lote = tarea
+    random.seed(semilla)
+    fake.seed_instance(semilla)
+    
+    generador = GENERADORES[coleccion]
+    insertados = 0
+    fallidos = 0
+    documentos = []
+    for i in range(inicio, inicio + cantidad):
+        documentos.append(generador(i, _contexto_trabajador))
+        if len(documentos) >= lote or i == inicio + cantidad - 1:
+            try:
+                insertados += len(_db_trabajador[coleccion].insert_many(documentos, ordered=False).inserted_ids)
+            except pymongo.errors.BulkWriteError as e:
+                insertados += e.details.get('nInserted', 0)
+                fallidos += len(e.details.get('writeErrors', []))
+            documentos = []
+    return insertados, fallidos
+
+# Campos mínimos de usuarios y productos que necesitan los pedidos y conversaciones
+CAMPOS_CONTEXTO = {
+    "users": {"_id": 0, "cedula": 1, "telefono": 1, "direccion": 1},
+    "products": {"_id": 0, "codigo": 1, "nombre": 1, "precio": 1},
+}
+
+def cargar_contexto(db, coleccion, maximo):
+    if db[coleccion].estimated_document_count() > maximo:
+        return list(db[coleccion].aggregate([{"$sample": {"size": maximo}}, {"$project": CAMPOS_CONTEXTO[coleccion]}]))
+    return list(db[coleccion].find({}, CAMPOS_CONTEXTO[coleccion]))
+
+# Sembrar una colección repartiendo bloques entre procesos; devuelve documentos insertados y segundos
+def sembrar_coleccion(db, uri, coleccion, cantidad, inicio=0, lote=1000, procesos=1, semilla=42, contexto=None):
+    if cantidad <= 0:
+        return 0, 0.0
+    
+    tamano_bloque = lote * 10
+    tareas = [
+        # La semilla depende del bloque y no del proceso, así el resultado no cambia con --procesos
+        (coleccion, desde, min(tamano_bloque, inicio + cantidad - desde), zlib.crc32(f"{semilla}:{coleccion}:{desde}".encode()), lote)
+        for desde in range(inicio, inicio + cantidad, tamano_bloque)
+    ]
     
-    # Crear índices para búsquedas rápidas
-    conversations.create_index([("phone_number", pymongo.ASCENDING)])
-    conversations.create_index([("timestamp", pymongo.DESCENDING)])
+    comienzo = time.perf_counter()
+    insertados = 0
+    fallidos = 0
+    if procesos > 1:
+        with multiprocessing.get_context("fork").Pool(procesos, iniciar_trabajador, (uri, contexto)) as pool:
+            for insertados_bloque, fallidos_bloque in pool.imap_unordered(sembrar_bloque, tareas):
+                insertados += insertados_bloque
+                fallidos += fallidos_bloque
+    else:
+        iniciar_trabajador(uri, contexto)
+        for tarea in tareas:
+            insertados_bloque, fallidos_bloque = sembrar_bloque(tarea)
+            insertados += insertados_bloque
+            fallidos += fallidos_bloque
+    segundos = time.perf_counter() - comienzo
     
-    # No insertamos datos de prueba aquí, ya que se poblará con el uso del chatbot
-    print("Colección 'conversations' creada correctamente")
+    mensaje = f"Colección '{coleccion}': {insertados} documentos en {segundos:.1f} s ({insertados / max(segundos, 1e-9):,.0f} docs/s)"
+    if fallidos:
+        mensaje += f", {fallidos} rechazados por duplicados"
+    print(mensaje)
+    return insertados, segundos
+
+# Llenar la base de datos; con agregar=True no se borra nada y los códigos continúan después de los existentes
+def sembrar(client, uri, usuarios=50, productos=100, pedidos=100, conversaciones=0,
+            lote=1000, procesos=1, semilla=42, agregar=False, maximo_contexto=200000):
+    if agregar:
+        db = client['jv_chatbot_mvp']
+    else:
+        db = create_database(client)
+    
+    comienzo = time.perf_counter()
+    total = 0
+    
+    inicio = db.users.estimated_document_count() if agregar else 0
+    total += sembrar_coleccion(db, uri, "users", usuarios, inicio, lote, procesos, semilla)[0]
+    
+    inicio = db.products.estimated_document_count() if agregar else 0
+    total += sembrar_coleccion(db, uri, "products", productos, inicio, lote, procesos, semilla)[0]
+    
+    if pedidos > 0 or conversaciones > 0:
+        contexto = {
+            "users": cargar_contexto(db, "users", maximo_contexto),
+            "products": cargar_contexto(db, "products", maximo_contexto),
+        }
+        # Los números se toman del mismo contador que usa la API, así no chocan con pedidos ya creados
+        inicio = reservar_bloque(db, "pedidos", pedidos)[0] - 1 if pedidos > 0 else 0
+        total += sembrar_coleccion(db, uri, "orders", pedidos, inicio, lote, procesos, semilla, contexto)[0]
+        total += sembrar_coleccion(db, uri, "conversations", conversaciones, 0, lote, procesos, semilla, contexto)[0]
+    
+    if not agregar or db.faqs.estimated_document_count() == 0:
+        create_faqs_collection(db)
+    
+    # Los índices se construyen al final: es más rápido que mantenerlos durante la carga
+    comienzo_indices = time.perf_counter()
+    asegurar_indices(db)
+    print(f"Índices construidos en {time.perf_counter() - comienzo_indices:.1f} s")
+    
+    segundos = time.perf_counter() - comienzo
+    print(f"Total: {total} documentos en {segundos:.1f} s ({total / max(segundos, 1e-9):,.0f} docs/s)")
+    return db
+
+def leer_argumentos():
+    parser = argparse.ArgumentParser(description="Crear la base de datos de prueba del ChatBot de JV")
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--productos", type=int, default=100)
+    parser.add_argument("--pedidos", type=int, default=100)
+    parser.add_argument("--conversaciones", type=int, default=0)
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos por insert_many")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos que generan datos con Faker en paralelo")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--agregar", action="store_true", help="Agregar datos sin borrar las colecciones existentes")
+    return parser.parse_args()
 
 # Función principal
 def main():
+    args = leer_argumentos()
     client = connect_to_mongodb()
     if not client:
         return
     
     try:
-        # Crear la base de datos y colecciones
-        db = create_database(client)
-        
-        # Crear colecciones con datos de prueba
-        users = create_users_collection(db)
-        products = create_products_collection(db)
-        create_orders_collection(db, users, products)
-        create_faqs_collection(db)
-        create_conversations_collection(db)
+        # Crear la base de datos y colecciones con datos de prueba
+        sembrar(
+            client, os.getenv("MONGODB_URI", 'mongodb://localhost:27017/'),
+            usuarios=args.usuarios, productos=args.productos, pedidos=args.pedidos,
+            conversaciones=args.conversaciones, lote=args.lote, procesos=args.procesos,
+            semilla=args.semilla, agregar=args.agregar
+        )
         
         print("\nBase de datos para el MVP del ChatBot de JV creada exitosamente!")
     except Exception as e:
@@ -0,0 +1,344 @@
+# Control de admisión: límite de solicitudes por cliente y descarte de carga
+#
+# - Token bucket por ruta y por cliente: teléfono, cédula e IP. Cada llave presente en la solicitud
+#   (parámetro de la URL o campo del cuerpo JSON) tiene su propio bucket y la solicitud pasa solo si
+#   todos tienen un token. Sin tokens se responde 429 con Retry-After, antes de tocar MongoDB, y los
+#   buckets que ya habían cobrado la solicitud recuperan su token.
+# - Presupuesto por ruta en LIMITES_RUTAS, p. ej. "validar_usuario=10/60": 10 solicitudes de ráfaga
+#   y 10 tokens repuestos cada 60 segundos por teléfono o cédula. Las rutas sin entrada usan
+#   LIMITES_DEFECTO.
+# - La IP tiene su propio presupuesto por ruta, LIMITES_IP, mucho mayor: el bot de WhatsApp llama a la
+#   API desde un solo servidor, así que la IP agrupa a todas las sesiones. Solo frena un barrido de
+#   cédulas o teléfonos desde una misma IP. LIMITES_IP=0 lo desactiva.
+# - Tope de solicitudes simultáneas por proceso. Si la espera reciente por una conexión del pool
+#   supera LIMITES_ESPERA_DB_MS, el tope baja a la mitad y el exceso recibe 503 con Retry-After.
+# - Almacén de buckets en memoria del proceso (por defecto) o compartido en MongoDB
+#   (LIMITES_ALMACEN=mongo) para que el límite valga entre instancias de Cloud Run.
+import contextvars
+import inspect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+
+import metricas
+
+LIMITES_ACTIVOS = os.getenv("LIMITES_ACTIVOS", "1") == "1"
+LIMITES_DEFECTO = os.getenv("LIMITES_DEFECTO", "120/60")
+# validar_usuario y obtener_usuario son las rutas que permiten enumerar cédulas
+LIMITES_RUTAS = os.getenv(
+    "LIMITES_RUTAS", "validar_usuario=10/60,obtener_usuario=30/60,crear_pedido=20/60,crear_pedidos_lote=5/60"
+)
+# Presupuesto por ruta de cada IP, separado del de teléfono y cédula
+LIMITES_IP = os.getenv("LIMITES_IP", "3000/60")
+LIMITES_ALMACEN = os.getenv("LIMITES_ALMACEN", "memoria")
+LIMITES_MAX_CLAVES = int(os.getenv("LIMITES_MAX_CLAVES", 100000))
+# 0 desactiva el tope de concurrencia
+LIMITES_CONCURRENCIA = int(os.getenv("LIMITES_CONCURRENCIA", 64))
+LIMITES_ESPERA_DB_MS = float(os.getenv("LIMITES_ESPERA_DB_MS", 250))
+# Proxies confiables que agregan su IP al final de X-Forwarded-For después de la del cliente
+# (0 en Cloud Run sin balanceador; 1 con un balanceador HTTP externo delante)
+LIMITES_PROXIES = int(os.getenv("LIMITES_PROXIES", 0))
+
+logger = logging.getLogger("dummuy_api")
+
+COLECCION_LIMITES = "rate_limits"
+# Rutas que nunca se limitan: sondas de Cloud Run y métricas
+RUTAS_EXENTAS = {"salud_vivo", "salud_listo", "metrics", "static"}
+# Llaves de cliente que se buscan en los parámetros de la URL y en el cuerpo JSON
+CAMPOS_CLIENTE = {"phone_number": "telefono", "cedula": "cedula", "cedula_cliente": "cedula"}
+
+# Si la solicitud en curso ocupa un lugar del tope de concurrencia
+admitida = contextvars.ContextVar("admitida", default=False)
+
+# "capacidad/segundos" -> (capacidad, tokens por segundo); "0" o vacío -> None, sin límite
+def leer_presupuesto(valor):
+    if not valor or valor.strip() == "0":
+        return None
+    capacidad, _, segundos = valor.partition("/")
+    capacidad = float(capacidad)
+    return capacidad, capacidad / float(segundos or 1)
+
+def leer_presupuestos(valor):
+    presupuestos = {}
+    for parte in valor.split(","):
+        ruta, _, presupuesto = parte.partition("=")
+        if ruta.strip() and presupuesto.strip():
+            presupuestos[ruta.strip()] = leer_presupuesto(presupuesto.strip())
+    return presupuestos
+
+class AlmacenMemoria:
+    """Buckets en memoria del proceso; también sirve de reemplazo del almacén compartido en pruebas.
+
+    Guarda a lo sumo max_claves buckets y descarta el menos usado: un bucket descartado vuelve lleno,
+    así que el límite se relaja un poco ante un barrido de millones de cédulas, pero la memoria no crece.
+    """
+
+    def __init__(self, max_claves=LIMITES_MAX_CLAVES):
+        self.max_claves = max_claves
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    # Devuelve (permitido, segundos hasta el próximo token)
+    def consumir(self, clave, capacidad, tasa):
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, antes = self._buckets.pop(clave, (capacidad, ahora))
+            tokens = min(capacidad, tokens + (ahora - antes) * tasa)
+            permitido = tokens >= 1
+            if permitido:
+                tokens -= 1
+            self._buckets[clave] = (tokens, ahora)
+            while len(self._buckets) > self.max_claves:
+                self._buckets.popitem(last=False)
+        return permitido, 0.0 if permitido else (1 - tokens) / tasa
+
+    # Devolver el token de una solicitud que otro bucket rechazó
+    def devolver(self, clave, capacidad):
+        with self._lock:
+            bucket = self._buckets.get(clave)
+            if bucket is not None:
+                self._buckets[clave] = (min(capacidad, bucket[0] + 1), bucket[1])
+
+# Reponer y consumir un token en una sola actualización atómica del servidor, con su reloj ($$NOW).
+# "expira" marca cuándo el bucket estaría lleno de nuevo; el índice TTL de indices.py lo borra entonces.
+def actualizacion_bucket(capacidad, tasa):
+    transcurrido = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$actualizado", "$$NOW"]}]}, 1000]}
+    repuestos = {"$add": [{"$ifNull": ["$tokens", capacidad]}, {"$multiply": [transcurrido, tasa]}]}
+    return [
+        {"$set": {"tokens": {"$min": [capacidad, repuestos]}, "actualizado": "$$NOW"}},
+        {"$set": {"permitido": {"$gte": ["$tokens", 1]}}},
+        {"$set": {
+            "tokens": {"$cond": ["$permitido", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+            "expira": {"$add": ["$$NOW", math.ceil(capacidad / tasa * 1000)]},
+        }},
+    ]
+
+def devolucion_bucket(capacidad):
+    return [{"$set": {"tokens": {"$min": [capacidad, {"$add": ["$tokens", 1]}]}}}]
+
+def resultado_bucket(bucket, tasa):
+    if bucket["permitido"]:
+        return True, 0.0
+    return False, (1 - bucket["tokens"]) / tasa
+
+class AlmacenMongo:
+    """Buckets compartidos por todas las instancias en la colección rate_limits. Cuesta un viaje a
+    MongoDB por llave de cliente, así que conviene solo donde el límite entre instancias importa."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def consumir(self, clave, capacidad, tasa):
+        bucket = self.db[COLECCION_LIMITES].find_one_and_update(
+            {"_id": clave}, actualizacion_bucket(capacidad, tasa),
+            projection={"tokens": 1, "permitido": 1}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return resultado_bucket(bucket, tasa)
+
+    def devolver(self, clave, capacidad):
+        self.db[COLECCION_LIMITES].update_one({"_id": clave}, devolucion_bucket(capacidad))
+
+class AlmacenMongoAsync(AlmacenMongo):
+    async def consumir(self, clave, capacidad, tasa):
+        bucket = await self.db[COLECCION_LIMITES].find_one_and_update(
+            {"_id": clave}, actualizacion_bucket(capacidad, tasa),
+            projection={"tokens": 1, "permitido": 1}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return resultado_bucket(bucket, tasa)
+
+    async def devolver(self, clave, capacidad):
+        await self.db[COLECCION_LIMITES].update_one({"_id": clave}, devolucion_bucket(capacidad))
+
+def crear_almacen(db, asincrono=False, tipo=LIMITES_ALMACEN):
+    if tipo == "mongo":
+        return AlmacenMongoAsync(db) if asincrono else AlmacenMongo(db)
+    return AlmacenMemoria()
+
+class Limitador:
+    """Presupuestos por ruta, almacén de buckets y tope de solicitudes simultáneas del proceso."""
+
+    def __init__(self, almacen, presupuestos=None, defecto=None, ip=None, concurrencia=LIMITES_CONCURRENCIA,
+                 espera_db_ms=LIMITES_ESPERA_DB_MS, espera_db=metricas.espera_pool_reciente):
+        self.almacen = almacen
+        self.presupuestos = leer_presupuestos(LIMITES_RUTAS) if presupuestos is None else presupuestos
+        self.defecto = leer_presupuesto(defecto or LIMITES_DEFECTO)
+        self.ip = leer_presupuesto(LIMITES_IP if ip is None else ip)
+        self.concurrencia = concurrencia
+        self.espera_db_ms = espera_db_ms
+        self.espera_db = espera_db
+        self.en_curso = 0
+        self._lock = threading.Lock()
+        self.rechazos = metricas.Contador("limites_rechazos_total", "Solicitudes rechazadas por ruta y motivo")
+        # Sin lock: es solo un indicador para /metrics
+        self.errores_almacen = 0
+        os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self.en_curso = 0
+
+    # Presupuesto del bucket de una llave; None si esa llave no se limita
+    def presupuesto(self, ruta, tipo=None):
+        if tipo == "ip":
+            return self.ip
+        return self.presupuestos.get(ruta, self.defecto)
+
+    # Tope vigente: la mitad mientras MongoDB tarda en entregar conexiones
+    def tope(self):
+        if self.espera_db.valor() * 1000 > self.espera_db_ms:
+            return max(1, self.concurrencia // 2)
+        return self.concurrencia
+
+    def entrar(self):
+        if self.concurrencia <= 0:
+            return True
+        with self._lock:
+            if self.en_curso >= self.tope():
+                return False
+            self.en_curso += 1
+            return True
+
+    def salir(self):
+        with self._lock:
+            self.en_curso -= 1
+
+    def metricas(self):
+        return self.rechazos.exponer() + [
+            "# HELP limites_en_curso Solicitudes admitidas en curso en el proceso",
+            "# TYPE limites_en_curso gauge",
+            f"limites_en_curso {self.en_curso}",
+            "# HELP limites_tope_concurrencia Tope vigente de solicitudes simultáneas",
+            "# TYPE limites_tope_concurrencia gauge",
+            f"limites_tope_concurrencia {self.tope()}",
+            "# HELP limites_errores_almacen_total Consultas al almacén de buckets fallidas (la solicitud se admite)",
+            "# TYPE limites_errores_almacen_total counter",
+            f"limites_errores_almacen_total {self.errores_almacen}",
+        ]
+
+# IP del cliente: la última de X-Forwarded-For antes de los proxies confiables. Las anteriores las
+# escribe el propio cliente y no sirven para limitarlo.
+def ip_cliente(request, proxies=LIMITES_PROXIES):
+    reenviadas = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+    if len(reenviadas) > proxies:
+        return reenviadas[-1 - proxies]
+    return request.remote_addr or ""
+
+# Llaves de bucket de la solicitud: (tipo, valor) por teléfono, cédula e IP, sin repetir
+def claves_cliente(request, datos):
+    claves = []
+    for origen in (request.view_args or {}, datos if isinstance(datos, dict) else {}):
+        for campo, tipo in CAMPOS_CLIENTE.items():
+            valor = origen.get(campo)
+            if isinstance(valor, (str, int)) and str(valor) and (tipo, str(valor)) not in claves:
+                claves.append((tipo, str(valor)))
+    claves.append(("ip", ip_cliente(request)))
+    return claves
+
+# Conectar el control de admisión a una app Flask o Quart. Debe registrarse después de metricas,
+# para que los 429 y 503 también se cuenten en http_requests_total. Cada app crea su limitador;
+# app_async.py lo crea con el almacén del driver asíncrono (crear_almacen(db, asincrono=True)).
+def registrar(app, request, limitador, asincrono=False):
+    almacen = limitador.almacen
+
+    def respuesta(codigo, error, espera):
+        segundos = max(1, math.ceil(espera))
+        cuerpo = json.dumps({"success": False, "error": error, "reintentar_en": segundos}, ensure_ascii=False)
+        return app.response_class(cuerpo, status=codigo, headers={"Retry-After": str(segundos)}, mimetype="application/json")
+
+    def exenta():
+        return not LIMITES_ACTIVOS or request.endpoint is None or request.endpoint in RUTAS_EXENTAS
+
+    def buckets(datos):
+        ruta = request.endpoint
+        for tipo, valor in claves_cliente(request, datos):
+            presupuesto = limitador.presupuesto(ruta, tipo)
+            if presupuesto is not None:
+                yield (tipo, f"{ruta}:{tipo}:{valor}") + presupuesto
+
+    def rechazar_limite(tipo, espera):
+        limitador.rechazos.incrementar((("ruta", request.endpoint), ("motivo", f"limite_{tipo}")))
+        return respuesta(429, "Demasiadas solicitudes, intente de nuevo más tarde", espera)
+
+    def admitir():
+        if not limitador.entrar():
+            limitador.rechazos.incrementar((("ruta", request.endpoint), ("motivo", "saturado")))
+            return respuesta(503, "Servicio saturado, intente de nuevo en unos segundos", 1)
+        admitida.set(True)
+        return None
+
+    # Con el almacén caído se admite la solicitud: el límite protege a MongoDB, no debe tumbar la API
+    def fallo_almacen(error):
+        limitador.errores_almacen += 1
+        logger.warning("Error en el almacén de límites: %s", error)
+
+    # Los hilos de Flask se reutilizan: el lugar se libera al terminar cada solicitud
+    def al_terminar(error=None):
+        if admitida.get():
+            admitida.set(False)
+            limitador.salir()
+
+    if asincrono:
+        async def antes_async():
+            if exenta():
+                return None
+            datos = await request.get_json(silent=True) if request.is_json else None
+            cobrados = []
+            for tipo, clave, capacidad, tasa in buckets(datos):
+                try:
+                    resultado = almacen.consumir(clave, capacidad, tasa)
+                    permitido, espera = await resultado if inspect.isawaitable(resultado) else resultado
+                except Exception as e:
+                    fallo_almacen(e)
+                    break
+                if not permitido:
+                    for clave_cobrada, capacidad_cobrada in cobrados:
+                        try:
+                            resultado = almacen.devolver(clave_cobrada, capacidad_cobrada)
+                            if inspect.isawaitable(resultado):
+                                await resultado
+                        except Exception as e:
+                            fallo_almacen(e)
+                    return rechazar_limite(tipo, espera)
+                cobrados.append((clave, capacidad))
+            return admitir()
+
+        async def al_terminar_async(error=None):
+            al_terminar()
+
+        app.before_request(antes_async)
+        app.teardown_request(al_terminar_async)
+    else:
+        def antes_de_solicitud():
+            if exenta():
+                return None
+            datos = request.get_json(silent=True) if request.is_json else None
+            cobrados = []
+            for tipo, clave, capacidad, tasa in buckets(datos):
+                try:
+                    permitido, espera = almacen.consumir(clave, capacidad, tasa)
+                except Exception as e:
+                    fallo_almacen(e)
+                    break
+                if not permitido:
+                    for clave_cobrada, capacidad_cobrada in cobrados:
+                        try:
+                            almacen.devolver(clave_cobrada, capacidad_cobrada)
+                        except Exception as e:
+                            fallo_almacen(e)
+                    return rechazar_limite(tipo, espera)
+                cobrados.append((clave, capacidad))
+            return admitir()
+
+        app.before_request(antes_de_solicitud)
+        app.teardown_request(al_terminar)
@@ -0,0 +1,240 @@
+# Métricas en proceso expuestas en /metrics con el formato de texto de Prometheus
+#
+# - Solicitudes, errores, latencia y tamaño de respuesta por ruta
+# - Tiempo de cada comando de MongoDB por colección, vía los listeners de monitoreo de pymongo
+# - Espera para obtener una conexión del pool
+# - Reparto del tiempo de cada solicitud entre MongoDB, serialización JSON y el resto (framework)
+import bisect
+import contextvars
+import threading
+import time
+
+from pymongo import monitoring
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_TAMANO = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Tiempos acumulados de la solicitud en curso (por hilo en Flask, por tarea en Quart)
+tiempos_solicitud = contextvars.ContextVar("tiempos_solicitud", default=None)
+
+def sumar_tiempo(fase, segundos):
+    tiempos = tiempos_solicitud.get()
+    if tiempos is not None:
+        tiempos[fase] = tiempos.get(fase, 0.0) + segundos
+
+def escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in etiquetas) + "}"
+
+class Contador:
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, etiquetas=(), valor=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + valor
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            for etiquetas, valor in sorted(self._valores.items()):
+                lineas.append(f"{self.nombre}{formatear_etiquetas(etiquetas)} {valor}")
+        return lineas
+
+class PromedioReciente:
+    """Promedio exponencial de las últimas observaciones que decae hacia cero con el tiempo.
+
+    Sin el decaimiento, un pico de espera quedaría fijo mientras no lleguen observaciones nuevas
+    (por ejemplo, mientras limites.py rechaza solicitudes justamente por ese pico).
+    """
+
+    def __init__(self, vida_media, peso=0.2):
+        self.vida_media = vida_media
+        self.peso = peso
+        self._valor = 0.0
+        self._instante = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decaido(self, ahora):
+        return self._valor * 0.5 ** ((ahora - self._instante) / self.vida_media)
+
+    def observar(self, valor):
+        with self._lock:
+            ahora = time.monotonic()
+            self._valor = self._decaido(ahora) * (1 - self.peso) + valor * self.peso
+            self._instante = ahora
+
+    def valor(self):
+        with self._lock:
+            return self._decaido(time.monotonic())
+
+class Histograma:
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, etiquetas=()):
+        posicion = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((etiquetas, [list(serie[0]), serie[1], serie[2]]) for etiquetas, serie in self._series.items())
+        for etiquetas, (conteos, suma, total) in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{formatear_etiquetas(etiquetas + (('le', limite),))} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{formatear_etiquetas(etiquetas)} {suma}")
+            lineas.append(f"{self.nombre}_count{formatear_etiquetas(etiquetas)} {total}")
+        return lineas
+
+solicitudes = Contador("http_requests_total", "Solicitudes HTTP por ruta, método y código de estado")
+errores = Contador("http_errors_total", "Respuestas 5xx por ruta")
+latencia = Histograma("http_request_duration_seconds", "Duración de la solicitud por ruta")
+fases = Histograma("http_request_phase_seconds", "Tiempo de la solicitud por fase: db, serializacion o framework")
+tamano_respuesta = Histograma("http_response_size_bytes", "Tamaño del cuerpo de la respuesta por ruta", BUCKETS_TAMANO)
+comandos_mongo = Histograma("mongo_command_duration_seconds", "Duración de comandos de MongoDB por colección y comando")
+comandos_fallidos = Contador("mongo_command_failures_total", "Comandos de MongoDB fallidos por colección y comando")
+espera_pool = Histograma("mongo_pool_checkout_wait_seconds", "Espera para obtener una conexión del pool")
+checkouts_fallidos = Contador("mongo_pool_checkout_failures_total", "Checkouts del pool fallidos por motivo")
+# Espera reciente del pool en segundos, para el control de carga de limites.py
+espera_pool_reciente = PromedioReciente(vida_media=5.0)
+
+METRICAS = [solicitudes, errores, latencia, fases, tamano_respuesta, comandos_mongo, comandos_fallidos, espera_pool, checkouts_fallidos]
+
+# Funciones adicionales que devuelven líneas ya formateadas (caché, colas, etc.)
+recolectores = []
+
+def exponer():
+    lineas = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.exponer())
+    for recolector in recolectores:
+        lineas.extend(recolector())
+    return "\n".join(lineas) + "\n"
+
+class ListenerComandos(monitoring.CommandListener):
+    """Mide cada comando de MongoDB y lo suma al tiempo de base de datos de la solicitud en curso."""
+
+    def __init__(self):
+        self._colecciones = {}
+
+    def started(self, event):
+        # El evento de fin no trae el comando; se guarda la colección por request_id
+        coleccion = event.command.get(event.command_name)
+        self._colecciones[event.request_id] = coleccion if isinstance(coleccion, str) else ""
+
+    def _terminar(self, event):
+        segundos = event.duration_micros / 1_000_000
+        sumar_tiempo("db", segundos)
+        etiquetas = (("coleccion", self._colecciones.pop(event.request_id, "")), ("comando", event.command_name))
+        comandos_mongo.observar(segundos, etiquetas)
+        return etiquetas
+
+    def succeeded(self, event):
+        self._terminar(event)
+
+    def failed(self, event):
+        comandos_fallidos.incrementar(self._terminar(event))
+
+class ListenerPool(monitoring.ConnectionPoolListener):
+    """Registra la espera para sacar una conexión del pool, que también cuenta como tiempo de base de datos."""
+
+    def connection_checked_out(self, event):
+        if event.duration is not None:
+            espera_pool.observar(event.duration)
+            espera_pool_reciente.observar(event.duration)
+            sumar_tiempo("db", event.duration)
+
+    def connection_check_out_failed(self, event):
+        checkouts_fallidos.incrementar((("motivo", event.reason),))
+
+    # El resto de eventos del pool no se miden
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_checked_in(self, event): pass
+
+def listeners_mongo():
+    return [ListenerComandos(), ListenerPool()]
+
+def iniciar_solicitud():
+    tiempos_solicitud.set({"inicio": time.perf_counter()})
+
+# Registrar la solicitud terminada y devolver el reparto de tiempos para el encabezado Server-Timing
+def terminar_solicitud(ruta, metodo, codigo, tamano):
+    tiempos = tiempos_solicitud.get()
+    if tiempos is None:
+        return None
+    tiempos_solicitud.set(None)
+
+    total = time.perf_counter() - tiempos["inicio"]
+    db = tiempos.get("db", 0.0)
+    serializacion = tiempos.get("serializacion", 0.0)
+    framework = max(total - db - serializacion, 0.0)
+
+    solicitudes.incrementar((("ruta", ruta), ("metodo", metodo), ("codigo", codigo)))
+    if codigo >= 500:
+        errores.incrementar((("ruta", ruta),))
+    latencia.observar(total, (("ruta", ruta),))
+    fases.observar(db, (("ruta", ruta), ("fase", "db")))
+    fases.observar(serializacion, (("ruta", ruta), ("fase", "serializacion")))
+    fases.observar(framework, (("ruta", ruta), ("fase", "framework")))
+    if tamano is not None:
+        tamano_respuesta.observar(tamano, (("ruta", ruta),))
+
+    return {"db": db, "serializacion": serializacion, "framework": framework, "total": total}
+
+# Conectar las métricas a una app Flask o Quart y publicar /metrics.
+# En Quart los hooks deben ser corrutinas para compartir el contexto de la tarea de la solicitud.
+def registrar(app, request, asincrono=False):
+    def despues_de_solicitud(response):
+        ruta = request.endpoint or "sin_ruta"
+        tiempos = terminar_solicitud(ruta, request.method, response.status_code, response.content_length)
+        if tiempos is not None:
+            response.headers["Server-Timing"] = server_timing(tiempos)
+        return response
+
+    if asincrono:
+        async def antes_async():
+            iniciar_solicitud()
+
+        async def despues_async(response):
+            return despues_de_solicitud(response)
+
+        app.before_request(antes_async)
+        app.after_request(despues_async)
+    else:
+        app.before_request(iniciar_solicitud)
+        app.after_request(despues_de_solicitud)
+
+    def metrics():
+        return app.response_class(exponer(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
+
+def server_timing(tiempos):
+    return ", ".join(f"{fase};dur={segundos * 1000:.2f}" for fase, segundos in tiempos.items())
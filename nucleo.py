@@ -0,0 +1,1230 @@
+# Lógica común de app.py (Flask) y app_async.py (Quart)
+#
+# - Validación, armado de pedidos, planes de reserva de stock y de transición de estados, cursores
+#   de paginación, pipeline del contexto de sesión y demás funciones que no dependen del framework
+#   ni del driver de MongoDB. Cada app solo pone la consulta (con pymongo o con el driver asíncrono).
+# - Estado en memoria del proceso: caché del catálogo e índices de búsqueda de productos y FAQs.
+# - Este módulo no crea apps, clientes de MongoDB ni hilos. Así el modo ASGI (MODO_SERVIDOR=asgi)
+#   no arrastra la app Flask, el MongoClient ni los hilos en segundo plano de app.py.
+import base64
+import bisect
+import datetime
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from bson import json_util
+from bson.objectid import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import arranque
+import cache_http
+import coalescencia
+import metricas
+from conversaciones import BUCKETS, etapas_ultimos_turnos, usa_buckets
+from proyecciones import VISTAS, proyeccion_campos, proyectar
+
+logger = logging.getLogger("dummuy_api")
+
+MONGODB_URI = os.getenv("MONGODB_URI", 'mongodb://localhost:27017/')
+
+# Opciones del pool de conexiones, configurables por variables de entorno. Cada worker tiene su
+# propio pool, así que maxPoolSize se multiplica por el número de procesos.
+OPCIONES_MONGO = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 50),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 60000),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 10000),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", None),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000),
+}
+
+def opciones_mongo():
+    opciones = {"tlsAllowInvalidCertificates": True}
+    for opcion, (variable, por_defecto) in OPCIONES_MONGO.items():
+        valor = os.getenv(variable, por_defecto)
+        if valor is not None and valor != "":
+            opciones[opcion] = int(valor)
+    return opciones
+
+# Proveedor JSON que serializa ObjectId, datetime y demás tipos BSON en la misma pasada de jsonify,
+# con la misma forma que bson.json_util ({"$oid": ...}, {"$date": ...})
+class BSONJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        try:
+            return json_util.default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
+    # Medir el tiempo de serialización de cada respuesta para /metrics
+    def dumps(self, obj, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            metricas.sumar_tiempo("serializacion", time.perf_counter() - inicio)
+
+# Los documentos se entregan tal cual a jsonify; el proveedor JSON se encarga de los tipos BSON
+def parse_json(data):
+    return data
+
+# Caché en memoria del catálogo de productos
+# Los productos cambian poco, excepto el stock, que tiene su propio TTL corto.
+CATALOGO_CACHE_MAX = int(os.getenv("CATALOGO_CACHE_MAX", 2000))
+CATALOGO_CACHE_TTL = float(os.getenv("CATALOGO_CACHE_TTL", 300))
+CATALOGO_STOCK_TTL = float(os.getenv("CATALOGO_STOCK_TTL", 5))
+
+class CacheCatalogo:
+    """Caché LRU con expiración por entrada, segura entre hilos."""
+
+    def __init__(self, max_entradas, ttl, ttl_stock):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.ttl_stock = ttl_stock
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._entradas[clave]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def invalidar_tipo(self, tipo):
+        with self._lock:
+            for clave in [clave for clave in self._entradas if clave[0] == tipo]:
+                del self._entradas[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos
+            }
+
+cache_catalogo = CacheCatalogo(CATALOGO_CACHE_MAX, CATALOGO_CACHE_TTL, CATALOGO_STOCK_TTL)
+
+# Parte de la llave de coalescencia que depende de fields/view
+def llave_proyeccion(proyeccion):
+    return None if proyeccion is None else tuple(sorted(proyeccion.items()))
+
+# Invalidar el stock de productos cuyo inventario cambió
+def invalidar_stock(codigos):
+    for codigo in codigos:
+        cache_catalogo.invalidar(("stock", codigo))
+        coalescencia.olvidar("stock", codigo)
+    cache_catalogo.invalidar_tipo("disponibles")
+
+# Invalidar todo lo que se haya guardado sobre un producto
+def invalidar_producto(codigo=None):
+    if codigo is None:
+        cache_catalogo.limpiar()
+        coalescencia.olvidar("producto")
+        coalescencia.olvidar("stock")
+        return
+    cache_catalogo.invalidar(("producto", codigo))
+    cache_catalogo.invalidar(("stock", codigo))
+    coalescencia.olvidar("producto", codigo)
+    coalescencia.olvidar("stock", codigo)
+    cache_catalogo.invalidar_tipo("categoria")
+    cache_catalogo.invalidar_tipo("disponibles")
+
+# Aplicar a la caché y al índice de búsqueda un evento del change stream de productos. Las reservas
+# solo cambian el stock y las marcas de "reservas" (ver la reserva de stock más abajo).
+def aplicar_cambio_producto(cambio):
+    documento = proyectar_producto(cambio.get('fullDocument') or {})
+    codigo = documento.get('codigo')
+    descripcion = cambio.get('updateDescription', {})
+    campos = list(descripcion.get('updatedFields', {})) + descripcion.get('removedFields', [])
+    campos = {campo.split(".")[0] for campo in campos}
+
+    if cambio['operationType'] == 'update' and codigo and campos <= {"stock", "reservas"}:
+        invalidar_stock([codigo])
+    elif codigo and cambio['operationType'] != 'delete':
+        invalidar_producto(codigo)
+        indice_productos.actualizar(documento)
+    else:
+        invalidar_producto()
+        indice_productos.eliminar(_id=cambio.get('documentKey', {}).get('_id'))
+
+CATALOGO_CHANGE_STREAM = os.getenv("CATALOGO_CHANGE_STREAM", "0") == "1"
+
+# Índice invertido en memoria para la búsqueda de productos
+BUSQUEDA_INDICE_TTL = float(os.getenv("BUSQUEDA_INDICE_TTL", 600))
+BUSQUEDA_MAX_PREFIJOS = int(os.getenv("BUSQUEDA_MAX_PREFIJOS", 50))
+BUSQUEDA_MAX_LIMIT = 100
+
+# Peso de cada campo en la relevancia
+PESOS_BUSQUEDA = {"nombre": 3.0, "categoria": 2.0, "descripcion": 1.0, "especificaciones": 1.0}
+
+# Pasar a minúsculas, quitar tildes y separar en palabras ("Batería" -> "bateria")
+def normalizar_texto(texto):
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return re.findall(r"[a-z0-9ñ]+", texto)
+
+def texto_campo(valor):
+    if isinstance(valor, dict):
+        return " ".join(texto_campo(v) for v in valor.values() if v is not None)
+    if isinstance(valor, (list, tuple)):
+        return " ".join(texto_campo(v) for v in valor)
+    return "" if valor is None else str(valor)
+
+class IndiceProductos:
+    """Índice invertido de productos con coincidencia por prefijo y ranking por relevancia."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._vocabulario = []
+        self._vocabulario_sucio = False
+        self._terminos = {}
+        self._productos = {}
+        self._codigo_por_id = {}
+        self.construido = 0
+        self.ttl = BUSQUEDA_INDICE_TTL
+
+    def _quitar(self, codigo):
+        for termino in self._terminos.pop(codigo, ()):
+            posting = self._postings.get(termino)
+            if posting is not None:
+                posting.pop(codigo, None)
+                if not posting:
+                    del self._postings[termino]
+                    self._vocabulario_sucio = True
+        producto = self._productos.pop(codigo, None)
+        if producto is not None:
+            self._codigo_por_id.pop(producto.get("_id"), None)
+
+    def _agregar(self, producto):
+        codigo = producto["codigo"]
+        self._quitar(codigo)
+
+        pesos = {}
+        for campo, peso in PESOS_BUSQUEDA.items():
+            for termino in normalizar_texto(texto_campo(producto.get(campo))):
+                pesos[termino] = pesos.get(termino, 0.0) + peso
+
+        for termino, peso in pesos.items():
+            if termino not in self._postings:
+                self._postings[termino] = {}
+                self._vocabulario_sucio = True
+            self._postings[termino][codigo] = peso
+
+        self._terminos[codigo] = list(pesos)
+        self._productos[codigo] = producto
+        self._codigo_por_id[producto.get("_id")] = codigo
+
+    def reconstruir(self, productos, ttl=BUSQUEDA_INDICE_TTL):
+        with self._lock:
+            self._postings = {}
+            self._terminos = {}
+            self._productos = {}
+            self._codigo_por_id = {}
+            for producto in productos:
+                self._agregar(producto)
+            self._vocabulario = sorted(self._postings)
+            self._vocabulario_sucio = False
+            self.construido = time.monotonic()
+            self.ttl = ttl
+
+    def actualizar(self, producto):
+        with self._lock:
+            self._agregar(producto)
+
+    def eliminar(self, codigo=None, _id=None):
+        with self._lock:
+            if codigo is None:
+                codigo = self._codigo_por_id.get(_id)
+            if codigo is not None:
+                self._quitar(codigo)
+
+    def vencido(self):
+        return not self.construido or time.monotonic() - self.construido > self.ttl
+
+    def _expandir(self, termino):
+        # Términos del vocabulario que empiezan por el prefijo, limitados para acotar el costo
+        if self._vocabulario_sucio:
+            self._vocabulario = sorted(self._postings)
+            self._vocabulario_sucio = False
+        inicio = bisect.bisect_left(self._vocabulario, termino)
+        expandidos = []
+        for candidato in self._vocabulario[inicio:inicio + BUSQUEDA_MAX_PREFIJOS]:
+            if not candidato.startswith(termino):
+                break
+            expandidos.append(candidato)
+        return expandidos
+
+    def buscar(self, consulta, limit=20, offset=0):
+        terminos = normalizar_texto(consulta)
+        if not terminos:
+            return 0, []
+
+        with self._lock:
+            total_productos = max(len(self._productos), 1)
+
+            # Expandir cada término y empezar por el más selectivo para acotar los candidatos
+            expansiones = []
+            for termino in terminos:
+                candidatos = []
+                for candidato in self._expandir(termino):
+                    posting = self._postings[candidato]
+                    idf = math.log(1 + total_productos / len(posting))
+                    # Las coincidencias exactas pesan más que las de prefijo
+                    candidatos.append((posting, idf if candidato == termino else idf * 0.5))
+                if not candidatos:
+                    return 0, []
+                expansiones.append(candidatos)
+            expansiones.sort(key=lambda candidatos: sum(len(posting) for posting, _ in candidatos))
+
+            puntajes = {}
+            for posting, factor in expansiones[0]:
+                for codigo, peso in posting.items():
+                    puntaje = peso * factor
+                    if puntaje > puntajes.get(codigo, 0.0):
+                        puntajes[codigo] = puntaje
+
+            # Todos los términos de la consulta deben coincidir
+            for candidatos in expansiones[1:]:
+                filtrados = {}
+                for codigo, acumulado in puntajes.items():
+                    mejor = 0.0
+                    for posting, factor in candidatos:
+                        peso = posting.get(codigo)
+                        if peso is not None and peso * factor > mejor:
+                            mejor = peso * factor
+                    if mejor:
+                        filtrados[codigo] = acumulado + mejor
+                puntajes = filtrados
+                if not puntajes:
+                    return 0, []
+
+            mejores = heapq.nlargest(offset + limit, puntajes.items(), key=lambda par: (par[1], par[0]))
+            return len(puntajes), [(self._productos[codigo], puntaje) for codigo, puntaje in mejores[offset:]]
+
+indice_productos = IndiceProductos()
+
+# Matriz TF-IDF de preguntas frecuentes para responder por similitud
+FAQS_INDICE_TTL = float(os.getenv("FAQS_INDICE_TTL", 600))
+FAQS_MAX_K = 20
+FAQS_MAX_CONSULTAS = 100
+
+class IndiceFaqs:
+    """Vectores TF-IDF normalizados de pregunta + respuesta en una matriz de NumPy."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.faqs = []
+        self.vocabulario = {}
+        self.idf = None
+        self.matriz = None
+        self.construido = 0
+        self.ttl = FAQS_INDICE_TTL
+        self.sucio = True
+
+    def reconstruir(self, faqs, ttl=FAQS_INDICE_TTL):
+        # NumPy solo se usa aquí: importarlo al primer uso le quita ~60 ms al arranque
+        import numpy as np
+        faqs = list(faqs)
+        documentos = [normalizar_texto(f"{faq.get('pregunta', '')} {faq.get('respuesta', '')}") for faq in faqs]
+
+        vocabulario = {}
+        for terminos in documentos:
+            for termino in terminos:
+                vocabulario.setdefault(termino, len(vocabulario))
+
+        tf = np.zeros((len(documentos), len(vocabulario)), dtype=np.float32)
+        for fila, terminos in enumerate(documentos):
+            for termino in terminos:
+                tf[fila, vocabulario[termino]] += 1.0
+
+        # TF sublineal e IDF suavizado, como en scikit-learn
+        df = np.count_nonzero(tf, axis=0)
+        idf = (np.log((1 + len(documentos)) / (1 + df)) + 1).astype(np.float32)
+        matriz = np.log1p(tf) * idf
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        matriz /= np.where(normas == 0, 1, normas)
+
+        with self._lock:
+            self.faqs = faqs
+            self.vocabulario = vocabulario
+            self.idf = idf
+            self.matriz = matriz
+            self.construido = time.monotonic()
+            self.ttl = ttl
+            self.sucio = False
+
+    def marcar_sucio(self):
+        self.sucio = True
+
+    def vencido(self):
+        return self.sucio or time.monotonic() - self.construido > self.ttl
+
+    def vectorizar(self, consultas):
+        import numpy as np
+        consultas_matriz = np.zeros((len(consultas), len(self.vocabulario)), dtype=np.float32)
+        for fila, consulta in enumerate(consultas):
+            for termino in normalizar_texto(consulta):
+                columna = self.vocabulario.get(termino)
+                if columna is not None:
+                    consultas_matriz[fila, columna] += 1.0
+        consultas_matriz = np.log1p(consultas_matriz) * self.idf
+        normas = np.linalg.norm(consultas_matriz, axis=1, keepdims=True)
+        return consultas_matriz / np.where(normas == 0, 1, normas)
+
+    def buscar(self, consultas, k=3):
+        import numpy as np
+        with self._lock:
+            faqs, matriz = self.faqs, self.matriz
+            if not faqs:
+                return [[] for _ in consultas]
+            # Un solo producto matricial puntúa todas las FAQs contra todas las consultas
+            puntajes = self.vectorizar(consultas) @ matriz.T
+
+        k = min(k, len(faqs))
+        resultados = []
+        for fila in puntajes:
+            mejores = np.argpartition(-fila, k - 1)[:k]
+            mejores = mejores[np.argsort(-fila[mejores])]
+            resultados.append([(faqs[i], float(fila[i])) for i in mejores if fila[i] > 0])
+        return resultados
+
+indice_faqs = IndiceFaqs()
+
+FAQS_CHANGE_STREAM = os.getenv("FAQS_CHANGE_STREAM", "0") == "1"
+
+# Validar los mensajes y el número de resultados pedidos para la búsqueda de FAQs
+def validar_consultas_faqs(consultas, k):
+    if not isinstance(consultas, list) or not all(isinstance(c, str) and c for c in consultas) or not consultas:
+        raise ValueError("Se requiere al menos un mensaje para buscar")
+
+    if len(consultas) > FAQS_MAX_CONSULTAS:
+        raise ValueError(f"Se permiten máximo {FAQS_MAX_CONSULTAS} mensajes por solicitud")
+
+    try:
+        k = min(max(int(k), 1), FAQS_MAX_K)
+    except (TypeError, ValueError):
+        raise ValueError("El parámetro k debe ser un número")
+    return consultas, k
+
+def resultados_faqs(indice, consultas, k, proyeccion=None):
+    return [
+        [dict(proyectar(faq, proyeccion), puntaje=round(puntaje, 4)) for faq, puntaje in coincidencias]
+        for coincidencias in indice.buscar(consultas, k)
+    ]
+
+# Cargar en memoria el catálogo y las FAQs: índices de búsqueda y caché de productos. Con ttl, las
+# entradas vencen antes que las leídas de MongoDB.
+def cargar_catalogo(productos, faqs, ttl=None):
+    productos = list(productos)
+    indice_productos.reconstruir(productos, BUSQUEDA_INDICE_TTL if ttl is None else ttl)
+    for producto in productos[:cache_catalogo.max_entradas]:
+        cache_catalogo.guardar(("producto", producto["codigo"]), producto, ttl)
+    indice_faqs.reconstruir(faqs, FAQS_INDICE_TTL if ttl is None else ttl)
+
+# Snapshot horneado en la imagen: las primeras búsquedas se atienden desde memoria mientras el
+# calentamiento conecta a MongoDB. Sus entradas vencen a los ARRANQUE_SNAPSHOT_TTL segundos, así
+# que si el calentamiento tarda la primera lectura después de ese plazo va a MongoDB. El stock del
+# snapshot se descarta: siempre se consulta en vivo.
+def cargar_snapshot(estado_arranque):
+    snapshot = arranque.cargar_snapshot()
+    if snapshot is not None:
+        productos = [
+            {campo: valor for campo, valor in producto.items() if campo != "stock"}
+            for producto in snapshot["productos"]
+        ]
+        cargar_catalogo(productos, snapshot["faqs"], arranque.ARRANQUE_SNAPSHOT_TTL)
+    estado_arranque.marcar("snapshot")
+
+# Paginación por llave (keyset) para los listados
+PAGINA_POR_DEFECTO = int(os.getenv("PAGINA_POR_DEFECTO", 50))
+PAGINA_MAXIMA = int(os.getenv("PAGINA_MAXIMA", 200))
+
+class CursorInvalido(ValueError):
+    pass
+
+# Cursor opaco con los valores de la llave de orden del último documento de la página
+def codificar_cursor(documento, orden):
+    valores = [documento.get(campo) for campo, _ in orden]
+    return base64.urlsafe_b64encode(json_util.dumps(valores).encode()).decode().rstrip("=")
+
+def decodificar_cursor(token, orden):
+    try:
+        valores = json_util.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode())
+    except Exception:
+        raise CursorInvalido("Cursor no válido")
+    if not isinstance(valores, list) or len(valores) != len(orden):
+        raise CursorInvalido("Cursor no válido")
+    return valores
+
+# Filtro para continuar después de la última llave: (a > x) o (a = x y _id > y)
+def filtro_despues_de(orden, valores):
+    condiciones = []
+    for posicion, (campo, direccion) in enumerate(orden):
+        condicion = {campo_previo: valores[i] for i, (campo_previo, _) in enumerate(orden[:posicion])}
+        condicion[campo] = {"$gt" if direccion == 1 else "$lt": valores[posicion]}
+        condiciones.append(condicion)
+    return {"$or": condiciones}
+
+# Leer limit y cursor de los parámetros de la solicitud, acotando el tamaño de página
+def leer_paginacion(args, limite_por_defecto=None):
+    limite = args.get('limit', limite_por_defecto or PAGINA_POR_DEFECTO, type=int)
+    return min(max(limite, 1), PAGINA_MAXIMA), args.get('cursor')
+
+# Separar la página del documento de más que indica que hay otra
+def cortar_pagina(documentos, limite, orden):
+    siguiente = None
+    if len(documentos) > limite:
+        documentos = documentos[:limite]
+        siguiente = codificar_cursor(documentos[-1], orden)
+    return documentos, siguiente
+
+ORDEN_POR_ID = [("_id", 1)]
+ORDEN_CONVERSACIONES = [("timestamp", -1), ("_id", -1)]
+
+# Filtrar datos sensibles del usuario
+def filtrar_usuario(usuario):
+    return {
+        "cedula": usuario["cedula"],
+        "nombre": usuario["nombre"],
+        "correo": usuario["correo"],
+        "telefono": usuario["telefono"],
+        "estado": usuario["estado"],
+        "segmento": usuario["segmento"]
+    }
+
+VERIFICAR_INDICES = os.getenv("VERIFICAR_INDICES", "1") == "1"
+
+# Avisar en el log de las diferencias con el manifiesto de indices.py
+def avisar_diferencias_indices(diferencias):
+    for faltante in diferencias["faltantes"]:
+        logger.warning("Falta el índice %s en %s; ejecute 'python indices.py crear'", faltante['nombre'], faltante['coleccion'])
+    for sobrante in diferencias["sobrantes"]:
+        logger.warning("Índice %s en %s no está en el manifiesto", sobrante['nombre'], sobrante['coleccion'])
+
+# Números de pedido reservados por bloques en la colección counters (ver contadores.py)
+PEDIDOS_BLOQUE_NUMEROS = int(os.getenv("PEDIDOS_BLOQUE_NUMEROS", 100))
+
+# Construir el documento de un pedido a partir de los productos ya resueltos
+def construir_pedido(data, productos_por_codigo, numero_pedido):
+    # Calcular total del pedido
+    total_pedido = 0
+    items_procesados = []
+
+    for item in data.get('items', []):
+        codigo_producto = item.get('codigo_producto')
+        cantidad = item.get('cantidad', 1)
+
+        producto = productos_por_codigo.get(codigo_producto)
+
+        if producto:
+            precio_unitario = producto.get('precio', 0)
+            subtotal = precio_unitario * cantidad
+
+            item_procesado = {
+                "codigo_producto": codigo_producto,
+                "nombre_producto": producto.get('nombre', ''),
+                # Para las ventas por categoría de analitica.py
+                "categoria": producto.get('categoria', ''),
+                "cantidad": cantidad,
+                "precio_unitario": precio_unitario,
+                "subtotal": subtotal
+            }
+
+            items_procesados.append(item_procesado)
+            total_pedido += subtotal
+
+    return {
+        "numero_pedido": numero_pedido,
+        "cedula_cliente": data.get('cedula_cliente'),
+        "fecha_pedido": datetime.datetime.now(),
+        "estado": "pendiente",
+        "items": items_procesados,
+        "total": total_pedido,
+        "metodo_pago": data.get('metodo_pago', 'pendiente'),
+        "direccion_entrega": data.get('direccion_entrega', ''),
+        "notas": data.get('notas', ''),
+        # Solo se crean pedidos cuyo stock quedó reservado; al cancelarlos se devuelve
+        "stock_reservado": True
+    }
+
+# Las cantidades deben ser enteros positivos, de lo contrario la reserva sumaría stock
+def validar_items(items):
+    if not isinstance(items, list):
+        return "Los items del pedido deben ser una lista"
+    for item in items:
+        if not isinstance(item, dict):
+            return "Cada item debe tener codigo_producto y cantidad"
+        cantidad = item.get('cantidad', 1)
+        if isinstance(cantidad, bool) or not isinstance(cantidad, int) or cantidad < 1:
+            return "La cantidad de cada item debe ser un entero mayor que cero"
+    return None
+
+# Unidades por producto de un pedido, sumando items repetidos
+def cantidades_pedido(pedido):
+    cantidades = {}
+    for item in pedido.get('items', []):
+        cantidades[item['codigo_producto']] = cantidades.get(item['codigo_producto'], 0) + item['cantidad']
+    return cantidades
+
+# Reserva de stock: un solo bulk_write con un UpdateOne condicional por producto de cada pedido,
+# {"codigo": c, "stock": {"$gte": n}} con $inc -n y sin upsert. Cada operación descuenta la cantidad
+# completa o no toca el documento, así que ningún otro pedido ve stock apartado de más.
+# Cada operación deja además su marca en "reservas". Si no se aplicaron todas, una sola lectura con
+# $in dice cuáles sí. Los pedidos a los que les faltó algún producto devuelven lo que alcanzaron a
+# tomar, y en la misma escritura se quitan las marcas. La devolución exige la marca, así que
+# repetirla después de un error no suma stock dos veces. Las lecturas de productos excluyen "reservas".
+PROYECCION_PRODUCTO = {"reservas": 0}
+
+# Quitar las marcas de reserva de un producto que se leyó completo (eventos del change stream)
+def proyectar_producto(producto):
+    return {campo: valor for campo, valor in producto.items() if campo != "reservas"}
+
+def planear_reserva(pedidos):
+    return [
+        {"posicion": posicion, "codigo": codigo, "cantidad": cantidad, "marca": ObjectId()}
+        for posicion, pedido in enumerate(pedidos)
+        for codigo, cantidad in cantidades_pedido(pedido).items()
+    ]
+
+def operaciones_reserva(plan):
+    return [
+        UpdateOne(
+            {"codigo": reserva["codigo"], "stock": {"$gte": reserva["cantidad"]}},
+            {"$inc": {"stock": -reserva["cantidad"]}, "$push": {"reservas": reserva["marca"]}}
+        )
+        for reserva in plan
+    ]
+
+def codigos_reserva(plan):
+    return sorted({reserva["codigo"] for reserva in plan})
+
+# Filtro y proyección de la lectura que dice qué operaciones de la reserva se aplicaron
+def lectura_reserva(plan):
+    return (
+        {"codigo": {"$in": codigos_reserva(plan)}, "reservas": {"$in": [reserva["marca"] for reserva in plan]}},
+        {"_id": 0, "reservas": 1}
+    )
+
+def marcas_aplicadas(documentos):
+    return {marca for documento in documentos for marca in documento.get("reservas", [])}
+
+# Pedidos rechazados (posición -> códigos sin stock suficiente)
+def repartir_reserva(plan, aplicadas):
+    rechazados = {}
+    for reserva in plan:
+        if reserva["marca"] not in aplicadas:
+            rechazados.setdefault(reserva["posicion"], []).append(reserva["codigo"])
+    return rechazados
+
+# Devolver lo reservado solo si la marca sigue en el producto (no suma nada si no se aplicó)
+def operaciones_devolucion(reservas):
+    return [
+        UpdateOne(
+            {"codigo": reserva["codigo"], "reservas": reserva["marca"]},
+            {"$inc": {"stock": reserva["cantidad"]}, "$pull": {"reservas": reserva["marca"]}}
+        )
+        for reserva in reservas
+    ]
+
+# Devolver el stock de los pedidos rechazados y quitar las marcas de los aceptados. Va en un bulk
+# ordenado con el $pull al final: si falla antes, las marcas de los aceptados siguen ahí y
+# cancelar la reserva las devuelve.
+def operaciones_cierre_reserva(plan, rechazados):
+    operaciones = operaciones_devolucion([reserva for reserva in plan if reserva["posicion"] in rechazados])
+    conservadas = [reserva for reserva in plan if reserva["posicion"] not in rechazados]
+    if conservadas:
+        marcas = [reserva["marca"] for reserva in conservadas]
+        operaciones.append(UpdateMany(
+            {"codigo": {"$in": codigos_reserva(conservadas)}, "reservas": {"$in": marcas}},
+            {"$pull": {"reservas": {"$in": marcas}}}
+        ))
+    return operaciones
+
+def operaciones_liberacion(devoluciones):
+    return [UpdateOne({"codigo": codigo}, {"$inc": {"stock": cantidad}}) for codigo, cantidad in devoluciones]
+
+# Unidades que devuelven al inventario los pedidos creados o cancelados
+def devoluciones_pedidos(pedidos):
+    return [
+        (codigo, cantidad)
+        for pedido in pedidos
+        for codigo, cantidad in cantidades_pedido(pedido).items()
+    ]
+
+def mensaje_sin_stock(codigos):
+    return f"Stock insuficiente para: {', '.join(codigos)}"
+
+# Validar cada pedido del lote y reunir los códigos de todos los items
+def validar_pedidos_lote(pedidos):
+    resultados = [None] * len(pedidos)
+    codigos = []
+    for indice, pedido in enumerate(pedidos):
+        if not isinstance(pedido, dict) or not pedido.get('cedula_cliente') or not pedido.get('items'):
+            resultados[indice] = {
+                "indice": indice,
+                "success": False,
+                "error": "Se requiere cédula del cliente e items del pedido"
+            }
+            continue
+        error = validar_items(pedido['items'])
+        if error:
+            resultados[indice] = {"indice": indice, "success": False, "error": error}
+            continue
+        codigos.extend(item.get('codigo_producto') for item in pedido['items'])
+    return resultados, codigos
+
+def construir_pedidos_lote(pedidos, resultados, productos_por_codigo, numeros):
+    validos = [indice for indice, resultado in enumerate(resultados) if resultado is None]
+    nuevos_pedidos = [
+        construir_pedido(pedidos[indice], productos_por_codigo, numero)
+        for indice, numero in zip(validos, numeros)
+    ]
+    return nuevos_pedidos, validos
+
+# Cantidad de pedidos del lote que pasaron la validación y necesitan número
+def pedidos_validos(resultados):
+    return sum(1 for resultado in resultados if resultado is None)
+
+# Marcar como fallidos los pedidos del lote que no alcanzaron stock y quitarlos de la inserción
+def descartar_sin_stock(nuevos_pedidos, indices, resultados, rechazados):
+    for posicion, codigos in rechazados.items():
+        resultados[indices[posicion]] = {
+            "indice": indices[posicion],
+            "success": False,
+            "error": mensaje_sin_stock(codigos)
+        }
+    return (
+        [pedido for posicion, pedido in enumerate(nuevos_pedidos) if posicion not in rechazados],
+        [indice for posicion, indice in enumerate(indices) if posicion not in rechazados]
+    )
+
+# Errores de una escritura masiva indexados por la posición de la operación
+def errores_bulk(error):
+    return {
+        detalle['index']: detalle.get('errmsg', 'Error en la escritura')
+        for detalle in error.details.get('writeErrors', [])
+    }
+
+# Armar la respuesta con el resultado de cada pedido del lote
+def resumen_lote(pedidos, resultados, nuevos_pedidos, indices, errores):
+    for posicion, nuevo_pedido in enumerate(nuevos_pedidos):
+        indice = indices[posicion]
+        if posicion in errores:
+            logger.error("Error al crear pedido %s del lote: %s", indice, errores[posicion])
+            resultados[indice] = {"indice": indice, "success": False, "error": "Error al insertar el pedido"}
+        else:
+            resultados[indice] = {
+                "indice": indice,
+                "success": True,
+                "pedido": parse_json(nuevo_pedido)
+            }
+
+    creados = sum(1 for resultado in resultados if resultado["success"])
+
+    return {
+        "success": creados > 0,
+        "mensaje": f"{creados} de {len(pedidos)} pedidos creados",
+        "creados": creados,
+        "fallidos": len(pedidos) - creados,
+        "resultados": resultados
+    }
+
+def pedidos_insertados(nuevos_pedidos, errores):
+    return [pedido for posicion, pedido in enumerate(nuevos_pedidos) if posicion not in errores]
+
+# Máximo de pedidos aceptados por solicitud en la creación masiva
+MAX_PEDIDOS_LOTE = int(os.getenv("MAX_PEDIDOS_LOTE", 500))
+
+ESTADOS_PEDIDO = ["pendiente", "confirmado", "en preparación", "en tránsito", "entregado", "cancelado"]
+
+# Ciclo de vida de un pedido (el mismo que siembra init-db.py): estados a los que puede pasar cada uno
+TRANSICIONES_PEDIDO = {
+    "pendiente": ["confirmado", "cancelado"],
+    "confirmado": ["en preparación", "cancelado"],
+    "en preparación": ["en tránsito", "cancelado"],
+    "en tránsito": ["entregado", "cancelado"],
+    "entregado": [],
+    "cancelado": []
+}
+
+# Estados desde los que se puede llegar a nuevo_estado
+def estados_origen(nuevo_estado):
+    return [estado for estado, siguientes in TRANSICIONES_PEDIDO.items() if nuevo_estado in siguientes]
+
+def mensaje_transicion_invalida(estado_actual, nuevo_estado):
+    return f"No se puede pasar un pedido de '{estado_actual}' a '{nuevo_estado}'"
+
+# Campos que se actualizan al pasar un pedido a un nuevo estado
+def actualizacion_estado(nuevo_estado, numero_guia=None):
+    actualizacion = {"estado": nuevo_estado}
+
+    if nuevo_estado == "confirmado":
+        actualizacion["fecha_confirmacion"] = datetime.datetime.now()
+    elif nuevo_estado == "en preparación":
+        actualizacion["fecha_preparacion"] = datetime.datetime.now()
+    elif nuevo_estado == "en tránsito":
+        actualizacion["fecha_envio"] = datetime.datetime.now()
+        # La transportadora puede enviar su propio número de guía
+        if not isinstance(numero_guia, str) or not numero_guia:
+            numero_guia = f"GUIA-{str(ObjectId())[-8:].upper()}"
+        actualizacion["numero_guia"] = numero_guia
+    elif nuevo_estado == "entregado":
+        actualizacion["fecha_entrega"] = datetime.datetime.now()
+    elif nuevo_estado == "cancelado":
+        actualizacion["fecha_cancelacion"] = datetime.datetime.now()
+        actualizacion["stock_reservado"] = False
+    return actualizacion
+
+# Filtro y actualización de la transición de un solo pedido. La transición se valida en el filtro
+# de la misma escritura; como cancelado no tiene estados siguientes, un pedido solo se cancela una
+# vez y su stock se devuelve una sola vez.
+def operacion_actualizacion(numero_pedido, nuevo_estado, actualizacion):
+    return (
+        {"numero_pedido": numero_pedido, "estado": {"$in": estados_origen(nuevo_estado)}},
+        {"$set": actualizacion}
+    )
+
+# Máximo de actualizaciones de estado aceptadas por solicitud
+MAX_ACTUALIZACIONES_LOTE = int(os.getenv("MAX_ACTUALIZACIONES_LOTE", 1000))
+
+# Campos del pedido que se necesitan para validar la transición, devolver el stock al cancelar y
+# mover el pedido en los agregados de analitica.py
+PROYECCION_TRANSICION = {
+    "_id": 0, "numero_pedido": 1, "estado": 1, "stock_reservado": 1, "fecha_pedido": 1, "total": 1,
+    "items.codigo_producto": 1, "items.cantidad": 1, "items.subtotal": 1, "items.categoria": 1
+}
+
+def error_actualizacion(indice, numero_pedido, error):
+    return {"indice": indice, "numero_pedido": numero_pedido, "success": False, "error": error}
+
+# Validar cada actualización del lote y reunir los números de pedido a consultar
+def validar_actualizaciones_lote(actualizaciones):
+    resultados = [None] * len(actualizaciones)
+    numeros = set()
+    for indice, actualizacion in enumerate(actualizaciones):
+        if not isinstance(actualizacion, dict) or not isinstance(actualizacion.get('numero_pedido'), str):
+            resultados[indice] = error_actualizacion(indice, None, "Se requiere numero_pedido y estado")
+        elif actualizacion.get('estado') not in ESTADOS_PEDIDO:
+            resultados[indice] = error_actualizacion(
+                indice, actualizacion['numero_pedido'],
+                f"Estado no válido. Debe ser uno de: {', '.join(ESTADOS_PEDIDO)}"
+            )
+        else:
+            numeros.add(actualizacion['numero_pedido'])
+    return resultados, list(numeros)
+
+# Recorrer en orden las actualizaciones de cada pedido a partir de su estado actual. Varias
+# actualizaciones del mismo pedido (p. ej. confirmado y luego en preparación) se combinan en
+# una sola operación con el estado final y todas las fechas.
+def planear_transiciones(actualizaciones, resultados, actuales):
+    planes = {}
+    for indice, actualizacion in enumerate(actualizaciones):
+        if resultados[indice] is not None:
+            continue
+        numero_pedido = actualizacion['numero_pedido']
+        nuevo_estado = actualizacion['estado']
+
+        pedido = actuales.get(numero_pedido)
+        if pedido is None:
+            resultados[indice] = error_actualizacion(indice, numero_pedido, "El pedido no existe")
+            continue
+
+        plan = planes.setdefault(numero_pedido, {"pedido": pedido, "estado": pedido.get('estado'), "cambios": {}, "indices": []})
+        if nuevo_estado not in TRANSICIONES_PEDIDO.get(plan["estado"], []):
+            resultados[indice] = error_actualizacion(indice, numero_pedido, mensaje_transicion_invalida(plan["estado"], nuevo_estado))
+            continue
+
+        cambios = actualizacion_estado(nuevo_estado, actualizacion.get('numero_guia'))
+        resultados[indice] = {
+            "indice": indice,
+            "numero_pedido": numero_pedido,
+            "success": True,
+            "estado_anterior": plan["estado"],
+            "estado": nuevo_estado
+        }
+        if "numero_guia" in cambios:
+            resultados[indice]["numero_guia"] = cambios["numero_guia"]
+
+        plan["cambios"].update(cambios)
+        plan["estado"] = nuevo_estado
+        plan["indices"].append(indice)
+    return [plan for plan in planes.values() if plan["indices"]]
+
+# Filtro y actualización de un pedido, condicionados al estado leído. Sin upsert: si el pedido
+# cambió de estado entre la lectura y la escritura, la operación no coincide con ningún documento.
+def operacion_transicion(plan):
+    return (
+        {"numero_pedido": plan["pedido"]["numero_pedido"], "estado": plan["pedido"].get("estado")},
+        {"$set": plan["cambios"]}
+    )
+
+# Todas las transiciones del lote en un solo bulk_write(ordered=False) de UpdateOne condicionales
+def operaciones_transicion(planes):
+    return [UpdateOne(*operacion_transicion(plan)) for plan in planes]
+
+# Estado final de los pedidos del lote, leído en una sola consulta cuando el bulk_write no
+# coincidió con todos
+def lectura_transiciones(planes):
+    numeros = [plan["pedido"]["numero_pedido"] for plan in planes]
+    return {"numero_pedido": {"$in": numeros}}, {"_id": 0, "numero_pedido": 1, "estado": 1}
+
+# Posiciones de los planes cuyo pedido no quedó en el estado destino
+def transiciones_fallidas(planes, documentos):
+    estados = {documento["numero_pedido"]: documento.get("estado") for documento in documentos}
+    return {
+        posicion for posicion, plan in enumerate(planes)
+        if estados.get(plan["pedido"]["numero_pedido"]) != plan["estado"]
+    }
+
+# Marcar como fallidas las actualizaciones de pedidos que cambiaron entre la lectura y la escritura
+# y devolver los pedidos cancelados cuyo stock hay que liberar
+def resultado_transiciones(planes, resultados, fallidas):
+    cancelados = []
+    for posicion, plan in enumerate(planes):
+        if posicion in fallidas:
+            for indice in plan["indices"]:
+                resultados[indice] = error_actualizacion(
+                    indice, plan["pedido"]["numero_pedido"], "El pedido cambió de estado durante la actualización"
+                )
+        elif plan["estado"] == "cancelado" and plan["pedido"].get("stock_reservado"):
+            cancelados.append(plan["pedido"])
+    return cancelados
+
+# Pedidos del lote que sí cambiaron de estado, con su estado final, para los agregados
+def transiciones_aplicadas(planes, fallidas):
+    return [(plan["pedido"], plan["estado"]) for posicion, plan in enumerate(planes) if posicion not in fallidas]
+
+def resumen_transiciones(resultados):
+    actualizados = sum(1 for resultado in resultados if resultado["success"])
+    return {
+        "success": actualizados > 0,
+        "mensaje": f"{actualizados} de {len(resultados)} actualizaciones aplicadas",
+        "actualizados": actualizados,
+        "fallidos": len(resultados) - actualizados,
+        "resultados": resultados
+    }
+
+def construir_conversacion(data):
+    return {
+        "phone_number": data.get('phone_number'),
+        "cedula": data.get('cedula', ''),
+        "mensaje": data.get('mensaje'),
+        "respuesta": data.get('respuesta', ''),
+        "timestamp": datetime.datetime.now(),
+        "intent": data.get('intent', ''),
+        "sentimiento": data.get('sentimiento', 'neutral')
+    }
+
+# Escritura diferida (write-behind) de conversaciones
+CONVERSACIONES_WRITE_BEHIND = os.getenv("CONVERSACIONES_WRITE_BEHIND", "0") == "1"
+CONVERSACIONES_COLA_MAX = int(os.getenv("CONVERSACIONES_COLA_MAX", 10000))
+CONVERSACIONES_LOTE = int(os.getenv("CONVERSACIONES_LOTE", 500))
+CONVERSACIONES_INTERVALO = float(os.getenv("CONVERSACIONES_INTERVALO", 0.2))
+CONVERSACIONES_ESPERA_COLA = float(os.getenv("CONVERSACIONES_ESPERA_COLA", 0.05))
+
+class ColaLlena(Exception):
+    pass
+
+class EscritorConversacionesBase:
+    """Conversaciones encoladas que aún no se escriben, por teléfono, y contadores de la escritura
+    diferida. app.py (con un hilo) y app_async.py (con una tarea del loop) ponen la cola y la escritura."""
+
+    def __init__(self, db, cola, lote, intervalo):
+        # Se guarda la base de datos y no la colección: la colección queda ligada al cliente
+        # del proceso que la pidió y el escritor corre en el worker
+        self.db = db
+        self.lote = lote
+        self.intervalo = intervalo
+        self._cola = cola
+        self._lock = threading.Lock()
+        self._pendientes = {}
+        self.encolados = 0
+        self.escritos = 0
+        self.fallidos = 0
+        self.rechazados = 0
+
+    def _agregar_pendiente(self, conversacion):
+        # El _id se asigna aquí para poder responder y leer el documento antes de escribirlo
+        conversacion.setdefault("_id", ObjectId())
+        with self._lock:
+            self._pendientes.setdefault(conversacion["phone_number"], {})[conversacion["_id"]] = conversacion
+
+    def _contar_encolada(self):
+        with self._lock:
+            self.encolados += 1
+
+    def _rechazar(self, conversacion):
+        self._quitar_pendientes([conversacion])
+        with self._lock:
+            self.rechazados += 1
+        raise ColaLlena("La cola de conversaciones está llena")
+
+    def pendientes(self, phone_number):
+        with self._lock:
+            return list(self._pendientes.get(phone_number, {}).values())
+
+    def _quitar_pendientes(self, conversaciones):
+        with self._lock:
+            for conversacion in conversaciones:
+                pendientes = self._pendientes.get(conversacion["phone_number"])
+                if pendientes is not None:
+                    pendientes.pop(conversacion["_id"], None)
+                    if not pendientes:
+                        del self._pendientes[conversacion["phone_number"]]
+
+    # Contar el lote según el resultado de la escritura (turnos fallidos en buckets o la excepción)
+    # y devolver las conversaciones escritas. Solo esas cuentan en los agregados; con un bucket
+    # fallido no se sabe cuáles fueron, así que ese lote queda para analitica.py reconstruir.
+    def _terminar_lote(self, lote, resultado):
+        self._quitar_pendientes(lote)
+        if isinstance(resultado, BulkWriteError):
+            errores = errores_bulk(resultado)
+            fallidos = len(errores)
+            escritas = [conversacion for posicion, conversacion in enumerate(lote) if posicion not in errores]
+            logger.error("Error al escribir %s conversaciones: %s", fallidos, resultado)
+        elif isinstance(resultado, Exception):
+            fallidos = len(lote)
+            escritas = []
+            logger.error("Error al escribir lote de conversaciones: %s", resultado)
+        elif resultado:
+            fallidos = resultado
+            escritas = []
+            logger.error("Error al escribir %s conversaciones en buckets", fallidos)
+        else:
+            fallidos = 0
+            escritas = lote
+        with self._lock:
+            self.escritos += len(lote) - fallidos
+            self.fallidos += fallidos
+        return escritas
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "habilitado": True,
+                "en_cola": self._cola.qsize(),
+                "max_cola": self._cola.maxsize,
+                "encolados": self.encolados,
+                "escritos": self.escritos,
+                "fallidos": self.fallidos,
+                "rechazados": self.rechazados
+            }
+
+# Exponer en /metrics los contadores de la caché de catálogo y de la cola de conversaciones
+def recolector_cache_y_cola(escritor):
+    def recolectar():
+        lineas = ["# TYPE catalogo_cache_entradas gauge"]
+        estadisticas = cache_catalogo.estadisticas()
+        lineas.append(f"catalogo_cache_entradas {estadisticas['entradas']}")
+        lineas.append("# TYPE catalogo_cache_aciertos_total counter")
+        lineas.append(f"catalogo_cache_aciertos_total {estadisticas['aciertos']}")
+        lineas.append("# TYPE catalogo_cache_fallos_total counter")
+        lineas.append(f"catalogo_cache_fallos_total {estadisticas['fallos']}")
+        if escritor is not None:
+            estadisticas = escritor.estadisticas()
+            lineas.append("# TYPE conversaciones_cola_tamano gauge")
+            lineas.append(f"conversaciones_cola_tamano {estadisticas['en_cola']}")
+            for contador in ("encolados", "escritos", "fallidos", "rechazados"):
+                lineas.append(f"# TYPE conversaciones_{contador}_total counter")
+                lineas.append(f"conversaciones_{contador}_total {estadisticas[contador]}")
+        return lineas
+    return recolectar
+
+# Los documentos se guardan con precisión de milisegundos, igual que en MongoDB,
+# para que los pendientes ordenen igual que los ya escritos
+def truncar_a_milisegundos(fecha):
+    return fecha.replace(microsecond=fecha.microsecond // 1000 * 1000)
+
+# Mezclar una página leída de MongoDB con las conversaciones aún en cola del mismo número
+def combinar_pendientes(escritor, phone_number, conversaciones, siguiente, limite, cursor):
+    if escritor is None:
+        return conversaciones, siguiente
+
+    pendientes = escritor.pendientes(phone_number)
+    if not pendientes:
+        return conversaciones, siguiente
+
+    llave = lambda conversacion: (conversacion["timestamp"], conversacion["_id"])
+    if cursor:
+        limite_cursor = tuple(decodificar_cursor(cursor, ORDEN_CONVERSACIONES))
+        pendientes = [conversacion for conversacion in pendientes if llave(conversacion) < limite_cursor]
+
+    unicas = {conversacion["_id"]: conversacion for conversacion in conversaciones + pendientes}
+    combinadas = sorted(unicas.values(), key=llave, reverse=True)
+
+    if len(combinadas) > limite or siguiente:
+        combinadas = combinadas[:limite]
+        siguiente = codificar_cursor(combinadas[-1], ORDEN_CONVERSACIONES)
+    return combinadas, siguiente
+
+# Contexto de inicio de sesión del chatbot: perfil, últimos pedidos y últimas conversaciones
+SESION_PEDIDOS = int(os.getenv("SESION_PEDIDOS", 5))
+SESION_CONVERSACIONES = int(os.getenv("SESION_CONVERSACIONES", 10))
+SESION_MAXIMO = 50
+
+# Solo los campos que usa el bot
+PROYECCION_SESION_USUARIO = proyeccion_campos(VISTAS["users"]["perfil"])
+PROYECCION_SESION_PEDIDO = proyeccion_campos(VISTAS["orders"]["resumen"])
+PROYECCION_SESION_CONVERSACION = {"mensaje": 1, "respuesta": 1, "timestamp": 1, "intent": 1, "sentimiento": 1}
+
+def leer_limite_sesion(valor, por_defecto):
+    try:
+        return min(max(int(valor if valor is not None else por_defecto), 0), SESION_MAXIMO)
+    except (TypeError, ValueError):
+        raise ValueError("Los límites de pedidos y conversaciones deben ser números")
+
+# Un solo pipeline sobre users: los pedidos y las conversaciones llegan en $lookup no correlacionados,
+# cada uno con su filtro, orden y límite resueltos por los índices de orders y conversations
+def pipeline_contexto_sesion(cedula, phone_number, pedidos, conversaciones):
+    pipeline = [
+        {"$match": {"cedula": cedula}},
+        {"$limit": 1},
+        {"$project": PROYECCION_SESION_USUARIO}
+    ]
+    # $limit no admite 0: con límite 0 la sección simplemente no se consulta
+    if pedidos:
+        pipeline.append({"$lookup": {
+            "from": "orders",
+            "pipeline": [
+                {"$match": {"cedula_cliente": cedula}},
+                {"$sort": {"_id": -1}},
+                {"$limit": pedidos},
+                {"$project": PROYECCION_SESION_PEDIDO}
+            ],
+            "as": "pedidos"
+        }})
+    if conversaciones and usa_buckets():
+        pipeline.append({"$lookup": {
+            "from": BUCKETS,
+            "pipeline": etapas_ultimos_turnos(phone_number, conversaciones) + [{"$project": PROYECCION_SESION_CONVERSACION}],
+            "as": "conversaciones"
+        }})
+    elif conversaciones:
+        pipeline.append({"$lookup": {
+            "from": "conversations",
+            "pipeline": [
+                {"$match": {"phone_number": phone_number}},
+                {"$sort": dict(ORDEN_CONVERSACIONES)},
+                {"$limit": conversaciones},
+                {"$project": PROYECCION_SESION_CONVERSACION}
+            ],
+            "as": "conversaciones"
+        }})
+    return pipeline
+
+# Separar el resultado del pipeline y sumar las conversaciones que siguen en la cola de escritura
+def armar_contexto_sesion(escritor, documento, phone_number, conversaciones):
+    pedidos = documento.pop("pedidos", [])
+    recientes = documento.pop("conversaciones", [])
+    if conversaciones:
+        recientes, _ = combinar_pendientes(escritor, phone_number, recientes, None, conversaciones, None)
+
+    campos = set(PROYECCION_SESION_CONVERSACION) | {"_id"}
+    return {
+        "success": True,
+        "usuario": documento,
+        "pedidos": pedidos,
+        "conversaciones": [
+            {campo: valor for campo, valor in conversacion.items() if campo in campos}
+            for conversacion in recientes
+        ]
+    }
+
+# Información de la empresa (para preguntas frecuentes)
+INFO_EMPRESA = {
+    "nombre": "JV Energy Solutions",
+    "horario_atencion": {
+        "lunes_viernes": "8:00 AM - 6:00 PM",
+        "sabados": "9:00 AM - 1:00 PM",
+        "domingos_festivos": "Cerrado"
+    },
+    "direccion_principal": "Carrera 62 No. 14-65, Zona Industrial Puente Aranda, Bogotá",
+    "telefonos": {
+        "ventas": "+57 1 5709000",
+        "soporte": "+57 1 5709001",
+        "whatsapp": "+57 3001234567"
+    },
+    "correo": "servicioalcliente@jv.co",
+    "web": "www.jv.co",
+    "redes_sociales": {
+        "facebook": "JVEnergy",
+        "instagram": "@jvenergy",
+        "linkedin": "jv-energy-solutions"
+    },
+    "metodos_pago": [
+        "Tarjetas de crédito (Visa, Mastercard, American Express)",
+        "PSE (Pago Seguro Electrónico)",
+        "Transferencia bancaria",
+        "Efectivo contra entrega (en compras seleccionadas)"
+    ],
+    "politica_garantia": "Los productos JV cuentan con garantía desde 1 año hasta 5 años dependiendo del modelo y tipo de producto.",
+    "plazo_entrega": "Ciudades principales: 1-3 días hábiles. Zonas remotas: 4-7 días hábiles."
+}
+
+# La información de la empresa no cambia: se serializa (con el mismo formato que jsonify) y se
+# comprime una sola vez
+respuesta_info_empresa = cache_http.RespuestaEstatica(
+    (json.dumps({"success": True, "info": INFO_EMPRESA}, sort_keys=True, separators=(",", ":")) + "\n").encode()
+)
+
+# Estado de la conexión según el monitoreo del driver (heartbeats en segundo plano), sin ejecutar
+# ninguna consulta: listo si hay un servidor al que se pueda escribir
+def estado_conexion(cliente):
+    topologia = cliente.topology_description
+    servidores = [
+        {"direccion": f"{host}:{puerto}", "tipo": descripcion.server_type_name}
+        for (host, puerto), descripcion in topologia.server_descriptions().items()
+    ]
+    return topologia.has_writable_server(), servidores
+
+def respuesta_listo(conectado, servidores, resumen_arranque):
+    if not resumen_arranque["listo"]:
+        estado, codigo = "calentando", 503
+    elif conectado:
+        estado, codigo = "listo", 200
+    else:
+        estado, codigo = "sin servidor de MongoDB disponible", 503
+    return {"success": codigo == 200, "estado": estado, "servidores": servidores, "arranque": resumen_arranque}, codigo
@@ -0,0 +1,126 @@
+# Campos seleccionables por el cliente en las rutas de lectura
+#
+#   GET /api/pedidos/PED-00001?fields=estado,numero_guia
+#   GET /api/pedidos/usuario/123?view=resumen
+#
+# "fields" y "view" se validan contra la lista de campos permitidos de cada colección y se
+# traducen a una proyección de MongoDB, así los campos que el bot no usa no se leen del servidor,
+# no viajan por la red y no se serializan. Sin "fields" ni "view" se responde el documento completo.
+# Las rutas que responden desde la caché o desde un índice en memoria aplican la misma proyección
+# con proyectar() antes de serializar.
+
+CAMPOS_PERMITIDOS = {
+    "users": (
+        "_id", "cedula", "nombre", "correo", "telefono", "direccion", "fecha_registro", "ultima_compra",
+        "estado", "segmento",
+    ),
+    "orders": (
+        "_id", "numero_pedido", "cedula_cliente", "fecha_pedido", "estado", "items", "items.codigo_producto",
+        "items.nombre_producto", "items.categoria", "items.cantidad", "items.precio_unitario", "items.subtotal", "total",
+        "metodo_pago", "direccion_entrega", "numero_guia", "fecha_confirmacion", "fecha_preparacion",
+        "fecha_envio", "fecha_entrega", "fecha_cancelacion", "notas",
+    ),
+    "products": (
+        "_id", "codigo", "nombre", "categoria", "descripcion", "precio", "stock", "fecha_creacion",
+        "especificaciones", "especificaciones.potencia", "especificaciones.voltaje",
+        "especificaciones.capacidad", "especificaciones.dimensiones", "especificaciones.peso", "garantia", "estado",
+    ),
+    # verificar_stock solo lee estos campos del producto
+    "stock": ("codigo", "nombre", "stock"),
+    "faqs": ("_id", "categoria", "pregunta", "respuesta"),
+    "conversations": (
+        "_id", "phone_number", "cedula", "mensaje", "respuesta", "timestamp", "intent", "sentimiento",
+    ),
+}
+
+# Vistas compactas con nombre para las consultas más comunes del bot
+VISTAS = {
+    "users": {
+        "perfil": ("cedula", "nombre", "correo", "telefono", "estado", "segmento"),
+        "contacto": ("nombre", "telefono", "correo"),
+    },
+    "orders": {
+        "resumen": ("numero_pedido", "estado", "fecha_pedido", "total", "numero_guia"),
+        "seguimiento": ("numero_pedido", "estado", "numero_guia", "fecha_envio", "fecha_entrega"),
+        "detalle": ("numero_pedido", "estado", "items.nombre_producto", "items.cantidad", "total"),
+    },
+    "products": {
+        "ficha": ("codigo", "nombre", "precio", "stock", "estado"),
+        "precio": ("codigo", "nombre", "precio"),
+    },
+    "faqs": {
+        "respuesta": ("pregunta", "respuesta"),
+    },
+    "conversations": {
+        "historial": ("mensaje", "respuesta", "timestamp"),
+    },
+}
+
+class CamposInvalidos(ValueError):
+    pass
+
+# Proyección de MongoDB que incluye solo `campos`. Un campo anidado sobra si su padre ya está
+# incluido: MongoDB rechaza "items" junto con "items.cantidad".
+def proyeccion_campos(campos):
+    campos = set(campos)
+    proyeccion = {
+        campo: 1 for campo in sorted(campos)
+        if not any(campo.startswith(padre + ".") for padre in campos)
+    }
+    if "_id" not in proyeccion:
+        proyeccion["_id"] = 0
+    return proyeccion
+
+# Leer "fields" y "view" de la solicitud; devuelve la proyección o None para el documento completo
+def leer_proyeccion(coleccion, args):
+    campos_texto = args.get("fields")
+    vista = args.get("view")
+    if not campos_texto and not vista:
+        return None
+
+    campos = []
+    if vista:
+        vistas = VISTAS.get(coleccion, {})
+        if vista not in vistas:
+            raise CamposInvalidos(f"Vista no válida: {vista}. Vistas disponibles: {', '.join(vistas) or 'ninguna'}")
+        campos.extend(vistas[vista])
+    if campos_texto:
+        pedidos = [campo.strip() for campo in campos_texto.split(",") if campo.strip()]
+        invalidos = [campo for campo in pedidos if campo not in CAMPOS_PERMITIDOS[coleccion]]
+        if invalidos:
+            raise CamposInvalidos(f"Campos no permitidos: {', '.join(invalidos)}")
+        campos.extend(pedidos)
+    if not campos:
+        raise CamposInvalidos("Se requiere al menos un campo")
+    return proyeccion_campos(campos)
+
+# Agregar a la proyección las llaves de orden, que la paginación necesita para el cursor. Una
+# proyección que solo excluye campos ya las trae.
+def con_llaves(proyeccion, orden):
+    if proyeccion is None or not any(proyeccion.values()):
+        return proyeccion
+    return dict(proyeccion, **{campo: 1 for campo, _ in orden})
+
+def copiar_ruta(origen, destino, partes):
+    if partes[0] not in origen:
+        return
+    valor = origen[partes[0]]
+    if len(partes) == 1:
+        destino[partes[0]] = valor
+    elif isinstance(valor, dict):
+        copiar_ruta(valor, destino.setdefault(partes[0], {}), partes[1:])
+    elif isinstance(valor, list):
+        copias = destino.setdefault(partes[0], [{} for _ in valor])
+        for elemento, copia in zip(valor, copias):
+            if isinstance(elemento, dict):
+                copiar_ruta(elemento, copia, partes[1:])
+
+# Aplicar una proyección de inclusión a un documento que ya está en memoria
+def proyectar(documento, proyeccion):
+    if proyeccion is None:
+        return documento
+    resultado = {}
+    for campo, incluir in proyeccion.items():
+        if incluir:
+            copiar_ruta(documento, resultado, campo.split("."))
+    return resultado
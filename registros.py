@@ -0,0 +1,220 @@
+# Logging estructurado sin bloquear las solicitudes
+#
+# - Las solicitudes solo encolan el LogRecord (ColaRegistros); un hilo aparte formatea el mensaje,
+#   lo convierte a JSON y hace la escritura a stdout (y al archivo, si se configura)
+# - JSON con los campos que Cloud Logging reconoce (severity, message, time, sourceLocation)
+# - Formato perezoso: logger.info("... %s", valor) solo arma el texto en el hilo del listener
+# - Muestreo por ruta de los logs INFO/DEBUG de alto volumen (LOG_MUESTREO)
+# - Enmascarado de cédula y teléfono en los campos extra, en los argumentos y en el mensaje
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+# Vacío: solo stdout, que Cloud Run envía a Cloud Logging. En Cloud Run el disco es memoria.
+LOG_DIRECTORIO = os.getenv("LOG_DIRECTORIO", "")
+LOG_COLA_MAXIMA = int(os.getenv("LOG_COLA_MAXIMA", 10000))
+# Fracción de logs INFO/DEBUG que se conservan por ruta, p. ej. "validar_usuario=0.1,obtener_usuario=0.1"
+LOG_MUESTREO = os.getenv("LOG_MUESTREO", "")
+LOG_MUESTREO_DEFECTO = float(os.getenv("LOG_MUESTREO_DEFECTO", 1.0))
+
+CAMPOS_PII = ("cedula", "telefono")
+PATRON_PII = re.compile(r"""(['"]?(?:cedula|telefono)['"]?\s*[:=]\s*['"]?)([^'",\s}]+)""", re.IGNORECASE)
+
+# Atributos propios de LogRecord; todo lo demás vino en extra= y se publica como campo del JSON
+ATRIBUTOS_REGISTRO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "ruta"}
+
+# Ruta (endpoint) de la solicitud en curso, por hilo en Flask y por tarea en Quart
+ruta_solicitud = contextvars.ContextVar("ruta_solicitud", default=None)
+
+def enmascarar(valor):
+    texto = str(valor)
+    if len(texto) <= 4:
+        return "*" * len(texto)
+    return "*" * (len(texto) - 4) + texto[-4:]
+
+# Enmascarar recursivamente las claves PII de diccionarios y listas
+def enmascarar_datos(datos):
+    if isinstance(datos, dict):
+        return {
+            clave: enmascarar(valor) if clave in CAMPOS_PII and valor is not None else enmascarar_datos(valor)
+            for clave, valor in datos.items()
+        }
+    if isinstance(datos, (list, tuple)):
+        return type(datos)(enmascarar_datos(valor) for valor in datos)
+    return datos
+
+def enmascarar_texto(texto):
+    return PATRON_PII.sub(lambda coincidencia: coincidencia.group(1) + enmascarar(coincidencia.group(2)), texto)
+
+def leer_muestreo(valor):
+    tasas = {}
+    for parte in valor.split(","):
+        ruta, _, tasa = parte.partition("=")
+        if ruta.strip() and tasa.strip():
+            tasas[ruta.strip()] = float(tasa)
+    return tasas
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar solo una fracción de los logs INFO/DEBUG de cada ruta; WARNING y superiores siempre pasan."""
+
+    def __init__(self, tasas, defecto=1.0):
+        super().__init__()
+        self.tasas = tasas
+        self.defecto = defecto
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        ruta = ruta_solicitud.get()
+        tasa = self.tasas.get(ruta, self.defecto) if ruta is not None else 1.0
+        return tasa >= 1.0 or random.random() < tasa
+
+class ColaRegistros(logging.handlers.QueueHandler):
+    """Encola el registro tal cual; el formateo queda para el hilo del listener.
+
+    QueueHandler.prepare formatea el mensaje en el hilo que registra. Aquí solo se anota la ruta,
+    así que los argumentos deben ser valores que la solicitud no vaya a modificar después.
+    """
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        record.ruta = ruta_solicitud.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Con la cola llena se descarta el registro antes que frenar la solicitud
+            self.descartados += 1
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por registro, con los nombres de campo del logging estructurado de Cloud Logging."""
+
+    def format(self, record):
+        if isinstance(record.args, dict):
+            record.args = enmascarar_datos(record.args)
+        elif record.args:
+            record.args = tuple(enmascarar_datos(argumento) for argumento in record.args)
+
+        entrada = {
+            "severity": record.levelname,
+            "message": enmascarar_texto(record.getMessage()),
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "logger": record.name,
+            "logging.googleapis.com/sourceLocation": {
+                "file": record.pathname, "line": record.lineno, "function": record.funcName
+            },
+        }
+        ruta = getattr(record, "ruta", None)
+        if ruta:
+            entrada["ruta"] = ruta
+        for clave, valor in vars(record).items():
+            if clave not in ATRIBUTOS_REGISTRO:
+                entrada[clave] = enmascarar(valor) if clave in CAMPOS_PII and valor is not None else enmascarar_datos(valor)
+        if record.exc_info:
+            entrada["message"] += "\n" + self.formatException(record.exc_info)
+        return json.dumps(entrada, ensure_ascii=False, default=str)
+
+class CanalRegistros:
+    """Cola, handler y listener de un proceso. Tras un fork el hijo arranca con cola e hilo nuevos."""
+
+    def __init__(self, salidas, max_cola, muestreo):
+        self.salidas = salidas
+        self.handler = ColaRegistros(queue.Queue(max_cola))
+        self.handler.addFilter(muestreo)
+        self.listener = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            if self.listener is None:
+                self.listener = logging.handlers.QueueListener(self.handler.queue, *self.salidas, respect_handler_level=True)
+                self.listener.start()
+
+    # Vaciar la cola antes de salir para no perder los últimos registros
+    def detener(self):
+        with self._lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def _reiniciar(self):
+        # El hilo del listener no existe en el hijo y la cola pudo quedar con su lock tomado
+        self._lock = threading.Lock()
+        self.handler.queue = queue.Queue(self.handler.queue.maxsize)
+        self.listener = None
+        self.iniciar()
+
+    def metricas(self):
+        return [
+            "# HELP logs_descartados_total Registros descartados porque la cola de logs estaba llena",
+            "# TYPE logs_descartados_total counter",
+            f"logs_descartados_total {self.handler.descartados}",
+            "# HELP logs_cola_pendientes Registros en la cola esperando al listener",
+            "# TYPE logs_cola_pendientes gauge",
+            f"logs_cola_pendientes {self.handler.queue.qsize()}",
+        ]
+
+def salidas_registros(directorio=LOG_DIRECTORIO):
+    formateador = FormateadorJSON()
+    salidas = [logging.StreamHandler(sys.stdout)]
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        fecha = datetime.datetime.now().strftime('%Y%m%d')
+        salidas.append(logging.FileHandler(f"{directorio}/whatsapp_bot_{fecha}.log"))
+    for salida in salidas:
+        salida.setFormatter(formateador)
+    return salidas
+
+# Reemplazar los handlers del logger raíz por la cola; devuelve el canal del proceso
+def configurar(nivel=LOG_NIVEL):
+    canal = CanalRegistros(
+        salidas_registros(), LOG_COLA_MAXIMA, FiltroMuestreo(leer_muestreo(LOG_MUESTREO), LOG_MUESTREO_DEFECTO)
+    )
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(canal.handler)
+    raiz.setLevel(nivel)
+
+    canal.iniciar()
+    atexit.register(canal.detener)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=canal._reiniciar)
+    return canal
+
+# Anotar la ruta de cada solicitud para el muestreo y el campo "ruta" del JSON
+def registrar(app, request, asincrono=False):
+    def antes_de_solicitud():
+        ruta_solicitud.set(request.endpoint)
+
+    # Los hilos de Flask se reutilizan: sin esto, un log fuera de solicitud heredaría la ruta anterior
+    def al_terminar(error=None):
+        ruta_solicitud.set(None)
+
+    if asincrono:
+        async def antes_async():
+            antes_de_solicitud()
+
+        async def al_terminar_async(error=None):
+            al_terminar()
+
+        app.before_request(antes_async)
+        app.teardown_request(al_terminar_async)
+    else:
+        app.before_request(antes_de_solicitud)
+        app.teardown_request(al_terminar)
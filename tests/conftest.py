@@ -0,0 +1,84 @@
+import mongomock
+import mongomock.collection
+import pytest
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.results import BulkWriteResult
+
+from contadores import AsignadorNumeros
+
+# Aplicar una operación de bulk_write con el método equivalente de mongomock y sumar su resultado
+def aplicar_operacion(coleccion, indice, operacion, resultado):
+    if isinstance(operacion, InsertOne):
+        coleccion.insert_one(operacion._doc)
+        resultado["nInserted"] += 1
+        return
+    if isinstance(operacion, (DeleteOne, DeleteMany)):
+        borrar = coleccion.delete_one if isinstance(operacion, DeleteOne) else coleccion.delete_many
+        resultado["nRemoved"] += borrar(operacion._filter).deleted_count
+        return
+    if isinstance(operacion, ReplaceOne):
+        escrito = coleccion.replace_one(operacion._filter, operacion._doc, upsert=bool(operacion._upsert))
+    elif isinstance(operacion, (UpdateOne, UpdateMany)):
+        actualizar = coleccion.update_one if isinstance(operacion, UpdateOne) else coleccion.update_many
+        escrito = actualizar(
+            operacion._filter, operacion._doc, upsert=bool(operacion._upsert), array_filters=operacion._array_filters
+        )
+    else:
+        raise TypeError(f"Operación no soportada: {operacion!r}")
+    resultado["nMatched"] += escrito.matched_count
+    resultado["nModified"] += escrito.modified_count
+    if escrito.upserted_id is not None:
+        resultado["nUpserted"] += 1
+        resultado["upserted"].append({"index": indice, "_id": escrito.upserted_id})
+
+# mongomock no acepta en bulk_write las operaciones de las versiones recientes de pymongo. Este
+# bulk_write aplica cada operación con su método de mongomock. Respeta ordered y pasa
+# array_filters, devuelve el mismo BulkWriteResult o BulkWriteError que pymongo y guarda cada
+# llamada (colección, operaciones, ordered) para que las pruebas revisen qué se envió.
+@pytest.fixture(autouse=True)
+def escrituras_bulk(monkeypatch):
+    llamadas = []
+
+    def bulk_write(coleccion, operaciones, ordered=True, **kwargs):
+        operaciones = list(operaciones)
+        llamadas.append((coleccion.name, operaciones, ordered))
+        resultado = {
+            "writeErrors": [], "writeConcernErrors": [], "upserted": [],
+            "nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0
+        }
+        for indice, operacion in enumerate(operaciones):
+            try:
+                aplicar_operacion(coleccion, indice, operacion, resultado)
+            except PyMongoError as e:
+                resultado["writeErrors"].append({"index": indice, "code": getattr(e, "code", None), "errmsg": str(e)})
+                if ordered:
+                    break
+        if resultado["writeErrors"]:
+            raise BulkWriteError(resultado)
+        return BulkWriteResult(resultado, True)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+    return llamadas
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["jv_chatbot_mvp"]
+
+# Cliente de prueba de app.py sobre la base de mongomock, sin límites y con la caché del proceso vacía
+@pytest.fixture
+def api(db, monkeypatch):
+    import app
+    import limites
+    import nucleo
+
+    monkeypatch.setattr(limites, "LIMITES_ACTIVOS", False)
+    monkeypatch.setattr(app, "db", db)
+    monkeypatch.setattr(app, "asignador_pedidos", AsignadorNumeros(db, "pedidos", app.PEDIDOS_BLOQUE_NUMEROS))
+    nucleo.cache_catalogo.limpiar()
+    nucleo.indice_productos.construido = 0
+    nucleo.indice_faqs.marcar_sucio()
+    yield app.app.test_client()
+    nucleo.cache_catalogo.limpiar()
+    nucleo.indice_productos.construido = 0
+    nucleo.indice_faqs.marcar_sucio()
@@ -0,0 +1,71 @@
+import datetime
+
+import analitica
+
+def pedido(numero, categoria_items, estado="pendiente"):
+    items = [
+        {"codigo_producto": codigo, "categoria": categoria, "cantidad": cantidad, "subtotal": 100.0 * cantidad}
+        for codigo, categoria, cantidad in categoria_items
+    ]
+    return {"numero_pedido": numero, "estado": estado, "fecha_pedido": datetime.datetime(2026, 3, 1, 9),
+            "items": items, "total": sum(item["subtotal"] for item in items)}
+
+def ventas(db):
+    return {documento["_id"]: (documento["ventas"], documento["unidades"], documento["pedidos"]) for documento in db[analitica.VENTAS].find()}
+
+def estados(db):
+    return {documento["_id"]: (documento["pedidos"], documento["total"]) for documento in db[analitica.PEDIDOS].find()}
+
+def test_pedidos_nuevos_suman_con_inc(db, escrituras_bulk):
+    analitica.registrar_pedidos(db, [pedido("PED-1", [("A", "UPS", 2), ("B", "Baterías", 1)])])
+    analitica.registrar_pedidos(db, [pedido("PED-2", [("A", "UPS", 1), ("C", "UPS", 1)])])
+
+    assert ventas(db) == {"2026-03-01|UPS": (400.0, 4, 2), "2026-03-01|Baterías": (100.0, 1, 1)}
+    assert estados(db) == {"pendiente": (2, 500.0)}
+    # Cada evento es un solo bulk_write de $inc con upsert por agregado, sin leer los pedidos
+    coleccion, operaciones, ordered = escrituras_bulk[0]
+    assert (coleccion, ordered) == (analitica.VENTAS, False)
+    assert all("$inc" in operacion._doc and operacion._upsert for operacion in operaciones)
+
+def test_cancelar_resta_las_ventas_y_mueve_el_estado(db):
+    creado = pedido("PED-1", [("A", "UPS", 2)])
+    analitica.registrar_pedidos(db, [creado])
+    analitica.registrar_transiciones(db, [(creado, "confirmado")])
+    assert estados(db) == {"pendiente": (0, 0.0), "confirmado": (1, 200.0)}
+
+    analitica.registrar_transiciones(db, [(dict(creado, estado="confirmado"), "cancelado")])
+    assert ventas(db) == {"2026-03-01|UPS": (0.0, 0, 0)}
+    assert estados(db) == {"pendiente": (0, 0.0), "confirmado": (0, 0.0), "cancelado": (1, 200.0)}
+
+def test_cancelado_sin_categoria_la_toma_del_producto(db):
+    db.products.insert_one({"codigo": "A", "categoria": "UPS"})
+    antiguo = pedido("PED-1", [("A", None, 1)], estado="confirmado")
+    analitica.registrar_transiciones(db, [(antiguo, "cancelado")])
+    assert ventas(db) == {"2026-03-01|UPS": (-100.0, -1, -1)}
+
+def test_conversaciones_por_intent_y_sentimiento(db):
+    fecha = datetime.datetime(2026, 3, 1, 12)
+    analitica.registrar_conversaciones(db, [
+        {"timestamp": fecha, "intent": "consulta_pedido"},
+        {"timestamp": fecha, "intent": "consulta_pedido", "sentimiento": "positivo"},
+        {"timestamp": fecha, "intent": "consulta_pedido"},
+    ])
+    conteos = {documento["_id"]: documento["mensajes"] for documento in db[analitica.CONVERSACIONES].find()}
+    assert conteos == {"2026-03-01|consulta_pedido|neutral": 2, "2026-03-01|consulta_pedido|positivo": 1}
+
+def test_una_falla_del_agregado_no_falla_la_solicitud():
+    class Caida:
+        def bulk_write(self, *args, **kwargs):
+            raise RuntimeError("MongoDB no responde")
+
+    class BaseCaida:
+        def __getitem__(self, nombre):
+            return Caida()
+
+    analitica.registrar_pedidos(BaseCaida(), [pedido("PED-1", [("A", "UPS", 1)])])
+
+def test_endpoint_de_ventas(api, db):
+    analitica.registrar_pedidos(db, [pedido("PED-1", [("A", "UPS", 2)])])
+    cuerpo = api.get("/api/analitica/ventas?desde=2026-03-01&hasta=2026-03-02").get_json()
+    assert cuerpo["total"] == {"ventas": 200.0, "unidades": 2}
+    assert api.get("/api/analitica/ventas?desde=2026-03-02&hasta=2026-03-01").status_code == 400
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import app
+import arranque
+import limites
+import nucleo
+
+@pytest.fixture(autouse=True)
+def sin_limites(monkeypatch):
+    monkeypatch.setattr(limites, "LIMITES_ACTIVOS", False)
+
+@pytest.fixture
+def snapshot(db, tmp_path, monkeypatch):
+    db.products.insert_one({
+        "codigo": "PROD-001", "nombre": "Batería del snapshot", "categoria": "Baterías", "stock": 3
+    })
+    db.faqs.insert_one({"categoria": "compras", "pregunta": "¿Cuáles son los métodos de pago?", "respuesta": "PSE"})
+    ruta = str(tmp_path / "snapshot.json.gz")
+    arranque.generar_snapshot(db, ruta)
+
+    # El catálogo vigente cambió después de construir la imagen
+    db.products.update_one({"codigo": "PROD-001"}, {"$set": {"nombre": "Batería vigente", "stock": 7}})
+    monkeypatch.setattr(app, "db", db)
+    cargar_snapshot = arranque.cargar_snapshot
+    monkeypatch.setattr(arranque, "cargar_snapshot", lambda: cargar_snapshot(ruta))
+    nucleo.cache_catalogo.limpiar()
+    yield ruta
+    nucleo.cache_catalogo.limpiar()
+    nucleo.indice_productos.construido = 0
+    nucleo.indice_faqs.marcar_sucio()
+
+def test_snapshot_sirve_el_catalogo_pero_no_el_stock(snapshot, monkeypatch):
+    monkeypatch.setattr(arranque, "ARRANQUE_SNAPSHOT_TTL", 60)
+    nucleo.cargar_snapshot(arranque.Arranque())
+    cliente = app.app.test_client()
+
+    producto = cliente.get("/api/productos/PROD-001").get_json()["producto"]
+    assert (producto["nombre"], producto["stock"]) == ("Batería del snapshot", 7)
+    productos = cliente.get("/api/productos/buscar?q=bateria").get_json()["productos"]
+    assert [producto["stock"] for producto in productos] == [7]
+
+def test_entradas_del_snapshot_vencen_pronto(snapshot, monkeypatch):
+    monkeypatch.setattr(arranque, "ARRANQUE_SNAPSHOT_TTL", 0.05)
+    nucleo.cargar_snapshot(arranque.Arranque())
+    assert nucleo.indice_productos.ttl == 0.05
+    time.sleep(0.1)
+
+    producto = app.app.test_client().get("/api/productos/PROD-001").get_json()["producto"]
+    assert producto["nombre"] == "Batería vigente"
+    assert nucleo.indice_productos.vencido() and nucleo.indice_faqs.vencido()
+
+def test_snapshot_ilegible_arranca_sin_catalogo(tmp_path):
+    ruta = tmp_path / "snapshot.json.gz"
+    ruta.write_bytes(b"no es gzip")
+    assert arranque.cargar_snapshot(str(ruta)) is None
+    assert arranque.cargar_snapshot(str(tmp_path / "no-existe.json.gz")) is None
@@ -0,0 +1,53 @@
+import pytest
+
+import nucleo
+
+PRODUCTOS = [
+    {"_id": 1, "codigo": "A", "nombre": "Batería Gel 12V", "categoria": "Baterías", "descripcion": "Para UPS"},
+    {"_id": 2, "codigo": "B", "nombre": "UPS Interactiva", "categoria": "UPS", "descripcion": "Con batería incluida",
+     "especificaciones": {"potencia": "1000VA"}},
+    {"_id": 3, "codigo": "C", "nombre": "Regulador", "categoria": "Reguladores", "descripcion": "Voltaje estable"},
+]
+
+@pytest.fixture
+def indice():
+    indice = nucleo.IndiceProductos()
+    indice.reconstruir(PRODUCTOS)
+    return indice
+
+def codigos(resultado):
+    return [producto["codigo"] for producto, _ in resultado[1]]
+
+def test_sin_tildes_ni_mayusculas_y_por_prefijo(indice):
+    assert codigos(indice.buscar("BATERIA")) == ["A", "B"]
+    assert codigos(indice.buscar("bat")) == ["A", "B"]
+    assert codigos(indice.buscar("1000va")) == ["B"]
+
+def test_el_nombre_pesa_mas_que_la_descripcion(indice):
+    _, resultados = indice.buscar("bateria")
+    assert resultados[0][1] > resultados[1][1]
+
+def test_todos_los_terminos_deben_coincidir(indice):
+    assert codigos(indice.buscar("bateria interactiva")) == ["B"]
+    assert indice.buscar("bateria regulador") == (0, [])
+    assert indice.buscar("   ") == (0, [])
+
+def test_paginacion_con_total(indice):
+    total, resultados = indice.buscar("bateria", limit=1, offset=1)
+    assert total == 2
+    assert [producto["codigo"] for producto, _ in resultados] == ["B"]
+
+def test_actualizar_y_eliminar(indice):
+    indice.actualizar(dict(PRODUCTOS[2], nombre="Regulador con batería"))
+    assert set(codigos(indice.buscar("bateria"))) == {"A", "B", "C"}
+    indice.eliminar(_id=1)
+    assert "A" not in codigos(indice.buscar("bateria"))
+    assert codigos(indice.buscar("estable")) == ["C"]
+
+def test_la_ruta_busca_en_memoria_con_stock_vigente(api, db):
+    db.products.insert_many([dict(producto, stock=4) for producto in PRODUCTOS])
+    respuesta = api.get("/api/productos/buscar?q=bateria gel")
+    productos = respuesta.get_json()["productos"]
+    assert [(producto["codigo"], producto["stock"]) for producto in productos] == [("A", 4)]
+    assert "relevancia" in productos[0]
+    assert api.get("/api/productos/buscar?q=inexistente").status_code == 404
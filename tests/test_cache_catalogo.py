@@ -0,0 +1,88 @@
+import pytest
+from bson import ObjectId
+
+import nucleo
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(nucleo, "time", reloj)
+    return reloj
+
+def test_entradas_vencen_con_su_ttl(reloj):
+    cache = nucleo.CacheCatalogo(10, ttl=60, ttl_stock=5)
+    cache.guardar(("producto", "A"), {"codigo": "A"})
+    cache.guardar(("stock", "A"), 3, cache.ttl_stock)
+    reloj.ahora += 10
+    assert cache.obtener(("stock", "A")) is None
+    assert cache.obtener(("producto", "A")) == {"codigo": "A"}
+    reloj.ahora += 50
+    assert cache.obtener(("producto", "A")) is None
+    assert cache.estadisticas()["aciertos"] == 1
+
+def test_descarta_la_menos_usada_y_ttl_cero_no_guarda(reloj):
+    cache = nucleo.CacheCatalogo(2, ttl=60, ttl_stock=0)
+    cache.guardar(("producto", "A"), 1)
+    cache.guardar(("producto", "B"), 2)
+    cache.obtener(("producto", "A"))
+    cache.guardar(("producto", "C"), 3)
+    assert cache.obtener(("producto", "B")) is None
+    assert cache.obtener(("producto", "A")) == 1
+
+    cache.guardar(("stock", "A"), 5, cache.ttl_stock)
+    assert cache.obtener(("stock", "A")) is None
+
+@pytest.fixture
+def cache_llena():
+    nucleo.cache_catalogo.limpiar()
+    producto = {"_id": ObjectId(), "codigo": "A", "nombre": "UPS vieja", "stock": 3}
+    nucleo.cache_catalogo.guardar(("producto", "A"), producto)
+    nucleo.cache_catalogo.guardar(("stock", "A"), 3)
+    nucleo.cache_catalogo.guardar(("categoria", "UPS", None, 50), ([producto], None))
+    nucleo.indice_productos.reconstruir([producto])
+    yield producto
+    nucleo.cache_catalogo.limpiar()
+    nucleo.indice_productos.construido = 0
+
+def test_cambio_de_stock_solo_invalida_el_stock(cache_llena):
+    nucleo.aplicar_cambio_producto({
+        "operationType": "update", "fullDocument": dict(cache_llena, stock=1),
+        "updateDescription": {"updatedFields": {"stock": 1, "reservas.0": ObjectId()}, "removedFields": []},
+    })
+    assert nucleo.cache_catalogo.obtener(("stock", "A")) is None
+    assert nucleo.cache_catalogo.obtener(("producto", "A")) is not None
+    assert nucleo.cache_catalogo.obtener(("categoria", "UPS", None, 50)) is not None
+
+def test_cambio_del_producto_invalida_y_actualiza_el_indice(cache_llena):
+    nucleo.aplicar_cambio_producto({
+        "operationType": "update", "fullDocument": dict(cache_llena, nombre="UPS nueva", reservas=[ObjectId()]),
+        "updateDescription": {"updatedFields": {"nombre": "UPS nueva"}, "removedFields": []},
+    })
+    assert nucleo.cache_catalogo.obtener(("producto", "A")) is None
+    assert nucleo.cache_catalogo.obtener(("categoria", "UPS", None, 50)) is None
+    _, resultados = nucleo.indice_productos.buscar("nueva")
+    assert [producto["nombre"] for producto, _ in resultados] == ["UPS nueva"]
+    # Las marcas de las reservas no llegan al índice
+    assert "reservas" not in resultados[0][0]
+
+def test_borrado_limpia_la_cache_y_el_indice(cache_llena):
+    nucleo.aplicar_cambio_producto({"operationType": "delete", "documentKey": {"_id": cache_llena["_id"]}})
+    assert nucleo.cache_catalogo.estadisticas()["entradas"] == 0
+    assert nucleo.indice_productos.buscar("ups") == (0, [])
+
+def test_producto_en_cache_con_stock_vigente(api, db):
+    db.products.insert_one({"codigo": "A", "nombre": "UPS", "stock": 5})
+    assert api.get("/api/productos/A").get_json()["producto"]["stock"] == 5
+
+    # La escritura directa no pasa por la caché del producto, pero el stock se consulta aparte
+    db.products.update_one({"codigo": "A"}, {"$set": {"nombre": "UPS renombrada", "stock": 2}})
+    nucleo.cache_catalogo.invalidar(("stock", "A"))
+    producto = api.get("/api/productos/A").get_json()["producto"]
+    assert (producto["nombre"], producto["stock"]) == ("UPS", 2)
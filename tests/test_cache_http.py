@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import brotli
+import pytest
+
+import cache_http
+
+@pytest.fixture
+def faqs(db):
+    db.faqs.insert_many([
+        {"categoria": "soporte", "pregunta": f"¿Pregunta frecuente número {i}?", "respuesta": "Respuesta larga " * 10}
+        for i in range(20)
+    ])
+
+@pytest.mark.parametrize("accept_encoding, esperada", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("identity", None),
+    (None, None),
+])
+def test_codificacion_aceptada(accept_encoding, esperada):
+    assert cache_http.codificacion_aceptada(accept_encoding) == esperada
+
+def test_etag_y_304(api, faqs):
+    respuesta = api.get("/api/faqs")
+    etag = respuesta.headers["ETag"]
+    assert respuesta.status_code == 200
+    assert respuesta.headers["Cache-Control"].startswith("public")
+    assert "Last-Modified" not in respuesta.headers
+
+    vigente = api.get("/api/faqs", headers={"If-None-Match": etag})
+    assert vigente.status_code == 304
+    assert vigente.data == b""
+    assert vigente.headers["ETag"] == etag
+
+    assert api.get("/api/faqs", headers={"If-None-Match": '"otro"'}).status_code == 200
+
+def test_gzip_y_brotli_con_su_propio_etag(api, faqs):
+    plano = api.get("/api/faqs")
+    comprimido = api.get("/api/faqs", headers={"Accept-Encoding": "gzip"})
+    assert comprimido.headers["Content-Encoding"] == "gzip"
+    assert comprimido.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(comprimido.data) == plano.data
+    assert comprimido.headers["ETag"] == plano.headers["ETag"][:-1] + '-gzip"'
+
+    brotli_respuesta = api.get("/api/faqs", headers={"Accept-Encoding": "br"})
+    assert brotli_respuesta.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(brotli_respuesta.data) == plano.data
+
+    # El ETag de una codificación valida la representación de otra
+    vigente = api.get("/api/faqs", headers={"Accept-Encoding": "br", "If-None-Match": comprimido.headers["ETag"]})
+    assert vigente.status_code == 304
+
+def test_respuestas_pequenas_y_escrituras_no_se_procesan(api):
+    validar = api.post("/api/usuarios/validar", json={"cedula": "1"}, headers={"Accept-Encoding": "gzip"})
+    assert "ETag" not in validar.headers
+    assert "Content-Encoding" not in validar.headers
+
+def test_respuesta_estatica_con_last_modified(api):
+    respuesta = api.get("/api/empresa/info", headers={"Accept-Encoding": "gzip"})
+    assert respuesta.status_code == 200
+    assert json.loads(gzip.decompress(respuesta.data))["success"]
+    vigente = api.get("/api/empresa/info", headers={"If-Modified-Since": respuesta.headers["Last-Modified"]})
+    assert vigente.status_code == 304
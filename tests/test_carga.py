@@ -0,0 +1,73 @@
+import json
+import random
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, "benchmarks")
+
+import carga
+
+MUESTRAS = {
+    "cedulas": ["1", "2", "3"],
+    "telefonos": ["3000000001", "3000000002"],
+    "codigos": ["PROD-001", "PROD-002", "PROD-003", "PROD-004"],
+    "categorias": ["UPS", "Baterías"],
+    "pedidos": ["PED-00001", "PED-00002"],
+}
+
+class ClienteFalso:
+    def __init__(self):
+        self.solicitudes = []
+
+    def solicitar(self, endpoint, metodo, ruta, cuerpo=None):
+        self.solicitudes.append((endpoint, metodo, ruta, cuerpo))
+        return {}
+
+def simular(semilla, sesiones=20):
+    cliente = ClienteFalso()
+    rng = random.Random(semilla)
+    for _ in range(sesiones):
+        carga.sesion(cliente, MUESTRAS, rng)
+    return cliente.solicitudes
+
+def test_la_misma_semilla_repite_el_trafico():
+    assert simular(42) == simular(42)
+    assert simular(42) != simular(43)
+
+def test_cada_sesion_sigue_el_flujo_del_chatbot():
+    solicitudes = simular(7, sesiones=1)
+    assert [endpoint for endpoint, *_ in solicitudes[:5]] == [
+        "validar_usuario", "obtener_pedidos_usuario", "buscar_productos", "buscar_faqs", "guardar_conversacion"
+    ]
+    assert len(solicitudes) == 7
+
+def test_percentil_por_rango_mas_cercano():
+    valores = [float(i) for i in range(1, 101)]
+    assert carga.percentil(valores, 50) == 50.0
+    assert carga.percentil(valores, 95) == 95.0
+    assert carga.percentil(valores, 99) == 99.0
+    assert carga.percentil([3.0], 99) == 3.0
+    assert carga.percentil([], 50) is None
+
+def test_resumen_separa_errores_y_429():
+    resultados = [("a", 0.010, 200), ("a", 0.030, 200), ("a", 5.0, 429), ("a", 0.020, 500), ("b", 0.001, 0)]
+    resumen = carga.resumir(resultados, duracion=2)
+    assert resumen["a"] == {
+        "solicitudes": 4, "errores": 1, "limitadas": 1, "throughput_rps": 2.0,
+        "media_ms": 20.0, "p50_ms": 20.0, "p95_ms": 30.0, "p99_ms": 30.0,
+    }
+    assert resumen["b"]["errores"] == 1
+    assert list(resumen) == ["a", "b"]
+
+def test_comparar_reportes(tmp_path, capsys):
+    def reporte(commit, rps):
+        return {"commit": commit, "total": {"solicitudes": 1, "limitadas": 0},
+                "endpoints": {"buscar_productos": {"throughput_rps": rps, "p50_ms": 1.0, "p99_ms": 2.0}}}
+    base, nuevo = tmp_path / "a.json", tmp_path / "b.json"
+    base.write_text(json.dumps(reporte("aaa", 10.0)))
+    nuevo.write_text(json.dumps(reporte("bbb", 20.0)))
+
+    carga.comparar(SimpleNamespace(base=str(base), nuevo=str(nuevo)))
+    salida = capsys.readouterr().out
+    assert "aaa -> bbb" in salida
+    assert "10.0 -> 20.0" in salida
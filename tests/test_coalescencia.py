@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import coalescencia
+
+def coalescidas(tipo):
+    return coalescencia.coalescidas._valores.get((("tipo", tipo),), 0)
+
+# Esperar a que `cantidad` hilos estén esperando la consulta en curso
+def esperar_coalescidas(tipo, cantidad, antes=0):
+    limite = time.monotonic() + 5
+    while coalescidas(tipo) - antes < cantidad:
+        assert time.monotonic() < limite, "los hilos no se unieron a la consulta en curso"
+        time.sleep(0.001)
+
+def test_hilos_simultaneos_comparten_una_consulta():
+    coalescedor = coalescencia.Coalescedor(activa=True)
+    liberar = threading.Event()
+    consultas = []
+
+    def consulta():
+        consultas.append(1)
+        liberar.wait(5)
+        return {"codigo": "PROD-001"}
+
+    antes = coalescidas("prueba_hilos")
+    resultados = []
+    hilos = [
+        threading.Thread(target=lambda: resultados.append(coalescedor.ejecutar(("prueba_hilos", "PROD-001"), consulta)))
+        for _ in range(10)
+    ]
+    hilos[0].start()
+    while not consultas:
+        time.sleep(0.001)
+    for hilo in hilos[1:]:
+        hilo.start()
+    esperar_coalescidas("prueba_hilos", 9, antes)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert len(consultas) == 1
+    assert len(resultados) == 10 and all(resultado is resultados[0] for resultado in resultados)
+    assert coalescedor.en_curso() == 0
+
+def test_la_excepcion_llega_a_todos_y_no_queda_guardada():
+    coalescedor = coalescencia.Coalescedor(activa=True)
+    liberar = threading.Event()
+    errores = []
+
+    def consulta():
+        liberar.wait(5)
+        raise RuntimeError("MongoDB no responde")
+
+    def leer():
+        try:
+            coalescedor.ejecutar(("prueba_error", 1), consulta)
+        except RuntimeError as e:
+            errores.append(e)
+
+    antes = coalescidas("prueba_error")
+    hilos = [threading.Thread(target=leer) for _ in range(3)]
+    hilos[0].start()
+    while coalescedor.en_curso() == 0:
+        time.sleep(0.001)
+    for hilo in hilos[1:]:
+        hilo.start()
+    esperar_coalescidas("prueba_error", 2, antes)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert len(errores) == 3
+    # Terminada la consulta, la llamada siguiente consulta de nuevo
+    assert coalescedor.ejecutar(("prueba_error", 1), lambda: "ok") == "ok"
+
+def test_olvidar_separa_las_lecturas_posteriores_a_una_escritura():
+    coalescedor = coalescencia.Coalescedor(activa=True)
+    liberar = threading.Event()
+    iniciada = threading.Event()
+    resultados = []
+
+    def vieja():
+        iniciada.set()
+        liberar.wait(5)
+        return "antes de la escritura"
+
+    hilo = threading.Thread(target=lambda: resultados.append(coalescedor.ejecutar(("prueba_olvidar", 1), vieja)))
+    hilo.start()
+    iniciada.wait(5)
+    coalescencia.olvidar("prueba_olvidar", 1)
+    assert coalescedor.ejecutar(("prueba_olvidar", 1), lambda: "después de la escritura") == "después de la escritura"
+    liberar.set()
+    hilo.join(5)
+    assert resultados == ["antes de la escritura"]
+
+def test_tareas_simultaneas_comparten_una_consulta():
+    coalescedor = coalescencia.CoalescedorAsync(activa=True)
+    consultas = []
+
+    async def consulta():
+        consultas.append(1)
+        await asyncio.sleep(0.01)
+        return {"codigo": "PROD-001"}
+
+    async def principal():
+        return await asyncio.gather(*(coalescedor.ejecutar(("prueba_async", 1), consulta) for _ in range(10)))
+
+    resultados = asyncio.run(principal())
+    assert len(consultas) == 1
+    assert all(resultado is resultados[0] for resultado in resultados)
+    assert coalescedor.en_curso() == 0
+
+def test_cancelar_una_solicitud_no_cancela_la_consulta():
+    coalescedor = coalescencia.CoalescedorAsync(activa=True)
+
+    async def consulta():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def principal():
+        primera = asyncio.ensure_future(coalescedor.ejecutar(("prueba_cancelar", 1), consulta))
+        segunda = asyncio.ensure_future(coalescedor.ejecutar(("prueba_cancelar", 1), consulta))
+        await asyncio.sleep(0)
+        primera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primera
+        return await segunda
+
+    assert asyncio.run(principal()) == "ok"
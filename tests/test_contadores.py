@@ -0,0 +1,57 @@
+import threading
+
+import contadores
+
+def test_el_contador_arranca_despues_de_los_pedidos_sembrados(db):
+    db.orders.insert_many([{"numero_pedido": f"PED-{i:05d}"} for i in (1, 42, 7)] + [{"numero_pedido": "OTRO-99999"}])
+    asignador = contadores.AsignadorNumeros(db, "pedidos", bloque=5)
+    assert asignador.siguientes(2) == ["PED-00043", "PED-00044"]
+    assert db.counters.find_one({"_id": "pedidos"})["valor"] == 47
+
+class ContadoresCarrera:
+    """counters que responde "no existe" a la primera reserva, como si otra instancia lo creara justo después."""
+
+    def __init__(self, coleccion):
+        self._coleccion = coleccion
+        self._primera = True
+
+    def find_one_and_update(self, *args, **kwargs):
+        if self._primera:
+            self._primera = False
+            return None
+        return self._coleccion.find_one_and_update(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._coleccion, nombre)
+
+class BaseCarrera:
+    def __init__(self, db):
+        self.orders = db.orders
+        self.counters = ContadoresCarrera(db.counters)
+
+def test_inicializar_con_max_no_retrocede_el_contador(db):
+    db.orders.insert_one({"numero_pedido": "PED-00010"})
+    # Otra instancia ya inicializó el contador y reservó hasta el 15
+    db.counters.insert_one({"_id": "pedidos", "valor": 15})
+    assert contadores.reservar_bloque(BaseCarrera(db), "pedidos", 5) == (16, 20)
+    assert db.counters.find_one({"_id": "pedidos"})["valor"] == 20
+
+def test_bloques_de_varias_instancias_no_se_solapan(db):
+    asignadores = [contadores.AsignadorNumeros(db, "pedidos", bloque=7) for _ in range(3)]
+    numeros = []
+    lock = threading.Lock()
+
+    def asignar(asignador):
+        for _ in range(50):
+            numero = asignador.siguiente()
+            with lock:
+                numeros.append(numero)
+
+    hilos = [threading.Thread(target=asignar, args=(asignador,)) for asignador in asignadores for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(numeros) == 300
+    assert len(set(numeros)) == 300
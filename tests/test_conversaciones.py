@@ -0,0 +1,58 @@
+import datetime
+
+from bson.objectid import ObjectId
+
+import conversaciones
+
+def conversacion(minuto, dia=datetime.datetime(2026, 3, 1, 10), telefono="3000000000"):
+    return {"phone_number": telefono, "mensaje": f"mensaje {minuto}", "timestamp": dia + datetime.timedelta(minutes=minuto)}
+
+def guardar(db, lista, maximo=3):
+    operaciones, _ = conversaciones.operaciones_buckets(lista, "dia", maximo)
+    db[conversaciones.BUCKETS].bulk_write(operaciones, ordered=False)
+
+def test_bucket_lleno_abre_otro_del_mismo_periodo(db):
+    guardar(db, [conversacion(0), conversacion(1)])
+    guardar(db, [conversacion(2), conversacion(3)])
+    guardar(db, [conversacion(4)])
+
+    buckets = list(db[conversaciones.BUCKETS].find().sort("_id", 1))
+    assert [bucket["cantidad"] for bucket in buckets] == [3, 2]
+    assert {bucket["inicio"] for bucket in buckets} == {datetime.datetime(2026, 3, 1)}
+    assert buckets[0]["desde"] == datetime.datetime(2026, 3, 1, 10, 0)
+    assert buckets[0]["hasta"] == datetime.datetime(2026, 3, 1, 10, 4)
+
+def test_grupo_mayor_que_el_maximo_se_parte(db):
+    operaciones, cantidades = conversaciones.operaciones_buckets([conversacion(i) for i in range(7)], "dia", 3)
+    assert cantidades == [3, 3, 1]
+    assert all(operacion._upsert for operacion in operaciones)
+
+def test_lectura_paginada_de_varios_buckets(db):
+    guardar(db, [conversacion(i, datetime.datetime(2026, 3, 1, 10)) for i in range(4)])
+    guardar(db, [conversacion(i, datetime.datetime(2026, 3, 2, 10)) for i in range(2)])
+
+    primera = conversaciones.leer_buckets(db, "3000000000", 3)
+    assert [turno["timestamp"].day for turno in primera] == [2, 2, 1, 1]
+    ultima = primera[2]
+    resto = conversaciones.leer_buckets(db, "3000000000", 3, [ultima["timestamp"], ultima["_id"]])
+    assert [turno["mensaje"] for turno in resto] == ["mensaje 2", "mensaje 1", "mensaje 0"]
+    assert all(turno["phone_number"] == "3000000000" for turno in primera + resto)
+
+def test_archivar_mueve_lo_antiguo_a_archivos_por_fecha(db, tmp_path):
+    hace_cien_dias = (datetime.datetime.now() - datetime.timedelta(days=100)).replace(hour=12, minute=0)
+    antigua = dict(conversacion(0, hace_cien_dias, "3111111111"), _id=ObjectId.from_datetime(hace_cien_dias))
+    db.conversations.insert_many([antigua, conversacion(0, datetime.datetime.now(), "3111111111")])
+    guardar(db, [conversacion(1, hace_cien_dias), conversacion(0, datetime.datetime.now())], maximo=10)
+
+    archivadas = conversaciones.archivar(db, dias=90, directorio=str(tmp_path))
+    fecha = hace_cien_dias.date()
+    assert archivadas == {fecha.isoformat(): 2}
+    assert db.conversations.count_documents({}) == 1
+    assert db[conversaciones.BUCKETS].count_documents({}) == 1
+
+    leidas = conversaciones.leer_archivo("3000000000", fecha, fecha, str(tmp_path))
+    assert [leida["mensaje"] for leida in leidas] == ["mensaje 1"]
+    assert len(conversaciones.leer_archivo("3111111111", fecha, fecha, str(tmp_path))) == 1
+
+    # Una segunda corrida no encuentra nada más que archivar
+    assert conversaciones.archivar(db, dias=90, directorio=str(tmp_path)) == {}
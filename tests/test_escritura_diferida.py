@@ -0,0 +1,71 @@
+import mongomock.collection
+import pytest
+
+import app
+import nucleo
+
+def conversacion(mensaje, telefono="3000000000"):
+    return nucleo.construir_conversacion({"phone_number": telefono, "mensaje": mensaje})
+
+@pytest.fixture
+def escritor(db, monkeypatch):
+    escritor = app.EscritorConversaciones(db, max_cola=3, lote=10, intervalo=0.01)
+    monkeypatch.setattr(app, "escritor_conversaciones", escritor)
+    return escritor
+
+def test_cola_llena_rechaza_sin_dejar_pendientes(escritor):
+    for i in range(3):
+        escritor.encolar(conversacion(f"mensaje {i}"), espera=0)
+    with pytest.raises(nucleo.ColaLlena):
+        escritor.encolar(conversacion("de más"), espera=0)
+    assert len(escritor.pendientes("3000000000")) == 3
+    assert (escritor.encolados, escritor.rechazados) == (3, 1)
+
+def test_el_hilo_escribe_la_cola_en_un_insert_many(db, escritor, monkeypatch):
+    llamadas = []
+    insert_many = mongomock.collection.Collection.insert_many
+
+    def insert_many_registrado(coleccion, documentos, *args, **kwargs):
+        documentos = list(documentos)
+        llamadas.append(len(documentos))
+        return insert_many(coleccion, documentos, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", insert_many_registrado)
+    for i in range(3):
+        escritor.encolar(conversacion(f"mensaje {i}"), espera=0)
+    escritor.iniciar()
+    escritor.detener()
+
+    assert llamadas == [3]
+    assert db.conversations.count_documents({}) == 3
+    assert escritor.pendientes("3000000000") == []
+    assert (escritor.escritos, escritor.fallidos) == (3, 0)
+
+def test_las_conversaciones_en_cola_se_leen_antes_de_escribirse(api, db, escritor):
+    db.conversations.insert_one(conversacion("ya escrita"))
+    respuesta = api.post("/api/conversaciones/guardar", json={"phone_number": "3000000000", "mensaje": "en cola"})
+    assert respuesta.status_code == 200
+    assert db.conversations.count_documents({}) == 1
+
+    conversaciones = api.get("/api/conversaciones/3000000000").get_json()["conversaciones"]
+    assert [leida["mensaje"] for leida in conversaciones] == ["en cola", "ya escrita"]
+    # El _id que se respondió es el mismo con el que se escribe después
+    assert conversaciones[0]["_id"] == respuesta.get_json()["conversacion"]["_id"]
+
+def test_cola_llena_responde_503(api, escritor):
+    for i in range(3):
+        escritor.encolar(conversacion(f"mensaje {i}"), espera=0)
+    respuesta = api.post("/api/conversaciones/guardar", json={"phone_number": "3000000000", "mensaje": "de más"})
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "1"
+
+def test_error_de_escritura_cuenta_el_lote_como_fallido(escritor, monkeypatch):
+    def insert_many_caido(*args, **kwargs):
+        raise RuntimeError("MongoDB no responde")
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", insert_many_caido)
+    escritor.encolar(conversacion("perdida"), espera=0)
+    escritor.iniciar()
+    escritor.detener()
+    assert (escritor.escritos, escritor.fallidos) == (0, 1)
+    assert escritor.pendientes("3000000000") == []
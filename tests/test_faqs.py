@@ -0,0 +1,53 @@
+import pytest
+
+import nucleo
+
+FAQS = [
+    {"categoria": "soporte", "pregunta": "¿Cómo sé si mi UPS necesita cambio de baterías?",
+     "respuesta": "Si el tiempo de respaldo se reduce"},
+    {"categoria": "compras", "pregunta": "¿Cuáles son los métodos de pago?", "respuesta": "Tarjetas y PSE"},
+    {"categoria": "envios", "pregunta": "¿Cuánto tarda el envío?", "respuesta": "De dos a cinco días hábiles"},
+]
+
+@pytest.fixture
+def indice():
+    indice = nucleo.IndiceFaqs()
+    indice.reconstruir(FAQS)
+    return indice
+
+def test_cada_consulta_recibe_su_faq_mas_parecida(indice):
+    resultados = indice.buscar(["metodos de pago", "cambio de baterias de la ups", "envio"], k=1)
+    assert [coincidencias[0][0]["categoria"] for coincidencias in resultados] == ["compras", "soporte", "envios"]
+    assert all(0 < coincidencias[0][1] <= 1 for coincidencias in resultados)
+
+def test_sin_terminos_conocidos_no_hay_resultados(indice):
+    assert indice.buscar(["zzz"], k=3) == [[]]
+    assert nucleo.IndiceFaqs().buscar(["pago"]) == [[]]
+
+def test_k_mayor_que_las_faqs(indice):
+    resultados = indice.buscar(["de"], k=10)[0]
+    assert 0 < len(resultados) <= len(FAQS)
+    puntajes = [puntaje for _, puntaje in resultados]
+    assert puntajes == sorted(puntajes, reverse=True)
+
+@pytest.mark.parametrize("consultas, k, error", [
+    ([], 3, "Se requiere al menos un mensaje para buscar"),
+    ([""], 3, "Se requiere al menos un mensaje para buscar"),
+    (["pago"], "muchos", "El parámetro k debe ser un número"),
+    (["pago"] * (nucleo.FAQS_MAX_CONSULTAS + 1), 3, "Se permiten máximo"),
+])
+def test_validar_consultas(consultas, k, error):
+    with pytest.raises(ValueError, match=error):
+        nucleo.validar_consultas_faqs(consultas, k)
+
+def test_k_se_acota():
+    assert nucleo.validar_consultas_faqs(["pago"], 1000)[1] == nucleo.FAQS_MAX_K
+    assert nucleo.validar_consultas_faqs(["pago"], 0)[1] == 1
+
+def test_la_ruta_busca_varias_consultas(api, db):
+    db.faqs.insert_many([dict(faq) for faq in FAQS])
+    respuesta = api.post("/api/faqs/buscar?view=respuesta", json={"consultas": ["pago", "envio"], "k": 1})
+    resultados = respuesta.get_json()["resultados"]
+    assert [resultado[0]["respuesta"] for resultado in resultados] == ["Tarjetas y PSE", "De dos a cinco días hábiles"]
+    assert set(resultados[0][0]) == {"pregunta", "respuesta", "puntaje"}
+    assert api.get("/api/faqs/buscar?q=zzz").status_code == 404
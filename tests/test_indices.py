@@ -0,0 +1,50 @@
+import indices
+
+def informacion_completa():
+    informacion = {}
+    for coleccion, lista in indices.INDICES.items():
+        informacion[coleccion] = {"_id_": {"key": [("_id", 1)]}}
+        for indice in lista:
+            nombre = indices.modelo_indice(indice).document["name"]
+            informacion[coleccion][nombre] = {"key": list(indice["keys"]), "unique": indice.get("unique", False)}
+    return informacion
+
+def test_sin_diferencias_con_el_manifiesto():
+    assert indices.comparar_indices(informacion_completa()) == {"faltantes": [], "sobrantes": []}
+
+def test_la_comparacion_es_por_llaves_y_unicidad_no_por_nombre():
+    informacion = informacion_completa()
+    # Un índice con otro nombre y direcciones como float (como las devuelve el servidor) sigue valiendo
+    informacion["orders"]["otro_nombre"] = {"key": [("numero_pedido", 1.0)], "unique": True}
+    del informacion["orders"]["numero_pedido_1"]
+    assert indices.comparar_indices(informacion) == {"faltantes": [], "sobrantes": []}
+
+def test_faltantes_y_sobrantes():
+    informacion = informacion_completa()
+    # cedula sin unique no es el índice del manifiesto
+    informacion["users"]["cedula_1"]["unique"] = False
+    informacion["products"]["nombre_1"] = {"key": [("nombre", 1)]}
+    del informacion["rate_limits"]["expira_1"]
+
+    diferencias = indices.comparar_indices(informacion)
+    assert diferencias["faltantes"] == [
+        {"coleccion": "users", "nombre": "cedula_1", "keys": [("cedula", 1)], "unique": True},
+        {"coleccion": "rate_limits", "nombre": "expira_1", "keys": [("expira", 1)], "unique": False, "expireAfterSeconds": 0},
+    ]
+    assert diferencias["sobrantes"] == [
+        {"coleccion": "users", "nombre": "cedula_1", "keys": [("cedula", 1)]},
+        {"coleccion": "products", "nombre": "nombre_1", "keys": [("nombre", 1)]},
+    ]
+
+def test_asegurar_crea_solo_los_que_faltan(db):
+    creados = indices.asegurar_indices(db)
+    assert creados["users"] == ["cedula_1"]
+    assert indices.verificar_indices(db) == {"faltantes": [], "sobrantes": []}
+    assert indices.asegurar_indices(db) == {}
+
+def test_etapas_del_plan_anidado():
+    plan = {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+    assert indices.etapas_plan(plan) == ["LIMIT", "FETCH", "IXSCAN"]
+    assert indices.etapas_plan({"stage": "OR", "inputStages": [{"stage": "COLLSCAN"}, {"stage": "SORT"}]}) == [
+        "OR", "COLLSCAN", "SORT"
+    ]
@@ -0,0 +1,69 @@
+import importlib.util
+
+import mongomock
+import pytest
+
+# init-db.py tiene un guion en el nombre, así que se carga por ruta
+especificacion = importlib.util.spec_from_file_location("init_db", "init-db.py")
+init_db = importlib.util.module_from_spec(especificacion)
+especificacion.loader.exec_module(init_db)
+
+# Las fechas se generan relativas a "ahora" y no se repiten entre ejecuciones
+def sin_fechas(documentos):
+    return [
+        {llave: valor for llave, valor in documento.items() if llave != "_id" and not llave.startswith("fecha_")
+         and llave != "ultima_compra"}
+        for documento in documentos
+    ]
+
+@pytest.fixture
+def cliente(monkeypatch):
+    cliente = mongomock.MongoClient()
+    # Los trabajadores abren su propia conexión con la URI; aquí todos comparten la de mongomock
+    monkeypatch.setattr(init_db, "MongoClient", lambda uri: cliente)
+    return cliente
+
+def test_siembra_por_lotes_sin_ordenar(cliente, monkeypatch):
+    lotes = []
+    insert_many = mongomock.collection.Collection.insert_many
+
+    def espiar(coleccion, documentos, ordered=True, **kwargs):
+        lotes.append((coleccion.name, len(documentos), ordered))
+        return insert_many(coleccion, documentos, ordered=ordered, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", espiar)
+
+    db = init_db.sembrar(cliente, "mongodb://localhost", usuarios=25, productos=7, pedidos=12,
+                         conversaciones=5, lote=4)
+
+    assert (db.users.count_documents({}), db.products.count_documents({}), db.orders.count_documents({}),
+            db.conversations.count_documents({})) == (25, 7, 12, 5)
+    assert len(db.users.distinct("cedula")) == 25
+    assert sorted(db.orders.distinct("numero_pedido")) == [f"PED-{i:05d}" for i in range(1, 13)]
+    # Cada insert_many de la carga lleva como mucho un lote y no se detiene en el primer duplicado
+    assert all(cantidad <= 4 and not ordered for nombre, cantidad, ordered in lotes if nombre != "faqs")
+    assert sum(cantidad for nombre, cantidad, _ in lotes if nombre == "users") == 25
+    # Los índices se crean después de la carga
+    assert "cedula_1" in db.users.index_information()
+
+def test_la_misma_semilla_repite_los_datos(cliente):
+    db = init_db.sembrar(cliente, "mongodb://localhost", usuarios=15, productos=5, pedidos=0, lote=2, semilla=7)
+    usuarios = sin_fechas(db.users.find().sort("_id"))
+    productos = sin_fechas(db.products.find().sort("_id"))
+
+    db = init_db.sembrar(cliente, "mongodb://localhost", usuarios=15, productos=5, pedidos=0, lote=2, semilla=7)
+    assert sin_fechas(db.users.find().sort("_id")) == usuarios
+    assert sin_fechas(db.products.find().sort("_id")) == productos
+
+    db = init_db.sembrar(cliente, "mongodb://localhost", usuarios=15, productos=5, pedidos=0, lote=2, semilla=8)
+    assert sin_fechas(db.users.find().sort("_id")) != usuarios
+
+def test_agregar_continua_sin_borrar(cliente):
+    init_db.sembrar(cliente, "mongodb://localhost", usuarios=10, productos=4, pedidos=5, lote=3)
+    db = init_db.sembrar(cliente, "mongodb://localhost", usuarios=10, productos=4, pedidos=5, lote=3, agregar=True)
+
+    assert db.users.count_documents({}) == 20
+    assert len(db.users.distinct("cedula")) == 20
+    assert len(db.products.distinct("codigo")) == 8
+    assert sorted(db.orders.distinct("numero_pedido")) == [f"PED-{i:05d}" for i in range(1, 11)]
+    # Las FAQ no se duplican al agregar
+    assert db.faqs.count_documents({}) == len(db.faqs.distinct("pregunta"))
@@ -0,0 +1,167 @@
+import pytest
+from flask import Flask, jsonify, request
+
+import limites
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+class EsperaDb:
+    def __init__(self, segundos=0.0):
+        self.segundos = segundos
+
+    def valor(self):
+        return self.segundos
+
+class AlmacenCaido:
+    def consumir(self, clave, capacidad, tasa):
+        raise RuntimeError("almacén caído")
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(limites, "time", reloj)
+    return reloj
+
+def crear_limitador(almacen=None, presupuestos=None, defecto="100/60", ip="0", concurrencia=0, espera_db=None):
+    return limites.Limitador(
+        almacen or limites.AlmacenMemoria(), presupuestos=presupuestos or {}, defecto=defecto, ip=ip,
+        concurrencia=concurrencia, espera_db_ms=250, espera_db=espera_db or EsperaDb()
+    )
+
+def crear_app(limitador):
+    app = Flask(__name__)
+    limites.registrar(app, request, limitador)
+
+    @app.route("/api/usuarios/validar", methods=["POST"])
+    def validar_usuario():
+        return jsonify({"success": True})
+
+    @app.route("/api/usuarios/<cedula>", methods=["GET"])
+    def obtener_usuario(cedula):
+        return jsonify({"success": True})
+
+    return app
+
+def validar(cliente, cedula, ip="10.0.0.1"):
+    return cliente.post("/api/usuarios/validar", json={"cedula": cedula}, environ_base={"REMOTE_ADDR": ip})
+
+def test_bucket_se_repone_con_el_tiempo(reloj):
+    almacen = limites.AlmacenMemoria()
+    assert almacen.consumir("a", 2, 1.0) == (True, 0.0)
+    assert almacen.consumir("a", 2, 1.0) == (True, 0.0)
+    assert almacen.consumir("a", 2, 1.0) == (False, 1.0)
+
+    reloj.ahora += 0.5
+    assert almacen.consumir("a", 2, 1.0) == (False, 0.5)
+    reloj.ahora += 0.5
+    assert almacen.consumir("a", 2, 1.0) == (True, 0.0)
+
+    # Nunca se acumulan más tokens que la capacidad
+    reloj.ahora += 3600
+    assert [almacen.consumir("a", 2, 1.0)[0] for _ in range(3)] == [True, True, False]
+
+def test_bucket_descarta_el_menos_usado():
+    almacen = limites.AlmacenMemoria(max_claves=2)
+    for clave in ("a", "b", "c"):
+        almacen.consumir(clave, 1, 1.0)
+    assert list(almacen._buckets) == ["b", "c"]
+
+def test_429_con_retry_after(reloj):
+    cliente = crear_app(crear_limitador(presupuestos={"validar_usuario": (2, 0.25)})).test_client()
+    assert validar(cliente, "123").status_code == 200
+    assert validar(cliente, "123").status_code == 200
+
+    respuesta = validar(cliente, "123")
+    assert respuesta.status_code == 429
+    # Un token cada 4 segundos
+    assert respuesta.headers["Retry-After"] == "4"
+    assert respuesta.get_json()["reintentar_en"] == 4
+
+    reloj.ahora += 1.5
+    assert validar(cliente, "123").headers["Retry-After"] == "3"
+    reloj.ahora += 2.5
+    assert validar(cliente, "123").status_code == 200
+
+def test_presupuesto_por_ruta(reloj):
+    cliente = crear_app(crear_limitador(presupuestos={"validar_usuario": (1, 0.01)}, defecto="3/60")).test_client()
+    assert validar(cliente, "123").status_code == 200
+    assert validar(cliente, "123").status_code == 429
+
+    # La otra ruta usa el presupuesto por defecto y su propio bucket para la misma cédula
+    codigos = [cliente.get("/api/usuarios/123").status_code for _ in range(4)]
+    assert codigos == [200, 200, 200, 429]
+
+def test_presupuesto_por_cliente_no_afecta_a_otros(reloj):
+    cliente = crear_app(crear_limitador(presupuestos={"validar_usuario": (1, 0.01)})).test_client()
+    assert validar(cliente, "123").status_code == 200
+    assert validar(cliente, "123").status_code == 429
+    # El bot llama desde una sola IP: las demás cédulas siguen pasando
+    assert [validar(cliente, str(cedula)).status_code for cedula in range(20)] == [200] * 20
+
+def test_presupuesto_de_ip_separado(reloj):
+    limitador = crear_limitador(presupuestos={"validar_usuario": (5, 0.01)}, ip="3/60")
+    cliente = crear_app(limitador).test_client()
+    assert [validar(cliente, str(cedula)).status_code for cedula in range(4)] == [200, 200, 200, 429]
+    assert validar(cliente, "9", ip="10.0.0.2").status_code == 200
+    assert "limites_rechazos_total{ruta=\"validar_usuario\",motivo=\"limite_ip\"} 1" in limitador.metricas()
+
+def test_almacen_caido_admite_la_solicitud(reloj):
+    limitador = crear_limitador(almacen=AlmacenCaido(), presupuestos={"validar_usuario": (1, 0.01)})
+    cliente = crear_app(limitador).test_client()
+    assert [validar(cliente, "123").status_code for _ in range(3)] == [200, 200, 200]
+    assert limitador.errores_almacen == 3
+
+def test_tope_de_concurrencia_baja_a_la_mitad_con_espera_del_pool():
+    espera = EsperaDb()
+    limitador = crear_limitador(concurrencia=4, espera_db=espera)
+    assert limitador.tope() == 4
+
+    espera.segundos = 0.5
+    assert limitador.tope() == 2
+    assert [limitador.entrar() for _ in range(3)] == [True, True, False]
+
+    espera.segundos = 0.0
+    assert limitador.entrar()
+    limitador.salir()
+
+def test_503_cuando_el_proceso_esta_saturado(reloj):
+    limitador = crear_limitador(concurrencia=2, espera_db=EsperaDb(0.5))
+    cliente = crear_app(limitador).test_client()
+
+    limitador.en_curso = 1
+    respuesta = validar(cliente, "123")
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "1"
+
+    # El lugar de cada solicitud admitida se libera al terminar
+    limitador.en_curso = 0
+    assert validar(cliente, "123").status_code == 200
+    assert limitador.en_curso == 0
+
+def test_rechazo_de_ip_devuelve_el_token_de_la_cedula(reloj):
+    limitador = crear_limitador(presupuestos={"validar_usuario": (1, 0.01)}, ip="1/60")
+    cliente = crear_app(limitador).test_client()
+    assert validar(cliente, "1").status_code == 200
+
+    # La IP rechaza la solicitud después de cobrar el bucket de la cédula "2"
+    assert validar(cliente, "2").status_code == 429
+    # Desde otra IP la cédula "2" conserva su único token
+    assert validar(cliente, "2", ip="10.0.0.2").status_code == 200
+
+def test_devolucion_no_supera_la_capacidad(reloj):
+    almacen = limites.AlmacenMemoria()
+    almacen.consumir("a", 2, 1.0)
+    almacen.devolver("a", 2)
+    almacen.devolver("a", 2)
+    assert [almacen.consumir("a", 2, 1.0)[0] for _ in range(3)] == [True, True, False]
+
+def test_devolucion_en_mongo(db):
+    almacen = limites.AlmacenMongo(db)
+    db[limites.COLECCION_LIMITES].insert_one({"_id": "a", "tokens": 0.5})
+    almacen.devolver("a", 2)
+    assert db[limites.COLECCION_LIMITES].find_one({"_id": "a"})["tokens"] == 1.5
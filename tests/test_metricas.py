@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from flask import Flask, jsonify, request
+
+import metricas
+
+def test_histograma_acumulado_con_limites_inclusivos():
+    histograma = metricas.Histograma("prueba_segundos", "Prueba", buckets=(0.1, 1.0))
+    for valor in (0.05, 0.1, 0.5, 3.0):
+        histograma.observar(valor, (("ruta", "r"),))
+    assert histograma.exponer()[2:] == [
+        'prueba_segundos_bucket{ruta="r",le="0.1"} 2',
+        'prueba_segundos_bucket{ruta="r",le="1.0"} 3',
+        'prueba_segundos_bucket{ruta="r",le="+Inf"} 4',
+        'prueba_segundos_sum{ruta="r"} 3.65',
+        'prueba_segundos_count{ruta="r"} 4',
+    ]
+
+def test_etiquetas_escapadas():
+    assert metricas.formatear_etiquetas((("ruta", 'a"b\\c\n'),)) == '{ruta="a\\"b\\\\c\\n"}'
+
+def test_listener_suma_el_tiempo_de_mongo_a_la_solicitud():
+    listener = metricas.ListenerComandos()
+    metricas.iniciar_solicitud()
+    listener.started(SimpleNamespace(command={"find": "products_prueba"}, command_name="find", request_id=1))
+    listener.succeeded(SimpleNamespace(duration_micros=30000, command_name="find", request_id=1))
+    listener.started(SimpleNamespace(command={"insert": "orders_prueba"}, command_name="insert", request_id=2))
+    listener.failed(SimpleNamespace(duration_micros=10000, command_name="insert", request_id=2))
+
+    tiempos = metricas.terminar_solicitud("ruta_listener", "GET", 200, 10)
+    assert round(tiempos["db"], 6) == 0.04
+    assert 'mongo_command_failures_total{coleccion="orders_prueba",comando="insert"} 1' in metricas.exponer()
+    assert 'mongo_command_duration_seconds_count{coleccion="products_prueba",comando="find"} 1' in metricas.exponer()
+
+def test_rutas_con_server_timing_y_metrics():
+    app = Flask(__name__)
+    metricas.registrar(app, request)
+
+    @app.route("/prueba_metricas")
+    def prueba_metricas():
+        metricas.sumar_tiempo("db", 0.002)
+        return jsonify({"success": True})
+
+    cliente = app.test_client()
+    respuesta = cliente.get("/prueba_metricas")
+    fases = dict(parte.split(";dur=") for parte in respuesta.headers["Server-Timing"].split(", "))
+    assert set(fases) == {"db", "serializacion", "framework", "total"}
+    assert float(fases["db"]) == 2.0
+
+    texto = cliente.get("/metrics").get_data(as_text=True)
+    assert 'http_requests_total{ruta="prueba_metricas",metodo="GET",codigo="200"} 1' in texto
+    assert 'http_request_duration_seconds_count{ruta="prueba_metricas"} 1' in texto
+    assert 'http_request_phase_seconds_count{ruta="prueba_metricas",fase="db"} 1' in texto
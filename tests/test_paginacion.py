@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+
+import nucleo
+
+def pedidos(db, cantidad):
+    db.orders.insert_many([
+        {"numero_pedido": f"PED-{i:05d}", "cedula_cliente": "1", "estado": "pendiente", "total": i}
+        for i in range(1, cantidad + 1)
+    ])
+
+def recorrer(api, ruta, llave):
+    vistos, cursor = [], None
+    while True:
+        respuesta = api.get(ruta + (f"&cursor={cursor}" if cursor else ""))
+        assert respuesta.status_code == 200
+        cuerpo = respuesta.get_json()
+        vistos.extend(cuerpo[llave])
+        cursor = cuerpo["next_cursor"]
+        if cursor is None:
+            return vistos
+
+def test_cursor_recorre_todos_los_pedidos_una_vez(api, db):
+    pedidos(db, 7)
+    vistos = recorrer(api, "/api/pedidos/usuario/1?limit=3", "pedidos")
+    assert [pedido["numero_pedido"] for pedido in vistos] == [f"PED-{i:05d}" for i in range(1, 8)]
+
+def test_cursor_con_proyeccion_conserva_la_llave(api, db):
+    pedidos(db, 5)
+    vistos = recorrer(api, "/api/pedidos/usuario/1?limit=2&fields=numero_pedido", "pedidos")
+    assert len(vistos) == 5
+    assert all(set(pedido) <= {"_id", "numero_pedido"} for pedido in vistos)
+
+@pytest.mark.parametrize("cursor", ["no-es-un-cursor", "W10", "WzEsIDJd"])
+def test_cursor_invalido_responde_400(api, db, cursor):
+    pedidos(db, 2)
+    respuesta = api.get(f"/api/pedidos/usuario/1?cursor={cursor}")
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()["error"] == "Cursor no válido"
+
+def test_orden_compuesto_descendente():
+    orden = nucleo.ORDEN_CONVERSACIONES
+    fecha = datetime.datetime(2026, 1, 1)
+    documento = {"timestamp": fecha, "_id": 5}
+    valores = nucleo.decodificar_cursor(nucleo.codificar_cursor(documento, orden), orden)
+    assert nucleo.filtro_despues_de(orden, valores) == {"$or": [
+        {"timestamp": {"$lt": fecha}},
+        {"timestamp": fecha, "_id": {"$lt": 5}},
+    ]}
@@ -0,0 +1,270 @@
+import asyncio
+import datetime
+import subprocess
+import sys
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import app
+import app_async
+import limites
+import nucleo
+
+# Adaptador de mongomock para el driver asíncrono: las mismas colecciones con métodos awaitables
+class CursorAsync:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, cantidad):
+        self._cursor = self._cursor.limit(cantidad)
+        return self
+
+    def skip(self, cantidad):
+        self._cursor = self._cursor.skip(cantidad)
+        return self
+
+    def batch_size(self, cantidad):
+        return self
+
+    async def to_list(self, cantidad=None):
+        documentos = list(self._cursor)
+        return documentos if cantidad is None else documentos[:cantidad]
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        self._iterador = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterador)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class ColeccionAsync:
+    def __init__(self, coleccion):
+        self._coleccion = coleccion
+
+    def find(self, *args, **kwargs):
+        return CursorAsync(self._coleccion.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, *args, **kwargs):
+        return CursorAsync(self._coleccion.aggregate(pipeline, *args, **kwargs))
+
+    def __getattr__(self, nombre):
+        metodo = getattr(self._coleccion, nombre)
+
+        async def llamar(*args, **kwargs):
+            return metodo(*args, **kwargs)
+        return llamar
+
+class BaseDatosAsync:
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, nombre):
+        return ColeccionAsync(self._db[nombre])
+
+    def __getattr__(self, nombre):
+        return ColeccionAsync(self._db[nombre])
+
+    async def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+def sembrar():
+    db = mongomock.MongoClient()["jv_chatbot_mvp"]
+    db.users.insert_one({
+        "cedula": "1", "nombre": "Ana", "correo": "ana@correo.com", "telefono": "3000000000",
+        "estado": "activo", "segmento": "premium", "direccion": "Calle 1"
+    })
+    db.products.insert_many([
+        {
+            "codigo": f"PROD-00{i}", "nombre": f"Batería Gel {i}V", "categoria": "Baterías",
+            "descripcion": "Batería sellada para UPS", "precio": 1000.0 * i, "stock": 3 if i == 1 else 10,
+            "estado": "disponible", "especificaciones": {"voltaje": "12V"}
+        }
+        for i in range(1, 6)
+    ])
+    db.faqs.insert_many([
+        {"categoria": "soporte", "pregunta": "¿Cómo sé si mi UPS necesita cambio de baterías?",
+         "respuesta": "Reducción en el tiempo de respaldo"},
+        {"categoria": "compras", "pregunta": "¿Cuáles son los métodos de pago?", "respuesta": "Tarjetas y PSE"},
+    ])
+    db.orders.insert_many([
+        {"numero_pedido": f"PED-0000{i}", "cedula_cliente": "1", "estado": "pendiente",
+         "fecha_pedido": datetime.datetime(2026, 1, i), "items": [], "total": 0}
+        for i in range(1, 4)
+    ])
+    return db
+
+# Mismo orden de solicitudes para las dos apps; las escrituras dependen de las anteriores
+SOLICITUDES = [
+    ("POST", "/api/usuarios/validar", {"cedula": "1"}),
+    ("POST", "/api/usuarios/validar", {"cedula": "9"}),
+    ("POST", "/api/usuarios/validar", {}),
+    ("GET", "/api/usuarios/1", None),
+    ("GET", "/api/usuarios/1?view=contacto", None),
+    ("GET", "/api/usuarios/9", None),
+    ("GET", "/api/pedidos/usuario/1?limit=2", None),
+    ("GET", "/api/pedidos/PED-00001", None),
+    ("GET", "/api/pedidos/PED-99999", None),
+    ("GET", "/api/productos/categoria/Baterías?limit=2", None),
+    ("GET", "/api/productos/PROD-002", None),
+    ("GET", "/api/productos/PROD-002?fields=nombre,precio", None),
+    ("GET", "/api/productos/PROD-999", None),
+    ("GET", "/api/productos/buscar?q=bateria gel", None),
+    ("GET", "/api/productos/buscar", None),
+    ("GET", "/api/productos/disponibles?limit=3", None),
+    ("GET", "/api/productos/stock/PROD-001", None),
+    ("GET", "/api/faqs", None),
+    ("GET", "/api/faqs/buscar?q=metodos de pago", None),
+    ("POST", "/api/faqs/buscar", {"consultas": ["cambio de baterías", "pago"], "k": 1}),
+    ("POST", "/api/pedidos/crear", {
+        "cedula_cliente": "1", "items": [{"codigo_producto": "PROD-001", "cantidad": 2}]
+    }),
+    ("POST", "/api/pedidos/crear", {
+        "cedula_cliente": "1", "items": [{"codigo_producto": "PROD-001", "cantidad": 2}]
+    }),
+    ("POST", "/api/pedidos/crear", {"cedula_cliente": "1", "items": []}),
+    ("POST", "/api/pedidos/crear/lote", {"pedidos": [
+        {"cedula_cliente": "1", "items": [{"codigo_producto": "PROD-002", "cantidad": 1}]},
+        {"cedula_cliente": "1", "items": [{"codigo_producto": "PROD-001", "cantidad": 5}]},
+        {"cedula_cliente": "1", "items": [{"codigo_producto": "PROD-999", "cantidad": 1}]},
+    ]}),
+    ("GET", "/api/productos/stock/PROD-001", None),
+    ("PUT", "/api/pedidos/actualizar/PED-00001", {"estado": "confirmado"}),
+    ("PUT", "/api/pedidos/actualizar/PED-00001", {"estado": "pendiente"}),
+    ("PUT", "/api/pedidos/actualizar/PED-00001", {"estado": "en preparación"}),
+    ("PUT", "/api/pedidos/actualizar/PED-00001", {"estado": "en tránsito", "numero_guia": "GUIA-1"}),
+    ("PUT", "/api/pedidos/actualizar/PED-00001", {"estado": "enviado"}),
+    ("PUT", "/api/pedidos/actualizar/PED-99999", {"estado": "confirmado"}),
+    ("POST", "/api/pedidos/actualizar/lote", {"actualizaciones": [
+        {"numero_pedido": "PED-00002", "estado": "cancelado"},
+        {"numero_pedido": "PED-00003", "estado": "entregado"},
+        {"numero_pedido": "PED-00002", "estado": "confirmado"},
+    ]}),
+    ("GET", "/api/pedidos/usuario/1", None),
+    ("POST", "/api/conversaciones/guardar", {"phone_number": "3000000000", "mensaje": "hola", "respuesta": "buenas"}),
+    ("POST", "/api/conversaciones/guardar", {"phone_number": "3000000000", "mensaje": "precio", "respuesta": "1000"}),
+    ("POST", "/api/conversaciones/guardar", {"mensaje": "sin teléfono"}),
+    ("GET", "/api/conversaciones/3000000000?limit=1", None),
+    ("GET", "/api/conversaciones/3000000000?cursor=no-es-un-cursor", None),
+    ("GET", "/api/empresa/info", None),
+    ("GET", "/healthz", None),
+]
+
+# _id, fechas y cursores (que llevan _id y fechas) cambian entre una ejecución y otra
+def normalizar(valor):
+    if isinstance(valor, dict):
+        if len(valor) == 1 and next(iter(valor)) in ("$oid", "$date"):
+            return next(iter(valor))
+        return {
+            llave: "cursor" if llave == "next_cursor" and item else normalizar(item)
+            for llave, item in valor.items()
+        }
+    if isinstance(valor, list):
+        return [normalizar(item) for item in valor]
+    return valor
+
+def ejecutar_flask():
+    cliente = app.app.test_client()
+    respuestas = []
+    for metodo, ruta, cuerpo in SOLICITUDES:
+        respuesta = cliente.open(ruta, method=metodo, json=cuerpo)
+        respuestas.append((respuesta.status_code, normalizar(respuesta.get_json())))
+    return respuestas
+
+async def ejecutar_quart():
+    cliente = app_async.app.test_client()
+    respuestas = []
+    for metodo, ruta, cuerpo in SOLICITUDES:
+        respuesta = await cliente.open(ruta, method=metodo, json=cuerpo)
+        respuestas.append((respuesta.status_code, normalizar(await respuesta.get_json())))
+    return respuestas
+
+def documentos(db, coleccion):
+    return [
+        {llave: valor for llave, valor in documento.items() if llave != "_id" and not llave.startswith("fecha_")}
+        for documento in db[coleccion].find({}, {"timestamp": 0}).sort("_id")
+    ]
+
+# La caché del catálogo y los índices de búsqueda son del proceso y los comparten las dos apps
+def reiniciar_estado():
+    nucleo.cache_catalogo.limpiar()
+    nucleo.indice_productos.construido = 0
+    nucleo.indice_faqs.marcar_sucio()
+
+# Las marcas de reserva y las fechas cambian entre una ejecución y otra
+def normalizar_bson(valor):
+    if isinstance(valor, ObjectId):
+        return "ObjectId"
+    if isinstance(valor, datetime.datetime):
+        return "fecha"
+    if isinstance(valor, dict):
+        return {llave: normalizar_bson(item) for llave, item in valor.items()}
+    if isinstance(valor, list):
+        return [normalizar_bson(item) for item in valor]
+    return valor
+
+# Cada bulk_write como (colección, ordered, operaciones), con los argumentos de cada operación
+def describir_bulk(llamadas):
+    return [
+        (coleccion, ordered, [
+            (type(operacion).__name__, normalizar_bson(operacion._filter), normalizar_bson(operacion._doc),
+             bool(operacion._upsert), operacion._array_filters)
+            for operacion in operaciones
+        ])
+        for coleccion, operaciones, ordered in llamadas
+    ]
+
+@pytest.fixture(autouse=True)
+def sin_limites(monkeypatch):
+    monkeypatch.setattr(limites, "LIMITES_ACTIVOS", False)
+
+def test_flask_y_quart_responden_igual(monkeypatch, escrituras_bulk):
+    db_flask = sembrar()
+    monkeypatch.setattr(app, "db", db_flask)
+    monkeypatch.setattr(app.asignador_pedidos, "db", db_flask)
+    reiniciar_estado()
+    flask = ejecutar_flask()
+    bulk_flask = describir_bulk(escrituras_bulk)
+    escrituras_bulk.clear()
+
+    db_quart = sembrar()
+    monkeypatch.setattr(app_async, "db", BaseDatosAsync(db_quart))
+    monkeypatch.setattr(app_async.asignador_pedidos, "db", app_async.db)
+    reiniciar_estado()
+    quart = asyncio.run(ejecutar_quart())
+    bulk_quart = describir_bulk(escrituras_bulk)
+
+    for (metodo, ruta, _), respuesta_flask, respuesta_quart in zip(SOLICITUDES, flask, quart):
+        assert respuesta_flask == respuesta_quart, f"{metodo} {ruta}"
+        # Las marcas de reserva nunca salen en las respuestas
+        assert "reservas" not in str(respuesta_flask), f"{metodo} {ruta}"
+
+    # Las dos apps envían los mismos bulk_write con las mismas operaciones
+    assert bulk_flask == bulk_quart
+
+    # El primer pedido reserva con un solo bulk_write de UpdateOne condicionales, sin upsert
+    reserva = ("products", False, [(
+        "UpdateOne", {"codigo": "PROD-001", "stock": {"$gte": 2}},
+        {"$inc": {"stock": -2}, "$push": {"reservas": "ObjectId"}}, False, None
+    )])
+    assert bulk_flask[0] == reserva
+
+    # Las dos apps dejaron la base en el mismo estado
+    for coleccion in ("products", "orders", "conversations"):
+        assert documentos(db_flask, coleccion) == documentos(db_quart, coleccion), coleccion
+
+# El proceso ASGI no debe crear la app Flask, el MongoClient ni los hilos de app.py
+def test_app_async_no_importa_app():
+    codigo = "import sys, app_async; assert 'app' not in sys.modules"
+    subprocess.run([sys.executable, "-c", codigo], check=True)
@@ -0,0 +1,74 @@
+import mongomock.collection
+import pytest
+
+@pytest.fixture
+def productos(db):
+    db.products.insert_many([
+        {"codigo": "A", "nombre": "UPS 1kVA", "categoria": "UPS", "precio": 100.0, "stock": 10},
+        {"codigo": "B", "nombre": "Batería 12V", "categoria": "Baterías", "precio": 20.0, "stock": 1},
+    ])
+
+@pytest.fixture
+def lecturas(monkeypatch):
+    lecturas = []
+    find = mongomock.collection.Collection.find
+
+    def find_registrado(coleccion, *args, **kwargs):
+        lecturas.append((coleccion.name, args[0] if args else None))
+        return find(coleccion, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find", find_registrado)
+    return lecturas
+
+# Códigos de cada consulta a products por {"codigo": {"$in": [...]}}
+def consultas_productos(lecturas):
+    return [sorted(filtro["codigo"]["$in"]) for coleccion, filtro in lecturas if coleccion == "products"]
+
+def test_crear_pedido_resuelve_los_productos_en_una_consulta(api, db, productos, lecturas):
+    respuesta = api.post("/api/pedidos/crear", json={"cedula_cliente": "1", "items": [
+        {"codigo_producto": "A", "cantidad": 2}, {"codigo_producto": "B"}, {"codigo_producto": "X"}
+    ]})
+    pedido = respuesta.get_json()["pedido"]
+    assert respuesta.status_code == 200
+    assert pedido["numero_pedido"] == "PED-00001"
+    assert pedido["total"] == 220.0
+    assert consultas_productos(lecturas) == [["A", "B", "X"]]
+
+@pytest.mark.parametrize("items, error", [
+    ([{"codigo_producto": "A", "cantidad": 0}], "La cantidad de cada item debe ser un entero mayor que cero"),
+    ([{"codigo_producto": "A", "cantidad": True}], "La cantidad de cada item debe ser un entero mayor que cero"),
+    ("A", "Los items del pedido deben ser una lista"),
+])
+def test_items_invalidos_responden_400(api, productos, items, error):
+    respuesta = api.post("/api/pedidos/crear", json={"cedula_cliente": "1", "items": items})
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()["error"] == error
+
+def test_lote_con_una_consulta_y_un_insert_many(api, db, productos, lecturas, escrituras_bulk, monkeypatch):
+    inserciones = []
+    insert_many = mongomock.collection.Collection.insert_many
+
+    def insert_many_registrado(coleccion, documentos, *args, **kwargs):
+        documentos = list(documentos)
+        inserciones.append((coleccion.name, len(documentos), kwargs.get("ordered")))
+        return insert_many(coleccion, documentos, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", insert_many_registrado)
+    respuesta = api.post("/api/pedidos/crear/lote", json={"pedidos": [
+        {"cedula_cliente": "1", "items": [{"codigo_producto": "A", "cantidad": 1}]},
+        {"cedula_cliente": "1", "items": [{"codigo_producto": "B", "cantidad": 2}]},
+        {"cedula_cliente": "1", "items": []},
+        {"cedula_cliente": "2", "items": [{"codigo_producto": "A", "cantidad": 3}, {"codigo_producto": "B", "cantidad": 1}]},
+    ]})
+    cuerpo = respuesta.get_json()
+    assert (cuerpo["creados"], cuerpo["fallidos"]) == (2, 2)
+    assert [resultado["success"] for resultado in cuerpo["resultados"]] == [True, False, False, True]
+    assert [resultado["pedido"]["numero_pedido"] for resultado in cuerpo["resultados"] if resultado["success"]] == [
+        "PED-00001", "PED-00003"
+    ]
+
+    # Una lectura de productos para todo el lote y una más de la reserva, porque un pedido no alcanzó stock
+    assert consultas_productos(lecturas) == [["A", "B"], ["A", "B"]]
+    assert inserciones == [("orders", 2, False)]
+    assert db.orders.count_documents({}) == 2
+    assert {producto["codigo"]: producto["stock"] for producto in db.products.find()} == {"A": 6, "B": 0}
@@ -0,0 +1,45 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import proyecciones
+
+def leer(coleccion, **args):
+    return proyecciones.leer_proyeccion(coleccion, MultiDict(args))
+
+def test_sin_fields_ni_view_se_lee_el_documento_completo():
+    assert leer("orders") is None
+
+def test_campos_permitidos_y_vista():
+    assert leer("orders", fields="estado, numero_guia") == {"estado": 1, "numero_guia": 1, "_id": 0}
+    assert leer("orders", view="resumen", fields="_id")["_id"] == 1
+    # "items" ya incluye "items.cantidad": MongoDB rechaza los dos juntos
+    assert leer("orders", fields="items,items.cantidad") == {"items": 1, "_id": 0}
+
+@pytest.mark.parametrize("args, mensaje", [
+    ({"fields": "estado,password"}, "Campos no permitidos: password"),
+    ({"fields": "$where"}, "Campos no permitidos: $where"),
+    ({"fields": "items.$"}, "Campos no permitidos: items.$"),
+    ({"fields": " , "}, "Se requiere al menos un campo"),
+    ({"view": "secreta"}, "Vista no válida: secreta"),
+])
+def test_campos_fuera_de_la_lista_se_rechazan(args, mensaje):
+    with pytest.raises(proyecciones.CamposInvalidos, match=mensaje.replace("$", r"\$")):
+        leer("orders", **args)
+
+def test_la_ruta_responde_400_con_campos_no_permitidos(api, db):
+    db.users.insert_one({"cedula": "1", "nombre": "Ana", "correo": "ana@correo.com", "telefono": "3000000000",
+                         "estado": "activo", "segmento": "premium", "contrasena": "secreta"})
+    respuesta = api.get("/api/usuarios/1?fields=nombre,contrasena")
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()["error"] == "Campos no permitidos: contrasena"
+    assert api.get("/api/usuarios/1?fields=nombre").get_json()["usuario"] == {"nombre": "Ana"}
+
+def test_proyectar_en_memoria_igual_que_mongodb():
+    pedido = {"numero_pedido": "PED-1", "items": [{"cantidad": 2, "subtotal": 10}, {"cantidad": 1, "subtotal": 5}]}
+    proyeccion = leer("orders", fields="numero_pedido,items.cantidad")
+    assert proyecciones.proyectar(pedido, proyeccion) == {"numero_pedido": "PED-1", "items": [{"cantidad": 2}, {"cantidad": 1}]}
+
+def test_con_llaves_respeta_las_proyecciones_de_exclusion():
+    orden = [("_id", 1)]
+    assert proyecciones.con_llaves({"reservas": 0}, orden) == {"reservas": 0}
+    assert proyecciones.con_llaves({"nombre": 1, "_id": 0}, orden) == {"nombre": 1, "_id": 1}
@@ -0,0 +1,28 @@
+import json
+import logging
+
+import registros
+
+def formatear(mensaje, args=(), **extra):
+    record = logging.LogRecord("prueba", logging.INFO, __file__, 1, mensaje, args, None)
+    for clave, valor in extra.items():
+        setattr(record, clave, valor)
+    return json.loads(registros.FormateadorJSON().format(record))
+
+def test_enmascarar_deja_solo_los_ultimos_cuatro():
+    assert registros.enmascarar("1234567890") == "******7890"
+    assert registros.enmascarar(123) == "***"
+
+def test_enmascarar_campos_extra_anidados():
+    entrada = formatear("Usuario validado", cedula="1234567890", usuario={"telefono": "3001234567", "nombre": "Ana"})
+    assert entrada["cedula"] == "******7890"
+    assert entrada["usuario"] == {"telefono": "******4567", "nombre": "Ana"}
+
+def test_enmascarar_argumentos_y_mensaje():
+    entrada = formatear("Datos recibidos: %s", ({"cedula": "1234567890", "mensaje": "hola"},))
+    assert "1234567890" not in entrada["message"]
+    assert "******7890" in entrada["message"]
+    assert "hola" in entrada["message"]
+
+    entrada = formatear("Validando telefono=3001234567 y cedula: 99887766")
+    assert entrada["message"] == "Validando telefono=******4567 y cedula: ****7766"
@@ -0,0 +1,64 @@
+import mongomock.collection
+import pytest
+from pymongo.errors import AutoReconnect
+
+import app
+
+def pedido(*items):
+    return {"items": [{"codigo_producto": codigo, "cantidad": cantidad} for codigo, cantidad in items]}
+
+@pytest.fixture
+def productos(db, monkeypatch):
+    db.products.insert_many([
+        {"codigo": "A", "nombre": "Batería A", "stock": 5},
+        {"codigo": "B", "nombre": "Batería B", "stock": 1},
+    ])
+    monkeypatch.setattr(app, "db", db)
+    return db.products
+
+def stock(productos):
+    return {producto["codigo"]: producto["stock"] for producto in productos.find()}
+
+def sin_marcas(productos):
+    return all(not producto.get("reservas") for producto in productos.find())
+
+def test_reserva_todo_el_lote_en_un_bulk_write(productos, escrituras_bulk):
+    assert app.reservar_stock([pedido(("A", 2)), pedido(("A", 1), ("B", 1))]) == {}
+    assert stock(productos) == {"A": 2, "B": 0}
+    assert sin_marcas(productos)
+
+    coleccion, operaciones, ordered = escrituras_bulk[0]
+    assert (coleccion, ordered, len(operaciones)) == ("products", False, 3)
+    assert operaciones[0]._filter == {"codigo": "A", "stock": {"$gte": 2}}
+    assert not operaciones[0]._upsert
+
+def test_pedido_sin_stock_devuelve_lo_que_tomo(productos):
+    rechazados = app.reservar_stock([pedido(("A", 1), ("B", 2)), pedido(("A", 3))])
+    assert rechazados == {0: ["B"]}
+    # El pedido rechazado devolvió la unidad de A; B nunca se tocó
+    assert stock(productos) == {"A": 2, "B": 1}
+    assert sin_marcas(productos)
+
+def test_error_a_mitad_de_la_reserva_devuelve_el_stock(productos, monkeypatch):
+    bulk_write = mongomock.collection.Collection.bulk_write
+    llamadas = []
+
+    # La reserva se aplica pero la conexión se cae antes de cerrarla
+    def bulk_write_que_falla(coleccion, operaciones, ordered=True, **kwargs):
+        llamadas.append(ordered)
+        if len(llamadas) == 2:
+            raise AutoReconnect("conexión perdida")
+        return bulk_write(coleccion, operaciones, ordered, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write_que_falla)
+    with pytest.raises(AutoReconnect):
+        app.reservar_stock([pedido(("A", 2), ("B", 1))])
+    assert stock(productos) == {"A": 5, "B": 1}
+    assert sin_marcas(productos)
+
+def test_devolucion_repetida_no_suma_dos_veces(productos):
+    plan = app.planear_reserva([pedido(("A", 2))])
+    productos.bulk_write(app.operaciones_reserva(plan), ordered=False)
+    app.cancelar_reserva(plan)
+    app.cancelar_reserva(plan)
+    assert stock(productos) == {"A": 5, "B": 1}
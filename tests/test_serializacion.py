@@ -0,0 +1,36 @@
+import datetime
+import json
+
+import pytest
+from bson import Decimal128, ObjectId, json_util
+
+import app
+import app_async
+
+DOCUMENTO = {
+    "_id": ObjectId("65f000000000000000000001"),
+    "fecha_pedido": datetime.datetime(2026, 3, 1, 9, 30, 15, 123000),
+    "total": Decimal128("1999.90"),
+    "items": [{"codigo_producto": "A", "cantidad": 2, "subtotal": 10.5}],
+    "notas": None,
+    "texto": "Batería ñ",
+}
+
+@pytest.mark.parametrize("aplicacion", [app.app, app_async.app], ids=["flask", "quart"])
+def test_mismo_json_que_dumps_y_loads(aplicacion):
+    esperado = json.loads(json_util.dumps(DOCUMENTO))
+    assert json.loads(aplicacion.json.dumps(DOCUMENTO)) == esperado
+    assert esperado["_id"] == {"$oid": "65f000000000000000000001"}
+    assert "$date" in esperado["fecha_pedido"]
+
+def test_tipos_de_python_que_no_son_bson():
+    # json_util no conoce date; se usa el formato de Flask
+    assert json.loads(app.app.json.dumps({"dia": datetime.date(2026, 3, 1)}))["dia"] == "Sun, 01 Mar 2026 00:00:00 GMT"
+    with pytest.raises(TypeError):
+        app.app.json.dumps({"conjunto": object()})
+
+def test_la_respuesta_no_modifica_el_documento(api, db):
+    db.products.insert_one({"codigo": "A", "nombre": "UPS", "stock": 1, "fecha_creacion": datetime.datetime(2026, 1, 1)})
+    producto = api.get("/api/productos/A").get_json()["producto"]
+    assert producto["fecha_creacion"] == {"$date": "2026-01-01T00:00:00Z"}
+    assert set(producto["_id"]) == {"$oid"}
@@ -0,0 +1,33 @@
+import os
+import runpy
+
+import app
+
+class ClienteFalso:
+    def __init__(self, uri, **opciones):
+        self.uri = uri
+        self.cerrado = False
+
+    def close(self):
+        self.cerrado = True
+
+def test_cliente_por_proceso(monkeypatch):
+    monkeypatch.setattr(app, "MongoClient", ClienteFalso)
+    conexion = app.ConexionMongo("mongodb://localhost", {})
+    cliente = conexion.cliente
+    assert conexion.cliente is cliente
+
+    # En un worker recién creado por fork el PID cambia y el cliente del padre no se reutiliza
+    pid = os.getpid()
+    monkeypatch.setattr(os, "getpid", lambda: pid + 1)
+    assert conexion.cliente is not cliente
+
+    conexion.cerrar()
+    assert conexion._cliente is None
+
+def test_gunicorn_reinicia_workers_colgados(monkeypatch):
+    monkeypatch.delenv("GUNICORN_TIMEOUT", raising=False)
+    configuracion = runpy.run_path(os.path.join(os.path.dirname(app.__file__), "gunicorn.conf.py"))
+    assert configuracion["timeout"] == 120
+    assert configuracion["worker_class"] == "gthread"
+    assert configuracion["preload_app"] is False
@@ -0,0 +1,94 @@
+import datetime
+
+import mongomock.collection
+import pytest
+from bson.objectid import ObjectId
+
+import conversaciones
+import nucleo
+
+# mongomock no implementa $lookup con pipeline. Los del contexto de sesión no son correlacionados,
+# así que cada uno se resuelve ejecutando su pipeline sobre la colección "from".
+@pytest.fixture(autouse=True)
+def lookup_con_pipeline(monkeypatch):
+    aggregate = mongomock.collection.Collection.aggregate
+
+    def aggregate_con_lookup(coleccion, pipeline, *args, **kwargs):
+        lookups = [etapa["$lookup"] for etapa in pipeline if "pipeline" in etapa.get("$lookup", {})]
+        if not lookups:
+            return aggregate(coleccion, pipeline, *args, **kwargs)
+        assert pipeline[-len(lookups):] == [{"$lookup": lookup} for lookup in lookups]
+        documentos = list(aggregate(coleccion, pipeline[:-len(lookups)], *args, **kwargs))
+        for lookup in lookups:
+            resultado = list(aggregate(coleccion.database[lookup["from"]], lookup["pipeline"]))
+            for documento in documentos:
+                documento[lookup["as"]] = resultado
+        return iter(documentos)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "aggregate", aggregate_con_lookup)
+
+@pytest.fixture
+def sembrada(db):
+    db.users.insert_one({"cedula": "1", "nombre": "Ana", "telefono": "3000000000", "correo": "ana@correo.com",
+                         "segmento": "premium", "direccion": "Calle 1"})
+    db.orders.insert_many([
+        {"numero_pedido": f"PED-0000{i}", "cedula_cliente": "1", "estado": "pendiente", "total": i,
+         "fecha_pedido": datetime.datetime(2026, 1, i), "items": [{"codigo_producto": "PROD-001"}]}
+        for i in range(1, 5)
+    ])
+    db.orders.insert_one({"numero_pedido": "PED-00009", "cedula_cliente": "2", "estado": "pendiente", "total": 9,
+                          "fecha_pedido": datetime.datetime(2026, 1, 9), "items": []})
+    return db
+
+def turno(minuto, telefono="3000000000"):
+    return {"_id": ObjectId(), "phone_number": telefono, "mensaje": f"mensaje {minuto}", "respuesta": "ok",
+            "intent": "saludo", "sentimiento": "neutral",
+            "timestamp": datetime.datetime(2026, 3, 1, 10) + datetime.timedelta(minutes=minuto)}
+
+def test_contexto_en_una_sola_consulta(api, sembrada):
+    sembrada.conversations.insert_many([turno(i) for i in range(4)] + [turno(9, telefono="3111111111")])
+
+    respuesta = api.post("/api/sesion/contexto", json={
+        "cedula": "1", "phone_number": "3000000000", "pedidos": 2, "conversaciones": 3
+    })
+    datos = respuesta.get_json()
+
+    assert respuesta.status_code == 200
+    assert datos["usuario"]["nombre"] == "Ana"
+    assert set(datos["usuario"]) <= set(nucleo.VISTAS["users"]["perfil"]) | {"_id"}
+    assert [pedido["numero_pedido"] for pedido in datos["pedidos"]] == ["PED-00004", "PED-00003"]
+    assert all(set(pedido) <= set(nucleo.VISTAS["orders"]["resumen"]) | {"_id"} for pedido in datos["pedidos"])
+    assert [turno["mensaje"] for turno in datos["conversaciones"]] == ["mensaje 3", "mensaje 2", "mensaje 1"]
+    assert all("phone_number" not in turno for turno in datos["conversaciones"])
+
+def test_contexto_desde_buckets(api, sembrada, monkeypatch):
+    monkeypatch.setattr(conversaciones, "CONVERSACIONES_ALMACENAMIENTO", "buckets")
+    operaciones, _ = conversaciones.operaciones_buckets([turno(i) for i in range(5)], "dia", 2)
+    sembrada[conversaciones.BUCKETS].bulk_write(operaciones, ordered=False)
+
+    datos = api.post("/api/sesion/contexto", json={"cedula": "1", "phone_number": "3000000000",
+                                                     "conversaciones": 3}).get_json()
+    assert [turno["mensaje"] for turno in datos["conversaciones"]] == ["mensaje 4", "mensaje 3", "mensaje 2"]
+
+def test_limite_cero_no_consulta_la_seccion():
+    pipeline = nucleo.pipeline_contexto_sesion("1", "3000000000", 0, 0)
+    assert not any("$lookup" in etapa for etapa in pipeline)
+
+def test_validacion_y_usuario_inexistente(api, sembrada):
+    assert api.post("/api/sesion/contexto", json={"cedula": "1"}).status_code == 400
+    assert api.post("/api/sesion/contexto", json={
+        "cedula": "1", "phone_number": "3000000000", "pedidos": "muchos"
+    }).status_code == 400
+    assert api.post("/api/sesion/contexto", json={"cedula": "9", "phone_number": "3000000000"}).status_code == 404
+    assert nucleo.leer_limite_sesion(1000, 5) == nucleo.SESION_MAXIMO
+
+def test_suma_las_conversaciones_pendientes_de_escribir():
+    class EscritorFalso:
+        def pendientes(self, phone_number):
+            return [turno(10)]
+
+    documento = {"nombre": "Ana", "pedidos": [], "conversaciones": [turno(i) for i in range(3)]}
+    contexto = nucleo.armar_contexto_sesion(EscritorFalso(), documento, "3000000000", 2)
+    assert [turno["mensaje"] for turno in contexto["conversaciones"]] == ["mensaje 10", "mensaje 2"]
+    assert contexto["usuario"] == {"nombre": "Ana"}
+    assert "phone_number" not in contexto["conversaciones"][0]
@@ -0,0 +1,73 @@
+import datetime
+
+import mongomock.collection
+import pytest
+
+import app
+import limites
+
+@pytest.fixture(autouse=True)
+def sin_limites(monkeypatch):
+    monkeypatch.setattr(limites, "LIMITES_ACTIVOS", False)
+
+@pytest.fixture
+def pedidos(db, monkeypatch):
+    db.orders.insert_many([
+        {"numero_pedido": f"PED-0000{i}", "cedula_cliente": "1", "estado": "pendiente",
+         "fecha_pedido": datetime.datetime(2026, 1, i), "items": [], "total": 0}
+        for i in range(1, 4)
+    ])
+    monkeypatch.setattr(app, "db", db)
+    return db.orders
+
+def estados(pedidos):
+    return {pedido["numero_pedido"]: pedido["estado"] for pedido in pedidos.find()}
+
+def test_transicion_no_permitida_responde_409(pedidos):
+    cliente = app.app.test_client()
+    respuesta = cliente.put("/api/pedidos/actualizar/PED-00001", json={"estado": "entregado"})
+    assert respuesta.status_code == 409
+    assert "'pendiente' a 'entregado'" in respuesta.get_json()["mensaje"]
+    assert estados(pedidos)["PED-00001"] == "pendiente"
+
+def test_lote_en_un_bulk_write_sin_upsert(pedidos, escrituras_bulk):
+    cliente = app.app.test_client()
+    respuesta = cliente.post("/api/pedidos/actualizar/lote", json={"actualizaciones": [
+        {"numero_pedido": "PED-00001", "estado": "confirmado"},
+        {"numero_pedido": "PED-00002", "estado": "entregado"},
+        {"numero_pedido": "PED-00003", "estado": "cancelado"},
+        {"numero_pedido": "PED-00001", "estado": "en preparación"},
+    ]})
+    cuerpo = respuesta.get_json()
+    assert (cuerpo["actualizados"], cuerpo["fallidos"]) == (3, 1)
+    assert estados(pedidos) == {"PED-00001": "en preparación", "PED-00002": "pendiente", "PED-00003": "cancelado"}
+
+    llamadas = [llamada for llamada in escrituras_bulk if llamada[0] == "orders"]
+    assert len(llamadas) == 1
+    _, operaciones, ordered = llamadas[0]
+    assert not ordered
+    assert [operacion._filter for operacion in operaciones] == [
+        {"numero_pedido": "PED-00001", "estado": "pendiente"},
+        {"numero_pedido": "PED-00003", "estado": "pendiente"},
+    ]
+    assert not any(operacion._upsert for operacion in operaciones)
+
+def test_pedido_que_cambio_entre_lectura_y_escritura_falla(pedidos, monkeypatch):
+    bulk_write = mongomock.collection.Collection.bulk_write
+
+    # Otro proceso cancela PED-00002 justo antes de que llegue el bulk_write
+    def bulk_write_concurrente(coleccion, operaciones, ordered=True, **kwargs):
+        if coleccion.name == "orders":
+            coleccion.update_one({"numero_pedido": "PED-00002"}, {"$set": {"estado": "cancelado"}})
+        return bulk_write(coleccion, operaciones, ordered, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write_concurrente)
+    cliente = app.app.test_client()
+    respuesta = cliente.post("/api/pedidos/actualizar/lote", json={"actualizaciones": [
+        {"numero_pedido": "PED-00001", "estado": "confirmado"},
+        {"numero_pedido": "PED-00002", "estado": "confirmado"},
+    ]})
+    resultados = respuesta.get_json()["resultados"]
+    assert [resultado["success"] for resultado in resultados] == [True, False]
+    assert resultados[1]["error"] == "El pedido cambió de estado durante la actualización"
+    assert estados(pedidos) == {"PED-00001": "confirmado", "PED-00002": "cancelado", "PED-00003": "pendiente"}